@@ -8,6 +8,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Tables of files linked to products by their file name
+LINKED_ASSET_TABLES = ("images", "documents")
+
 
 def create_company_schema_with_tables(company_schema_name: str):
     """
@@ -97,6 +100,7 @@ def create_company_schema_with_tables(company_schema_name: str):
                     status text NOT NULL,
                     extra json NULL,
                     match_field text NOT NULL,
+                    product_key text NULL,
                     created_at timestamp with time zone NOT NULL DEFAULT now(),
                     CONSTRAINT images_pkey PRIMARY KEY (id)
                 )
@@ -114,11 +118,14 @@ def create_company_schema_with_tables(company_schema_name: str):
                     status text NOT NULL,
                     extra json NULL,
                     match_field text NOT NULL,
+                    product_key text NULL,
                     created_at timestamp with time zone NOT NULL DEFAULT now(),
                     CONSTRAINT documents_pkey PRIMARY KEY (id)
                 )
             """))
             logger.info(f"✅ Created documents table in {company_schema_name}")
+
+            add_product_key_columns(connection, company_schema_name)
             
             # Create knowledges table
             connection.execute(text(f"""
@@ -162,6 +169,50 @@ def create_company_schema_with_tables(company_schema_name: str):
         return {"status": "error", "message": str(e)}
 
 
+def add_product_key_columns(connection, company_schema_name: str):
+    """
+    Add the indexed product_key column to the images and documents tables.
+
+    product_key is the normalized file stem ("ABC-123.jpg" -> "abc-123") and is
+    what linked assets are looked up by. Idempotent: schemas created before the
+    column existed get it here, with their rows backfilled.
+    """
+    for table in LINKED_ASSET_TABLES:
+        connection.execute(text(f"ALTER TABLE {company_schema_name}.{table} ADD COLUMN IF NOT EXISTS product_key text NULL"))
+        connection.execute(text(f"""
+            UPDATE {company_schema_name}.{table}
+            SET product_key = lower(btrim(regexp_replace(file_name, '\\.[^.]*$', '')))
+            WHERE product_key IS NULL
+        """))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {table}_product_key_idx ON {company_schema_name}.{table} (product_key)"
+        ))
+
+
+def upgrade_company_schemas():
+    """
+    Bring the tables of every existing company schema up to date.
+
+    Company schemas are created outside of Alembic, so columns added after a
+    schema was created are added here at startup.
+    """
+    try:
+        with engine.connect() as connection:
+            schema_names = [row[0] for row in connection.execute(text(
+                "SELECT schema_name FROM public.companies WHERE schema_name <> ''"
+            ))]
+    except Exception as e:
+        logger.error(f"❌ Error listing company schemas: {e}")
+        return
+    for company_schema_name in schema_names:
+        try:
+            with engine.begin() as connection:
+                add_product_key_columns(connection, company_schema_name)
+        except Exception as e:
+            logger.error(f"❌ Error upgrading company schema {company_schema_name}: {e}")
+    logger.info(f"✅ Upgraded {len(schema_names)} company schemas")
+
+
 def check_company_schema_exists(company_schema_name: str) -> bool:
     """
     Check if a company schema exists in the database.
@@ -4,6 +4,7 @@ SQLAlchemy-based database functions for company-specific schema tables
 from db.db_connection import db
 from db.alembic_helpers import create_company_schema_with_tables
 from db.models import Conversation
+from db.linked_assets import normalize_product_key, product_key_from_file_name
 from sqlalchemy import text
 import json
 from uuid import UUID
@@ -272,13 +273,13 @@ def update_message_energy(company_id: str, conversation_id: str, energy: float,
 
 # ==================== IMAGES ====================
 
-def add_new_image(company_id: str, file_name: str, file_type: str, file_hash: str, full_path: str, status: str, match_field: str):
+def add_new_image(company_id: str, file_name: str, file_type: str, file_hash: str, full_path: str, status: str, match_field: str, product_key: str = None):
     """Add a new image"""
     session = db.get_session()
     try:
         query = text(f"""
-            INSERT INTO {company_id}.images (file_name, file_type, file_hash, full_path, status, match_field)
-            VALUES (:file_name, :file_type, :file_hash, :full_path, :status, :match_field)
+            INSERT INTO {company_id}.images (file_name, file_type, file_hash, full_path, status, match_field, product_key)
+            VALUES (:file_name, :file_type, :file_hash, :full_path, :status, :match_field, :product_key)
             RETURNING *
         """)
         result = session.execute(query, {
@@ -287,7 +288,8 @@ def add_new_image(company_id: str, file_name: str, file_type: str, file_hash: st
             "file_hash": file_hash,
             "full_path": full_path,
             "status": status,
-            "match_field": match_field
+            "match_field": match_field,
+            "product_key": product_key if product_key is not None else product_key_from_file_name(file_name)
         }).fetchone()
         session.commit()
         if result:
@@ -301,6 +303,40 @@ def add_new_image(company_id: str, file_name: str, file_type: str, file_hash: st
         session.close()
 
 
+def add_new_images(company_id: str, images: list[dict]):
+    """Add many images in one statement (dicts with the add_new_image fields)"""
+    if not images:
+        return []
+    session = db.get_session()
+    try:
+        query = text(f"""
+            INSERT INTO {company_id}.images (file_name, file_type, file_hash, full_path, status, match_field, product_key)
+            SELECT * FROM unnest(
+                CAST(:file_names AS text[]), CAST(:file_types AS text[]), CAST(:file_hashes AS text[]),
+                CAST(:full_paths AS text[]), CAST(:statuses AS text[]), CAST(:match_fields AS text[]),
+                CAST(:product_keys AS text[])
+            )
+            RETURNING *
+        """)
+        results = session.execute(query, {
+            "file_names": [image["file_name"] for image in images],
+            "file_types": [image["file_type"] for image in images],
+            "file_hashes": [image["file_hash"] for image in images],
+            "full_paths": [image["full_path"] for image in images],
+            "statuses": [image["status"] for image in images],
+            "match_fields": [image["match_field"] for image in images],
+            "product_keys": [image.get("product_key") or product_key_from_file_name(image["file_name"]) for image in images]
+        }).fetchall()
+        session.commit()
+        return [dict(row._mapping) for row in results]
+    except Exception as e:
+        session.rollback()
+        print(f"Error adding images: {e}")
+        return []
+    finally:
+        session.close()
+
+
 def get_images_from_table(company_id: str, page_size: int = 50, page_start: int = 0):
     """Get paginated images"""
     session = db.get_session()
@@ -362,6 +398,22 @@ def get_same_image_from_table(company_id: str, file_hash: str):
         session.close()
 
 
+def get_images_by_file_hashes(company_id: str, file_hashes: list[str]):
+    """Get the images with any of the given file hashes"""
+    if not file_hashes:
+        return []
+    session = db.get_session()
+    try:
+        query = text(f"SELECT * FROM {company_id}.images WHERE file_hash = ANY(:file_hashes)")
+        results = session.execute(query, {"file_hashes": list(file_hashes)}).fetchall()
+        return [dict(row._mapping) for row in results]
+    except Exception as e:
+        print(f"Error getting images by hash: {e}")
+        return []
+    finally:
+        session.close()
+
+
 def get_same_image_from_table_with_id(company_id: str, file_id: str):
     """Get image by ID"""
     session = db.get_session()
@@ -442,10 +494,10 @@ def get_linked_images_from_table(company_id: str, product_id: str):
     try:
         query = text(f"""
             SELECT * FROM {company_id}.images
-            WHERE file_name LIKE :product_id
+            WHERE product_key = :product_key
             LIMIT 1
         """)
-        results = session.execute(query, {"product_id": f"%{product_id}.%"}).fetchall()
+        results = session.execute(query, {"product_key": normalize_product_key(product_id)}).fetchall()
         if results:
             return [dict(row._mapping) for row in results]
         return []
@@ -454,17 +506,37 @@ def get_linked_images_from_table(company_id: str, product_id: str):
         return []
     finally:
         session.close()
+
+
+def get_linked_images_by_product_keys(company_id: str, product_keys: list[str]):
+    """Get the first linked image of each product key, as {product_key: row} (None on error)"""
+    if not product_keys:
+        return {}
+    session = db.get_session()
+    try:
+        query = text(f"""
+            SELECT DISTINCT ON (product_key) * FROM {company_id}.images
+            WHERE product_key = ANY(:product_keys)
+            ORDER BY product_key, created_at
+        """)
+        results = session.execute(query, {"product_keys": list(product_keys)}).fetchall()
+        return {row._mapping["product_key"]: dict(row._mapping) for row in results}
+    except Exception as e:
+        print(f"Error getting linked images: {e}")
+        return None
+    finally:
+        session.close()
 # ==================== DOCUMENTS ====================
 
-def add_new_document(company_id: str, file_name: str, file_type: str, file_hash: str, full_path: str, status: str, match_field: str):
+def add_new_document(company_id: str, file_name: str, file_type: str, file_hash: str, full_path: str, status: str, match_field: str, product_key: str = None):
     """Add a new document"""
     if not re.match(r'^[a-zA-Z0-9_]+$', str(company_id)):
         raise ValueError("Invalid input")
     session = db.get_session()
     try:
         query = text(f"""
-            INSERT INTO {company_id}.documents (file_name, file_type, file_hash, full_path, status, match_field)
-            VALUES (:file_name, :file_type, :file_hash, :full_path, :status, :match_field)
+            INSERT INTO {company_id}.documents (file_name, file_type, file_hash, full_path, status, match_field, product_key)
+            VALUES (:file_name, :file_type, :file_hash, :full_path, :status, :match_field, :product_key)
             RETURNING *
         """)
         result = session.execute(query, {
@@ -473,7 +545,8 @@ def add_new_document(company_id: str, file_name: str, file_type: str, file_hash:
             "file_hash": file_hash,
             "full_path": full_path,
             "status": status,
-            "match_field": match_field
+            "match_field": match_field,
+            "product_key": product_key if product_key is not None else product_key_from_file_name(file_name)
         }).fetchone()
         session.commit()
         if result:
@@ -647,10 +720,10 @@ def get_linked_extra_from_table(company_id: str, product_id: str):
     try:
         query = text(f"""
             SELECT * FROM {company_id}.documents
-            WHERE file_name LIKE :product_id
+            WHERE product_key = :product_key
             LIMIT 1
         """)
-        results = session.execute(query, {"product_id": f"%{product_id}.%"}).fetchall()
+        results = session.execute(query, {"product_key": normalize_product_key(product_id)}).fetchall()
         if results:
             return [dict(row._mapping) for row in results]
         return []
@@ -659,6 +732,28 @@ def get_linked_extra_from_table(company_id: str, product_id: str):
         return []
     finally:
         session.close()
+
+
+def get_linked_extra_by_product_keys(company_id: str, product_keys: list[str]):
+    """Get the first linked document of each product key, as {product_key: row} (None on error)"""
+    if not re.match(r'^[a-zA-Z0-9_]+$', str(company_id)):
+        raise ValueError("Invalid input")
+    if not product_keys:
+        return {}
+    session = db.get_session()
+    try:
+        query = text(f"""
+            SELECT DISTINCT ON (product_key) * FROM {company_id}.documents
+            WHERE product_key = ANY(:product_keys)
+            ORDER BY product_key, created_at
+        """)
+        results = session.execute(query, {"product_keys": list(product_keys)}).fetchall()
+        return {row._mapping["product_key"]: dict(row._mapping) for row in results}
+    except Exception as e:
+        print(f"Error getting linked documents: {e}")
+        return None
+    finally:
+        session.close()
 # ==================== KNOWLEDGES ====================
 
 def add_new_knowledge(company_id: str, file_name: str, file_type: str, file_hash: str, full_path: str, status: str, primary_column: str, extra: str):
@@ -741,6 +836,70 @@ def get_knowledge_by_file_hash(company_id: str, file_hash: str):
         session.close()
 
 
+def get_knowledge_by_file_name(company_id: str, file_name: str):
+    """Get the knowledge uploaded under a file name"""
+    session = db.get_session()
+    try:
+        query = text(f"SELECT * FROM {company_id}.knowledges WHERE file_name = :file_name ORDER BY created_at DESC")
+        result = session.execute(query, {"file_name": file_name}).fetchone()
+        if result:
+            return [dict(result._mapping)]
+        return []
+    except Exception as e:
+        print(f"Error getting knowledge: {e}")
+        return []
+    finally:
+        session.close()
+
+
+def update_knowledge_upload_by_id(company_id: str, knowledge_id: str, file_type: str, full_path: str, status: str, primary_column: str, extra: str):
+    """Point a knowledge at a re-uploaded file (the file hash is updated once it is vectorized)"""
+    session = db.get_session()
+    try:
+        query = text(f"""
+            UPDATE {company_id}.knowledges
+            SET file_type = :file_type, full_path = :full_path, status = :status, primary_column = :primary_column, extra = :extra
+            WHERE id = :knowledge_id
+            RETURNING *
+        """)
+        result = session.execute(query, {
+            "file_type": file_type,
+            "full_path": full_path,
+            "status": status,
+            "primary_column": primary_column,
+            "extra": extra,
+            "knowledge_id": knowledge_id
+        }).fetchone()
+        session.commit()
+        if result:
+            return [dict(result._mapping)]
+        return []
+    except Exception as e:
+        session.rollback()
+        print(f"Error updating knowledge: {e}")
+        return []
+    finally:
+        session.close()
+
+
+def update_knowledge_file_hash_by_id(company_id: str, knowledge_id: str, file_hash: str, status: str):
+    """Update knowledge file hash and status after vectorization"""
+    session = db.get_session()
+    try:
+        query = text(f"UPDATE {company_id}.knowledges SET file_hash = :file_hash, status = :status WHERE id = :knowledge_id RETURNING *")
+        result = session.execute(query, {"file_hash": file_hash, "status": status, "knowledge_id": knowledge_id}).fetchone()
+        session.commit()
+        if result:
+            return [dict(result._mapping)]
+        return []
+    except Exception as e:
+        session.rollback()
+        print(f"Error updating knowledge: {e}")
+        return []
+    finally:
+        session.close()
+
+
 def update_knowledge_status_by_id(company_id: str, knowledge_id: str, status: str):
     """Update knowledge status"""
     session = db.get_session()
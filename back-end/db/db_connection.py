@@ -2,10 +2,14 @@
 SQLAlchemy database connection and session management for Bot Admin Panel
 """
 import os
+import time
 import logging
-from sqlalchemy import create_engine, text
+import threading
+import greenlet
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import NullPool, QueuePool, AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,19 +23,199 @@ DB_NAME = os.getenv("POSTGRES_DB", "")
 DB_USER = os.getenv("POSTGRES_USER", "")
 DB_PASSWORD = os.getenv("POSTGRES_PASSWORD", "")
 
+# Connection pool parameters
+# DB_POOL_MODE=queue keeps warm connections per worker, DB_POOL_MODE=null opens a
+# new connection per session (useful behind an external pooler such as PgBouncer)
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "queue").lower()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
 # Build database URL
 DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
+class PoolMetrics:
+    """Thread-safe counters describing how the connection pool is being used"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.overflow_hits = 0
+        self.timeouts = 0
+
+    def incr(self, name: str, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "waits": self.waits,
+                "wait_time_seconds": round(self.wait_time, 6),
+                "overflow_hits": self.overflow_hits,
+                "timeouts": self.timeouts,
+            }
+
+
+pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+
+class _MeteredPoolMixin:
+    """Records how often callers of a QueuePool had to wait for a free connection"""
+
+    metrics: PoolMetrics = pool_metrics
+
+    def _do_get(self):
+        # QueuePool._do_get may recurse on contention, only meter the outermost call.
+        # Async checkouts of one thread interleave in separate greenlets, so the
+        # guard is per greenlet (for sync callers, per thread).
+        current = greenlet.getcurrent()
+        active = self.__dict__.setdefault("_metered_active", set())
+        if current in active:
+            return super()._do_get()
+
+        active.add(current)
+        exhausted = self.checkedin() == 0 and self._max_overflow > -1 and self.overflow() >= self._max_overflow
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            if exhausted:
+                self.metrics.incr("timeouts")
+            raise
+        finally:
+            active.discard(current)
+            if exhausted:
+                self.metrics.incr("waits")
+                self.metrics.incr("wait_time", time.perf_counter() - start)
+
+
+class MeteredQueuePool(_MeteredPoolMixin, QueuePool):
+    """QueuePool that records how often callers had to wait for a free connection"""
+
+    metrics = pool_metrics
+
+
+class MeteredAsyncQueuePool(_MeteredPoolMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how often callers had to wait for a free connection"""
+
+    metrics = async_pool_metrics
 
-# Create SQLAlchemy engine
-engine = create_engine(
-    DATABASE_URL,
-    echo=False,  # Set to True for SQL query logging
-    pool_pre_ping=True,  # Verify connections before using them
-    poolclass=NullPool  # Disable connection pooling for better control
-)
 
-# Create session factory
+def build_engine(database_url: str = DATABASE_URL):
+    """Create the SQLAlchemy engine using the pool settings from the environment"""
+    if DB_POOL_MODE == "null":
+        return create_engine(
+            database_url,
+            echo=False,  # Set to True for SQL query logging
+            pool_pre_ping=DB_POOL_PRE_PING,
+            poolclass=NullPool
+        )
+
+    return create_engine(
+        database_url,
+        echo=False,  # Set to True for SQL query logging
+        poolclass=MeteredQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,  # Verify connections before using them
+        pool_use_lifo=True  # Reuse hot connections so idle ones can be recycled
+    )
+
+
+def build_async_engine(database_url: str = ASYNC_DATABASE_URL):
+    """Create the asyncpg engine used by the db.async_* helpers"""
+    if DB_POOL_MODE == "null":
+        return create_async_engine(
+            database_url,
+            echo=False,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            poolclass=NullPool
+        )
+
+    return create_async_engine(
+        database_url,
+        echo=False,
+        poolclass=MeteredAsyncQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_use_lifo=True
+    )
+
+
+def _attach_pool_listeners(sync_engine, metrics: PoolMetrics):
+    """Count checkouts, new connections and overflow hits for an engine's pool"""
+
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.incr("checkouts")
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.incr("connects")
+        pool = sync_engine.pool
+        if isinstance(pool, QueuePool) and pool.overflow() > 0:
+            metrics.incr("overflow_hits")
+
+
+# Create SQLAlchemy engines
+# The async engine's connections belong to the event loop that opened them, so the
+# async helpers are meant to be awaited from the server loop (FastAPI handlers)
+engine = build_engine()
+async_engine = build_async_engine()
+_attach_pool_listeners(engine, pool_metrics)
+_attach_pool_listeners(async_engine.sync_engine, async_pool_metrics)
+
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+
+
+def get_pool_status() -> dict:
+    """
+    Get the current state of the connection pool together with usage counters.
+
+    Returns:
+        dict: Pool configuration, live connection counts and metrics
+    """
+    status = {
+        "mode": DB_POOL_MODE,
+        **_describe_pool(engine.pool),
+        **pool_metrics.snapshot(),
+        "async": {
+            **_describe_pool(async_engine.pool),
+            **async_pool_metrics.snapshot()
+        }
+    }
+    return status
+
+
+def _describe_pool(pool) -> dict:
+    """Live connection counts for a QueuePool (empty for NullPool)"""
+    if not isinstance(pool, QueuePool):
+        return {}
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
 
 
 class DatabaseClient:
@@ -39,12 +223,22 @@ class DatabaseClient:
 
     def __init__(self):
         self.engine = engine
+        self.async_engine = async_engine
         self.SessionLocal = SessionLocal
+        self.AsyncSessionLocal = AsyncSessionLocal
 
     def get_session(self) -> Session:
         """Get a new database session"""
         return self.SessionLocal()
 
+    def get_async_session(self) -> AsyncSession:
+        """Get a new async database session"""
+        return self.AsyncSessionLocal()
+
+    def pool_status(self) -> dict:
+        """Get connection pool state and metrics"""
+        return get_pool_status()
+
     def execute_raw(self, query: str, params: dict = None):
         """
         DEPRECATED: Execute raw SQL query (for DDL statements like CREATE TABLE).
@@ -81,6 +275,10 @@ class DatabaseClient:
         """Close the database connection"""
         self.engine.dispose()
 
+    async def close_async(self):
+        """Close the async database connections"""
+        await self.async_engine.dispose()
+
 
 # Initialize database client
-db = DatabaseClient()
\ No newline at end of file
+db = DatabaseClient()
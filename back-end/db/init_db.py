@@ -4,6 +4,7 @@ Uses Alembic for database migrations.
 """
 from sqlalchemy import inspect
 from db.db_connection import db, engine
+from db.alembic_helpers import upgrade_company_schemas
 from alembic.config import Config
 from alembic import command
 import logging
@@ -163,6 +164,7 @@ def initialize_database():
     Main function to initialize the database using Alembic migrations.
     Checks migration status and runs migrations if necessary.
     Falls back to creating tables directly if Alembic migrations fail.
+    Existing company schemas are then brought up to date.
     """
     try:
         logger.info("🚀 Starting database initialization...")
@@ -170,12 +172,14 @@ def initialize_database():
         # Check if migrations are up to date
         if check_migration_status():
             logger.info("✅ Database already initialized and up to date")
+            upgrade_company_schemas()
             return True
 
         # Try running Alembic migrations first
         try:
             logger.info("📦 Running database migrations...")
             run_migrations()
+            upgrade_company_schemas()
             logger.info("✅ Database initialization completed successfully!")
             return True
         except Exception as migration_error:
@@ -184,6 +188,7 @@ def initialize_database():
 
             # Fallback: Create tables directly if Alembic fails
             create_required_tables()
+            upgrade_company_schemas()
 
             logger.info("✅ Database initialization completed using direct table creation!")
             return True
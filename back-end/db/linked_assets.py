@@ -0,0 +1,79 @@
+"""
+Batched lookup of the images and documents linked to products.
+
+A file is linked to a product when its name is the product id plus an
+extension ("abc-123.jpg" belongs to product "ABC-123"). The normalized file
+stem is stored in the indexed product_key column of the images and documents
+tables when the file is uploaded, so the assets of all retrieved products are
+found with one index lookup per table instead of a LIKE scan per product.
+
+Lookups are cached per (schema, table, product key), misses included, with a
+TTL (LINKED_ASSETS_CACHE_TTL). The upload and delete routes drop a tenant's
+entries; other workers see a change once their entries expire.
+"""
+import os
+from typing import Dict, Iterable, Optional, Tuple
+from dotenv import load_dotenv
+from db.tenant_cache import TenantCache
+
+load_dotenv()
+
+LINKED_ASSETS_CACHE_TTL = float(os.getenv("LINKED_ASSETS_CACHE_TTL", "300"))
+LINKED_ASSETS_CACHE_MAX_ENTRIES = int(os.getenv("LINKED_ASSETS_CACHE_MAX_ENTRIES", "20000"))
+
+linked_assets_cache = TenantCache(ttl=LINKED_ASSETS_CACHE_TTL, max_entries=LINKED_ASSETS_CACHE_MAX_ENTRIES)
+
+
+def normalize_product_key(product_id) -> str:
+    """Normalized form of a product id, as stored in product_key"""
+    return str(product_id).strip().lower()
+
+
+def product_key_from_file_name(file_name: str) -> str:
+    """product_key of an uploaded file: its normalized name without the extension"""
+    return normalize_product_key(os.path.splitext(file_name.split("/")[-1])[0])
+
+
+def invalidate_linked_assets(company_schema: str) -> int:
+    """Drop the cached lookups of a tenant after its images or documents changed"""
+    return linked_assets_cache.invalidate_where(lambda key, _: key[0] == company_schema)
+
+
+def get_linked_assets(company_schema: str, product_ids: Iterable, kinds: Tuple[str, ...] = ("images", "extra")) -> Dict[str, Dict[str, Optional[str]]]:
+    """
+    full_path of the first image and document linked to each product (sync DB helpers).
+
+    Args:
+        kinds: Which of "images" and "extra" (documents) to look up
+
+    Returns:
+        {"images": {product_key: full_path or None}, "extra": {product_key: full_path or None}}
+    """
+    from db.company_table import get_linked_images_by_product_keys, get_linked_extra_by_product_keys
+
+    keys = list(dict.fromkeys(normalize_product_key(product_id) for product_id in product_ids if product_id is not None))
+    keys = [key for key in keys if key]
+    linked = {}
+    for kind, table, lookup in (
+        ("images", "images", get_linked_images_by_product_keys),
+        ("extra", "documents", get_linked_extra_by_product_keys),
+    ):
+        if kind not in kinds:
+            continue
+        found, missing = {}, []
+        for key in keys:
+            cached = linked_assets_cache.get((company_schema, table, key))
+            if cached is None:
+                missing.append(key)
+            else:
+                found[key] = cached["full_path"]
+        if missing:
+            rows = lookup(company_id=company_schema, product_keys=missing)
+            for key in missing:
+                full_path = rows[key]["full_path"] if rows and key in rows else None
+                found[key] = full_path
+                # Misses are cached too (most products have no linked file), unless the query failed
+                if rows is not None:
+                    linked_assets_cache.set((company_schema, table, key), {"full_path": full_path})
+        linked[kind] = found
+    return linked
@@ -4,6 +4,7 @@ SQLAlchemy-based database functions for public schema tables
 from db.db_connection import db
 from db.company_table import create_company_tables
 from db.models import Company, User, Role, Invitation, BotPersonality, Integration
+from db.tenant_cache import invalidate_company, invalidate_integration
 from sqlalchemy import and_
 import time
 from uuid import UUID
@@ -88,6 +89,7 @@ def update_company_by_id(id: str, data: dict):
 
         session.commit()
         session.refresh(company)
+        invalidate_company(company.id)
 
         return {
             'id': str(company.id),
@@ -659,6 +661,7 @@ def add_new_integration(company_id: str, created_by: str, instance_name: str, ph
         )
         session.add(new_integration)
         session.commit()
+        invalidate_company(company_id)
         session.refresh(new_integration)
 
         return {
@@ -696,6 +699,7 @@ def update_integration_by_id(id: str, data: dict):
 
         session.commit()
         session.refresh(integration)
+        invalidate_integration({'id': integration.id, 'company_id': integration.company_id})
 
         return {
             'id': str(integration.id),
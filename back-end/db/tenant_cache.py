@@ -0,0 +1,281 @@
+"""
+In-process cache for tenant resolution.
+
+Almost every request resolves the caller's company (and its schema_name) and
+the WhatsApp webhooks resolve an integration by phone_number_id or
+instance_name. Those rows change rarely, so they are cached here with a TTL
+and dropped explicitly whenever update_company_by_id / update_integration_by_id
+(or add_new_integration) write to them.
+
+The cache is per process: with several uvicorn workers another worker only
+sees a change once its own entry expires, so keep TENANT_CACHE_TTL short.
+Only hits are cached, so a newly created company or integration is visible
+immediately.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TENANT_CACHE_TTL = float(os.getenv("TENANT_CACHE_TTL", "60"))
+TENANT_CACHE_MAX_ENTRIES = int(os.getenv("TENANT_CACHE_MAX_ENTRIES", "2048"))
+
+
+class TenantCache:
+    """Thread-safe LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, ttl: float = TENANT_CACHE_TTL, max_entries: int = TENANT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key):
+        """Return (value, expired) for key, keeping an expired entry for whoever refreshes it; None if missing"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value, expires_at < time.monotonic()
+
+    def set(self, key, value):
+        """Store value under key"""
+        if self.ttl <= 0 or not value:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_where(self, predicate):
+        """Drop every entry for which predicate(key, value) is true"""
+        with self._lock:
+            stale = [key for key, (_, value) in self._entries.items() if predicate(key, value)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+tenant_cache = TenantCache()
+
+
+# ==================== KEYS ====================
+
+def company_key(company_id: str):
+    return ("company", str(company_id))
+
+
+def integration_phone_key(phone_number_id: str):
+    return ("integration_phone", str(phone_number_id))
+
+
+def integration_instance_key(instance_name: str):
+    return ("integration_instance", str(instance_name))
+
+
+# ==================== INVALIDATION ====================
+
+def invalidate_company(company_id: str):
+    """Drop every cached context that belongs to a company"""
+    if company_id is None:
+        return 0
+    company_id = str(company_id)
+    return tenant_cache.invalidate_where(lambda _, value: value.get("company_id") == company_id)
+
+
+def invalidate_integration(integration: dict):
+    """Drop every cached lookup of an integration, plus its company context"""
+    if not integration:
+        return 0
+    integration_id = str(integration.get("id"))
+    company_id = str(integration.get("company_id"))
+
+    def _matches(_, value):
+        # Company contexts embed the integration list, so drop the whole tenant
+        return value.get("company_id") == company_id or value.get("integration", {}).get("id") == integration_id
+
+    return tenant_cache.invalidate_where(_matches)
+
+
+# ==================== LOOKUPS ====================
+
+def _build_context(company: dict, integrations: list, integration: dict = None):
+    return {
+        "company": company,
+        "company_id": company["id"],
+        "schema_name": company["schema_name"],
+        "integrations": integrations,
+        "integration": integration if integration is not None else (integrations[0] if integrations else {}),
+    }
+
+
+async def get_tenant_context(company_id: str):
+    """
+    Resolve a company, its schema and its live integrations.
+
+    Returns:
+        dict with company, company_id, schema_name, integrations and integration
+        (the first live integration, or {}), or None if the company does not exist.
+    """
+    key = company_key(company_id)
+    context = tenant_cache.get(key)
+    if context is not None:
+        return context
+
+    from db.async_public_table import get_companies, get_integrations
+    company = await get_companies("id", company_id)
+    if not company:
+        return None
+    integrations = await get_integrations({"company_id": company["id"], "delete": False})
+    context = _build_context(company, integrations or [])
+    tenant_cache.set(key, context)
+    return context
+
+
+async def get_tenant_context_by_phone_number_id(phone_number_id: str):
+    """Resolve the tenant context that owns a WhatsApp Business phone_number_id"""
+    key = integration_phone_key(phone_number_id)
+    context = tenant_cache.get(key)
+    if context is not None:
+        return context
+
+    from db.async_public_table import get_integration_by_phone_number_id
+    integration = await get_integration_by_phone_number_id(phone_number_id)
+    if not integration:
+        return None
+    company_context = await get_tenant_context(integration["company_id"])
+    if not company_context:
+        return None
+    context = _build_context(company_context["company"], company_context["integrations"], integration)
+    tenant_cache.set(key, context)
+    return context
+
+
+async def get_tenant_context_by_instance_name(instance_name: str):
+    """Resolve the tenant context that owns a WhatsApp Web instance_name"""
+    key = integration_instance_key(instance_name)
+    context = tenant_cache.get(key)
+    if context is not None:
+        return context
+
+    from db.async_public_table import get_integration_by_instance_name
+    integration = await get_integration_by_instance_name(instance_name)
+    if not integration:
+        return None
+    company_context = await get_tenant_context(integration["company_id"])
+    if not company_context:
+        return None
+    context = _build_context(company_context["company"], company_context["integrations"], integration)
+    tenant_cache.set(key, context)
+    return context
+
+
+def get_tenant_context_sync(company_id: str):
+    """Sync variant of get_tenant_context for code running on worker threads"""
+    key = company_key(company_id)
+    context = tenant_cache.get(key)
+    if context is not None:
+        return context
+
+    from db.public_table import get_companies, get_integrations
+    company = get_companies("id", company_id)
+    if not company:
+        return None
+    integrations = get_integrations({"company_id": company["id"], "delete": False})
+    context = _build_context(company, integrations or [])
+    tenant_cache.set(key, context)
+    return context
+
+
+def get_tenant_context_by_phone_number_id_sync(phone_number_id: str):
+    """Sync variant of get_tenant_context_by_phone_number_id for worker threads"""
+    key = integration_phone_key(phone_number_id)
+    context = tenant_cache.get(key)
+    if context is not None:
+        return context
+
+    from db.public_table import get_integration_by_phone_number_id
+    integration = get_integration_by_phone_number_id(phone_number_id)
+    if not integration:
+        return None
+    company_context = get_tenant_context_sync(integration["company_id"])
+    if not company_context:
+        return None
+    context = _build_context(company_context["company"], company_context["integrations"], integration)
+    tenant_cache.set(key, context)
+    return context
+
+
+# ==================== DROP-IN HELPERS ====================
+# Same return shapes as get_companies("id", ...) and the get_integration_by_* helpers
+
+async def get_cached_company(company_id: str):
+    """Cached get_companies("id", company_id)"""
+    context = await get_tenant_context(company_id)
+    return context["company"] if context else None
+
+
+async def get_cached_integration_by_phone_number_id(phone_number_id: str):
+    """Cached get_integration_by_phone_number_id"""
+    context = await get_tenant_context_by_phone_number_id(phone_number_id)
+    return context["integration"] if context else {}
+
+
+async def get_cached_integration_by_instance_name(instance_name: str):
+    """Cached get_integration_by_instance_name"""
+    context = await get_tenant_context_by_instance_name(instance_name)
+    return context["integration"] if context else {}
+
+
+def get_cached_company_sync(company_id: str):
+    """Cached get_companies("id", company_id) for worker threads"""
+    context = get_tenant_context_sync(company_id)
+    return context["company"] if context else None
+
+
+def get_cached_integration_by_phone_number_id_sync(phone_number_id: str):
+    """Cached get_integration_by_phone_number_id for worker threads"""
+    context = get_tenant_context_by_phone_number_id_sync(phone_number_id)
+    return context["integration"] if context else {}
@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import os
+import asyncio
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -13,6 +14,19 @@ from routers import auth, user, company, invite, knowledge, conversation, chat,
 from middleware.error_handler import add_exception_handlers
 from utils.validate_env import validate_env
 from db.init_db import initialize_database
+from db.db_connection import db, get_pool_status
+from db.tenant_cache import tenant_cache
+from db.linked_assets import linked_assets_cache
+from utils.job_queue import job_queue
+from utils.conversation_mailbox import mailbox
+from src.utils.embedding_cache import embedding_cache
+from src.utils.filter_resolver import column_filter_cache
+from src.utils.column_index import column_index
+from src.utils.lexical_index import lexical_indexes
+from src.utils.search_cache import product_search_cache
+from src.utils.chroma_utils import feature_llm_cache
+from src.utils.product_table import product_tables
+from src.image_vectorize import image_encoder, image_search_stats
 
 app = FastAPI(
     title="Bot Admin Backend",
@@ -57,6 +71,17 @@ app.include_router(customer.router, prefix="/customer", tags=["customer"])
 # Add exception handlers
 add_exception_handlers(app)
 
+@app.on_event("startup")
+def start_job_queue():
+    # Handlers are registered when the routers are imported
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def drain_job_queue():
+    # Let queued AI replies finish (up to JOB_QUEUE_DRAIN_TIMEOUT) before the process exits
+    await asyncio.to_thread(job_queue.shutdown)
+    await db.close_async()
+
 @app.get("/")
 def read_root():
     return {"message": "FastAPI Backend is running"}
@@ -65,6 +90,30 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/db")
+def database_health_check():
+    return {"status": "healthy", "pool": get_pool_status(), "tenant_cache": tenant_cache.stats()}
+
+@app.get("/health/jobs")
+def job_queue_health_check():
+    return {"status": "healthy", "jobs": job_queue.stats(), "mailbox": mailbox.stats()}
+
+@app.get("/health/cache")
+def cache_health_check():
+    return {
+        "status": "healthy",
+        "embeddings": embedding_cache.stats(),
+        "column_filters": column_filter_cache.stats(),
+        "column_index": column_index.stats(),
+        "lexical": lexical_indexes.stats(),
+        "product_search": product_search_cache.stats(),
+        "feature_llm": feature_llm_cache.stats(),
+        "product_tables": product_tables.stats(),
+        "linked_assets": linked_assets_cache.stats(),
+        "image_embeddings": image_encoder.stats(),
+        "image_search": image_search_stats(),
+    }
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(
@@ -0,0 +1,32 @@
+from fastapi import HTTPException, Depends, status
+from middleware.auth import verify_token
+from db.tenant_cache import get_tenant_context
+
+async def get_tenant(user = Depends(verify_token)):
+    """
+    Resolve the authenticated user's tenant in one (cached) lookup.
+
+    FastAPI caches dependencies per request, so a route can depend on both
+    `verify_token` and `get_tenant` and the token is only decoded once.
+
+    Returns:
+        dict: company, company_id, schema_name, integrations and integration
+        (the company's first live integration, or {}).
+
+    Raises:
+        HTTPException: If the token carries no company or the company does not exist.
+    """
+    company_id = user.get("company_id")
+    if not company_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Company ID is required"
+        )
+
+    tenant = await get_tenant_context(company_id)
+    if not tenant:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Company not found"
+        )
+    return tenant
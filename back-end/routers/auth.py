@@ -1,7 +1,7 @@
 # Import required modules from FastAPI, Pydantic, utilities, and external libraries
 from fastapi import APIRouter, HTTPException, status, Body, Query
 from utils.send_email_without_smtp import send_reset_password_email
-from db.public_table import *
+from db.async_public_table import *
 from utils.token_handler import hash_password, create_access_token, verify_password, decode_valide_access_token
 
 # Initialize API router
@@ -31,9 +31,9 @@ async def register(
         raise HTTPException(status_code=400, detail="Missing required fields")
     
     # Check if user already exists
-    existing_user = get_users("email", email)
+    existing_user = await get_users("email", email)
     if existing_user:
-        now_user = get_user_with_permission("email", email)
+        now_user = await get_user_with_permission("email", email)
         if not now_user:
             raise HTTPException(
                 status_code=400, 
@@ -44,17 +44,17 @@ async def register(
             raise HTTPException(status_code=400, detail="User already exists")
     
     # Insert new company data and create company schema and table
-    new_company = create_companies(name=company, description=description)
+    new_company = await create_companies(name=company, description=description)
     if not new_company:
         raise HTTPException(status_code=400, detail="Registration failed")
     
     # Fetch admin role
-    role_info = get_roles('name','admin')
+    role_info = await get_roles('name','admin')
     if not role_info:
         raise HTTPException(status_code=400, detail="Role not found")
     
     # Hash password and create user
-    new_user = add_new_user(name=name, email=email, password=password, company_id=new_company['id'], role=role_info['id'])
+    new_user = await add_new_user(name=name, email=email, password=password, company_id=new_company['id'], role=role_info['id'])
     
     if not new_user:
         raise HTTPException(status_code=400, detail="Registration failed")
@@ -99,7 +99,7 @@ async def login(
     if not email or not password:
         raise HTTPException(status_code=400, detail="Missing required fields")
     
-    user = get_user_with_permission("email", email)
+    user = await get_user_with_permission("email", email)
     if not user:
         raise HTTPException(status_code=401, detail="User not found. Please register before logging in.")
     
@@ -153,7 +153,7 @@ async def forgot_password(data = Body(...)):
     if not email:
         raise HTTPException(status_code=400, detail="Missing required fields")
     
-    user = get_user_with_permission("email", email)
+    user = await get_user_with_permission("email", email)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
@@ -189,7 +189,7 @@ async def forgot_password(token:str = Query(...)):
     if not email:
         raise HTTPException(status_code=400, detail="Missing required fields")
     
-    user = get_user_with_permission("email", email)
+    user = await get_user_with_permission("email", email)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
@@ -218,12 +218,12 @@ async def forgot_password(data = Body(...)):
     if not email:
         raise HTTPException(status_code=400, detail="Missing required fields")
     
-    user = get_user_with_permission("email", email)
+    user = await get_user_with_permission("email", email)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
     # Update the password in the database
-    updated_user = update_user_by_id(user['user_id'], {"password": password})
+    updated_user = await update_user_by_id(user['user_id'], {"password": password})
     if not updated_user:
         raise HTTPException(status_code=401, detail="Failed to update password")
     
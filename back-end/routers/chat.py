@@ -1,17 +1,18 @@
-import os, json, io
+import os, json, io, uuid
 import httpx
 from fastapi import APIRouter, HTTPException, Depends, Query, Body, Form, File, UploadFile
 from middleware.auth import verify_token
-from db.public_table import get_companies, get_integration_by_phone_number_id
-from db.company_table import *
+from db.tenant_cache import get_cached_company, get_cached_integration_by_phone_number_id
+from db.async_company_table import *
 from utils.whatsapp import send_message_whatsapp
 from utils.waca import send_text_message_by_waca, send_image_message_by_waca
 from src.response.generate import generate_response_with_search, generate_response_with_image_search
 from src.image_vectorize import search_similar_images
 from src.utils.file_utills import validate_and_convert_image
 from utils.stt import speech_to_text
-import threading
 import asyncio
+from utils.job_queue import job_queue
+from utils.conversation_mailbox import mailbox
 from typing import Optional, List
 
 router = APIRouter()
@@ -48,13 +49,13 @@ async def send_message(data = Body(...), user = Depends(verify_token)):
         raise HTTPException(status_code=400, detail="Missing conversation_id, content or sender_type parameter")
     
     # Fetch company info using user’s company_id
-    company_info = get_companies("id", user["company_id"])
+    company_info = await get_cached_company(user["company_id"])
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
     
     # Fetch conversation details by ID
-    conversations = get_conversation_by_id(company_schema, conversation_id)
+    conversations = await get_conversation_by_id(company_schema, conversation_id)
     
     if not conversations:
         raise HTTPException(status_code=500, detail=conversations['message'])
@@ -73,7 +74,7 @@ async def send_message(data = Body(...), user = Depends(verify_token)):
         if not result:
             raise HTTPException(status_code=500, detail="Error sending message")
     elif current_conversation['source'] == 'WACA':
-        integration = get_integration_by_phone_number_id(current_conversation["instance_name"])
+        integration = await get_cached_integration_by_phone_number_id(current_conversation["instance_name"])
         api_key = integration.get("instance_name", None)
         phone_number_id = current_conversation["instance_name"]
         result = send_text_message_by_waca(api_key, phone_number_id, current_conversation['phone_number'], content)
@@ -86,7 +87,7 @@ async def send_message(data = Body(...), user = Depends(verify_token)):
         email = user["email"]
     extra_data = {}
     # Insert new message into database    
-    add_query = add_new_message(
+    add_query = await add_new_message(
         company_id=company_schema, 
         conversation_id=conversation_id, 
         sender_email=email, 
@@ -164,13 +165,13 @@ async def send_image_message(
         raise HTTPException(status_code=400, detail="Missing content or file parameter")
     
     # Fetch company info using user’s company_id
-    company_info = get_companies("id", user["company_id"])
+    company_info = await get_cached_company(user["company_id"])
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
     
     # Fetch conversation details by ID
-    conversations = get_conversation_by_id(company_schema, conversation_id)
+    conversations = await get_conversation_by_id(company_schema, conversation_id)
     
     if not conversations:
         raise HTTPException(status_code=500, detail=conversations['message'])
@@ -256,7 +257,7 @@ async def send_image_message(
         if not result:
             raise HTTPException(status_code=500, detail="Error sending message")
     elif current_conversation['source'] == 'WACA':
-        integration = get_integration_by_phone_number_id(current_conversation["instance_name"])
+        integration = await get_cached_integration_by_phone_number_id(current_conversation["instance_name"])
         api_key = integration.get("instance_name", None)
         phone_number_id = current_conversation["instance_name"]
         result = send_image_message_by_waca(api_key, phone_number_id, current_conversation['phone_number'], content, extra_data)
@@ -264,7 +265,7 @@ async def send_image_message(
             raise HTTPException(status_code=500, detail="Error sending message")
         
     extra_data = f'{extra_data}'.replace('\'', '\"')
-    add_query = add_new_message(
+    add_query = await add_new_message(
         company_id=company_schema, 
         conversation_id=conversation_id, 
         sender_email=email, 
@@ -330,7 +331,7 @@ async def get_chats(conversation_id: str = Query(...), user = Depends(verify_tok
     - JSON response with status and list of messages.
     """
     # Fetch company info using user’s company_id
-    company_info = get_companies("id", user["company_id"])
+    company_info = await get_cached_company(user["company_id"])
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
@@ -340,7 +341,7 @@ async def get_chats(conversation_id: str = Query(...), user = Depends(verify_tok
         raise HTTPException(status_code=400, detail="Missing conversation_id parameter")
     
     # Retrieve all messages from the database
-    messages = get_all_messages(company_schema, conversation_id)
+    messages = await get_all_messages(company_schema, conversation_id)
     
     return {
         "status": 'success',
@@ -365,11 +366,14 @@ async def response_in_background(conversation_id: str, company_id: str, company_
         print(e)
         return None
 
-def run_response_in_thread(conversation_id, company_id, company_schema, query, instance_name, phone_number, message_type, platform):
-    asyncio.run(response_in_background(conversation_id, company_id, company_schema, query, instance_name, phone_number, message_type, platform))
+def read_file_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
 
-async def response_for_image_in_background(conversation_id: str, company_id: str, company_schema: str, query: str, instance_name:str, phone_number:str, platform:str, file_io:io.BytesIO):
+async def response_for_image_in_background(conversation_id: str, company_id: str, company_schema: str, query: str, instance_name:str, phone_number:str, platform:str, image_path:str):
     try:
+        # Jobs only carry JSON payloads, so the image is read back from where the route saved it
+        file_io = io.BytesIO(await asyncio.to_thread(read_file_bytes, image_path))
         result = await generate_response_with_image_search(
             company_id=company_id,
             company_schema=company_schema,
@@ -386,8 +390,23 @@ async def response_for_image_in_background(conversation_id: str, company_id: str
         print(e)
         return None
 
-def run_response_for_image_in_thread(conversation_id, company_id, company_schema, query, instance_name, phone_number, platform, file_io):
-    asyncio.run(response_for_image_in_background(conversation_id, company_id, company_schema, query, instance_name, phone_number, platform, file_io))
+# AI replies run on the bounded job queue (utils.job_queue) instead of one thread per message.
+# They go through the conversation mailbox so each conversation has one turn in flight
+# and rapid-fire messages are answered together.
+job_queue.register("chat.reply", response_in_background)
+job_queue.register("chat.image_reply", response_for_image_in_background)
+
+
+def check_reply_capacity(conversation_id: str, ai_reply: bool):
+    """Push back with 503 before the message is stored, so a retried webhook does not store it twice"""
+    if ai_reply and not mailbox.has_room(conversation_id):
+        raise HTTPException(status_code=503, detail="Too many pending messages, please retry later")
+
+
+def queue_reply(job_name: str, conversation_id: str, company_id: str, query: str, coalesce: bool = True, **payload):
+    """Post an AI reply to the conversation mailbox; the message is already stored, so a full mailbox only drops the reply"""
+    if not mailbox.post(conversation_id, company_id, job_name, query, coalesce=coalesce, company_id=company_id, **payload):
+        print(f"⚠️ Too many pending messages, no AI reply for conversation: {conversation_id}")
 
 
 @router.post("/reply")
@@ -402,15 +421,15 @@ async def reply_to_message(data = Body(...)):
     
     phone_number = message["key"]["remoteJid"].split('@')[0]
     
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
     
-    conversation = get_conversatin_by_phone_integration(company_schema, phone_number, instanceName)
+    conversation = await get_conversatin_by_phone_integration(company_schema, phone_number, instanceName)
     if not conversation:
         whatsapp_name = message['pushName']
-        new_conversation = add_new_conversation(company_schema, whatsapp_name, "WhatsApp", phone_number, instanceName)
+        new_conversation = await add_new_conversation(company_schema, whatsapp_name, "WhatsApp", phone_number, instanceName)
         if new_conversation:
             conversation_id = new_conversation[0]['conversation_id']
             conversation_ai_reply = new_conversation[0]['ai_reply']
@@ -419,8 +438,9 @@ async def reply_to_message(data = Body(...)):
     else:
         conversation_id = conversation[0]['conversation_id']
         conversation_ai_reply = conversation[0]['ai_reply']
+    check_reply_capacity(conversation_id, conversation_ai_reply)
     print(message)
-    messages = add_new_message(
+    messages = await add_new_message(
         company_id=company_schema, 
         conversation_id=conversation_id, 
         sender_email="", 
@@ -432,13 +452,12 @@ async def reply_to_message(data = Body(...)):
     # Return success response with new message details
     if messages:
         if conversation_ai_reply == True:
-            # Start vectorization in background thread
-            thread = threading.Thread(
-                target=run_response_in_thread,
-                args=(conversation_id, company_id, company_schema, user_message, instanceName, phone_number, "Text", "WhatsApp")
+            # Queue the AI reply
+            queue_reply(
+                "chat.reply", conversation_id, company_id, user_message,
+                company_schema=company_schema,
+                instance_name=instanceName, phone_number=phone_number, message_type="Text", platform="WhatsApp"
             )
-            thread.daemon = True
-            thread.start()
         return {
             "success": True,
         }
@@ -470,14 +489,14 @@ async def reply_to_voice_message(
     
     phone_number = phone_number.split('@')[0]
     
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
     
-    conversation = get_conversatin_by_phone_integration(company_schema, phone_number, instanceName)
+    conversation = await get_conversatin_by_phone_integration(company_schema, phone_number, instanceName)
     if not conversation:
-        new_conversation = add_new_conversation(company_schema, whatsapp_name, "WhatsApp", phone_number, instanceName)
+        new_conversation = await add_new_conversation(company_schema, whatsapp_name, "WhatsApp", phone_number, instanceName)
         if new_conversation:
             conversation_id = new_conversation[0]['conversation_id']
             conversation_ai_reply = new_conversation[0]['ai_reply']
@@ -486,8 +505,9 @@ async def reply_to_voice_message(
     else:
         conversation_id = conversation[0]['conversation_id']
         conversation_ai_reply = conversation[0]['ai_reply']
+    check_reply_capacity(conversation_id, conversation_ai_reply)
     
-    messages = add_new_message(
+    messages = await add_new_message(
         company_id=company_schema, 
         conversation_id=conversation_id, 
         sender_email="", 
@@ -499,13 +519,12 @@ async def reply_to_voice_message(
     # Return success response with new message details
     if messages:
         if conversation_ai_reply == True:
-            # Start vectorization in background thread
-            thread = threading.Thread(
-                target=run_response_in_thread,
-                args=(conversation_id, company_id, company_schema,message_content, instanceName, phone_number, "Voice", "WhatsApp")
+            # Queue the AI reply
+            queue_reply(
+                "chat.reply", conversation_id, company_id, message_content,
+                company_schema=company_schema,
+                instance_name=instanceName, phone_number=phone_number, message_type="Voice", platform="WhatsApp"
             )
-            thread.daemon = True
-            thread.start()
         return {
             "success": True,
         }
@@ -530,15 +549,15 @@ async def reply_to_image_message(
     phone_number = phone_number.split('@')[0]
     
     # Get Company_info
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
     
     # Check and Add conversation
-    conversation = get_conversatin_by_phone_integration(company_schema, phone_number, instanceName)
+    conversation = await get_conversatin_by_phone_integration(company_schema, phone_number, instanceName)
     if not conversation:
-        new_conversation = add_new_conversation(company_schema, whatsapp_name, "WhatsApp", phone_number, instanceName)
+        new_conversation = await add_new_conversation(company_schema, whatsapp_name, "WhatsApp", phone_number, instanceName)
         if new_conversation:
             conversation_id = new_conversation[0]['conversation_id']
             conversation_ai_reply = new_conversation[0]['ai_reply']
@@ -547,10 +566,13 @@ async def reply_to_image_message(
     else:
         conversation_id = conversation[0]['conversation_id']
         conversation_ai_reply = conversation[0]['ai_reply']
+    check_reply_capacity(conversation_id, conversation_ai_reply)
     
     # Extra file upload in storage
     file_content = await image.read()
-    file_name = image.filename
+    # Clients send generic names ("image.jpg", "blob"), and the queued reply reads the
+    # photo back from this path, so every upload gets its own file
+    file_name = f"{uuid.uuid4().hex}{os.path.splitext(image.filename or '')[1].lower() or '.jpg'}"
     # Define local save path
     save_dir = os.path.join("files", "messages-extra")
     os.makedirs(save_dir, exist_ok=True)
@@ -564,7 +586,7 @@ async def reply_to_image_message(
     # Insert new message into database
     extra_data = {"images":[full_path]}
     extra_data = f'{extra_data}'.replace('\'', '\"')
-    messages = add_new_message(
+    messages = await add_new_message(
         company_id=company_schema, 
         conversation_id=conversation_id, 
         sender_email="", 
@@ -576,14 +598,12 @@ async def reply_to_image_message(
     # Return success response with new message details
     if messages:
         if conversation_ai_reply == True:
-            file_io = io.BytesIO(file_content)
-            # Start vectorization in background thread
-            thread = threading.Thread(
-                target=run_response_for_image_in_thread,
-                args=(conversation_id, company_id, company_schema,content, instanceName, phone_number, "WhatsApp", file_io)
+            # Queue the AI reply
+            queue_reply(
+                "chat.image_reply", conversation_id, company_id, content, coalesce=False,
+                company_schema=company_schema,
+                instance_name=instanceName, phone_number=phone_number, platform="WhatsApp", image_path=full_path
             )
-            thread.daemon = True
-            thread.start()
         return {
             "success": True,
         }
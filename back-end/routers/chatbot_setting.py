@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends, Body
-from db.public_table import get_chatbot_personality, update_chatbot_personality_by_id
+from db.async_public_table import get_chatbot_personality, update_chatbot_personality_by_id
 from middleware.auth import verify_token
 
 router = APIRouter()
@@ -26,7 +26,7 @@ async def status_of_chatbot(user = Depends(verify_token)):
     """
     company_id = user['company_id']
     
-    chatbot_personality = get_chatbot_personality(company_id)
+    chatbot_personality = await get_chatbot_personality(company_id)
     if not chatbot_personality:
         raise HTTPException(status_code=400, detail="Chatbot personality not found")
     return {
@@ -49,7 +49,7 @@ async def update_chatbot_personality(data = Body(...), user = Depends(verify_tok
     Returns:
         dict: Confirmation message and company details (marked as deleted).
     """
-    updated_chatbot_personality = update_chatbot_personality_by_id(user['company_id'], data)
+    updated_chatbot_personality = await update_chatbot_personality_by_id(user['company_id'], data)
     
     if not updated_chatbot_personality:
         raise HTTPException(status_code=500, detail="Failed to update chatbot personality")
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends, Body
-from db.public_table import update_company_by_id
+from db.async_public_table import update_company_by_id
 from middleware.auth import verify_token
 
 router = APIRouter()
@@ -36,7 +36,7 @@ async def update_company(data = Body(...), user = Depends(verify_token)):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
     
     # Update company information in Supabase
-    updated_company = update_company_by_id(user['company_id'], {"name":new_name, "description": description})
+    updated_company = await update_company_by_id(user['company_id'], {"name":new_name, "description": description})
     
     if not updated_company:
         raise HTTPException(status_code=500, detail="Failed to update company information")
@@ -67,7 +67,7 @@ async def update_profile(user = Depends(verify_token)):
     if not user['permission'].get("company", False):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
         
-    deleted_company = update_company_by_id(user['company_id'], {"delete": True})
+    deleted_company = await update_company_by_id(user['company_id'], {"delete": True})
     if not deleted_company:
         raise HTTPException(status_code=500, detail="Failed to delete company information")
     
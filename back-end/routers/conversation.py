@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, Body
 from middleware.auth import verify_token
-from db.public_table import get_companies
-from db.company_table import add_new_conversation, get_all_conversations, get_unanswered_conversations, toggle_ai_reply_for_conversation
+from db.tenant_cache import get_cached_company
+from db.async_company_table import add_new_conversation, get_all_conversations, get_unanswered_conversations, toggle_ai_reply_for_conversation
 
 # Initialize FastAPI router for conversation-related routes
 router = APIRouter()
@@ -24,7 +24,7 @@ async def get_conversations(user = Depends(verify_token)):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
     
     company_id = user["company_id"]
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
 
     # If company is not found, raise 400 error
     if not company_info:
@@ -33,7 +33,7 @@ async def get_conversations(user = Depends(verify_token)):
     company_schema = company_info["schema_name"]
 
     # Fetch all conversations for this company
-    all_conversations = get_all_conversations(company_schema)
+    all_conversations = await get_all_conversations(company_schema)
     if user["role"] == "admin":
         pass
     else:
@@ -59,7 +59,7 @@ async def get_unanswered_questions(user = Depends(verify_token)):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
     
     company_id = user["company_id"]
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
 
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
@@ -67,7 +67,7 @@ async def get_unanswered_questions(user = Depends(verify_token)):
     company_schema = company_info["schema_name"]
 
     # Fetch unanswered conversations/messages
-    all_conversations = get_unanswered_conversations(company_schema)
+    all_conversations = await get_unanswered_conversations(company_schema)
     if user["role"] == "admin":
         pass
     else:
@@ -108,7 +108,7 @@ async def create_new_conversation(data = Body(...), user = Depends(verify_token)
             raise HTTPException(status_code=400, detail="You are not authorized to perform this action") 
 
     company_id = user["company_id"]
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
 
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
@@ -116,7 +116,7 @@ async def create_new_conversation(data = Body(...), user = Depends(verify_token)
     company_schema = company_info["schema_name"]
 
     # Insert a new conversation into database
-    new_record = add_new_conversation(company_schema, conversation_name, source, phone_number)
+    new_record = await add_new_conversation(company_schema, conversation_name, source, phone_number)
 
     if new_record:
         return {
@@ -145,7 +145,7 @@ async def toggle_ai_reply(data = Body(...), user = Depends(verify_token)):
         raise HTTPException(status_code=400, detail="conversation_id is required")
     
     company_id = user["company_id"]
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
 
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
@@ -153,7 +153,7 @@ async def toggle_ai_reply(data = Body(...), user = Depends(verify_token)):
     company_schema = company_info["schema_name"]
 
     # Toggle AI reply for the conversation
-    toggle_ai_reply = toggle_ai_reply_for_conversation(company_schema, conversation_id)
+    toggle_ai_reply = await toggle_ai_reply_for_conversation(company_schema, conversation_id)
 
     if toggle_ai_reply:
         return {
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, Body
 from middleware.auth import verify_token
-from db.public_table import get_companies
-from db.company_table import (
+from middleware.tenant import get_tenant
+from db.async_company_table import (
     add_new_customer,
     get_all_customers,
     get_customer_by_id,
@@ -17,7 +17,7 @@ router = APIRouter()
 # ---------------------------
 
 @router.post("/new")
-async def create_customer(data = Body(...), user = Depends(verify_token)):
+async def create_customer(data = Body(...), user = Depends(verify_token), tenant = Depends(get_tenant)):
     """
     Create a new customer for the company.
     
@@ -29,6 +29,7 @@ async def create_customer(data = Body(...), user = Depends(verify_token)):
             - conversation_id (str, optional): Associated conversation ID
             - agent_id (str, optional): Assigned agent ID
         user (dict): Authenticated user data, injected via dependency.
+        tenant (dict): Resolved company context (schema_name, integrations), injected via dependency.
     
     Returns:
         dict: Success message and created customer data.
@@ -43,11 +44,10 @@ async def create_customer(data = Body(...), user = Depends(verify_token)):
     # Validate required fields
     if not customer_name:
         raise HTTPException(status_code=400, detail="customer_name is required")
-    company_info = get_companies("id", user['company_id'])
-    company_schema = company_info["schema_name"]
+    company_schema = tenant["schema_name"]
     # Create new customer
     if not customer_id:
-        new_customer = add_new_customer(
+        new_customer = await add_new_customer(
             company_id=company_schema,
             customer_name=customer_name,
             customer_email=customer_email,
@@ -57,7 +57,7 @@ async def create_customer(data = Body(...), user = Depends(verify_token)):
             raise HTTPException(status_code=500, detail="Failed to create customer")
         customer_id = new_customer[0]['customer_id']
     
-    conversation = update_conversation_by_id(company_schema, conversation_id, {"customer_id": customer_id, 'agent_id': agent_id})
+    conversation = await update_conversation_by_id(company_schema, conversation_id, {"customer_id": customer_id, 'agent_id': agent_id})
     if not conversation:
         raise HTTPException(status_code=500, detail="Failed to update conversation")
     return {
@@ -67,19 +67,19 @@ async def create_customer(data = Body(...), user = Depends(verify_token)):
 
 
 @router.get("/all")
-async def get_customers(user = Depends(verify_token)):
+async def get_customers(user = Depends(verify_token), tenant = Depends(get_tenant)):
     """
     Retrieve all customers for the authenticated user's company.
     
     Args:
         user (dict): Authenticated user data, injected via dependency.
+        tenant (dict): Resolved company context (schema_name, integrations), injected via dependency.
     
     Returns:
         dict: List of all customers.
     """
-    company_info = get_companies("id", user['company_id'])
-    company_schema = company_info["schema_name"]
-    customers = get_all_customers(company_schema)
+    company_schema = tenant["schema_name"]
+    customers = await get_all_customers(company_schema)
     result = {}
     for i in customers:
         if i.get("customer_id", ""):
@@ -120,7 +120,8 @@ async def get_customers(user = Depends(verify_token)):
 async def update_customer_info(
     customer_id: str,
     data = Body(...),
-    user = Depends(verify_token)
+    user = Depends(verify_token),
+    tenant = Depends(get_tenant)
 ):
     """
     Update customer information.
@@ -134,6 +135,7 @@ async def update_customer_info(
             - conversation_id (str, optional): Associated conversation ID
             - agent_id (str, optional): Assigned agent ID
         user (dict): Authenticated user data, injected via dependency.
+        tenant (dict): Resolved company context (schema_name, integrations), injected via dependency.
 
     Returns:
         dict: Success message and updated customer data.
@@ -144,10 +146,9 @@ async def update_customer_info(
     conversation_id = data.get("conversation_id") if data.get("conversation_id") else None
     agent_id =  data.get("agent_id") if data.get("agent_id") else None
     
-    company_info = get_companies("id", user['company_id'])
-    company_schema = company_info["schema_name"]
+    company_schema = tenant["schema_name"]
     # Update customer
-    updated_customer = update_customer(
+    updated_customer = await update_customer(
         company_id=company_schema,
         customer_id=customer_id,
         customer_name=customer_name,
@@ -158,7 +159,7 @@ async def update_customer_info(
     if not updated_customer:
         raise HTTPException(status_code=404, detail="Customer not found or failed to update")
 
-    conversation = update_conversation_by_id(company_schema, conversation_id, {"customer_id": customer_id, 'agent_id': agent_id})
+    conversation = await update_conversation_by_id(company_schema, conversation_id, {"customer_id": customer_id, 'agent_id': agent_id})
     if not conversation:
         raise HTTPException(status_code=500, detail="Failed to update conversation")
     return {
@@ -168,20 +169,20 @@ async def update_customer_info(
 
 
 @router.get("/get/{conversationId}")
-async def get_customer_info(conversationId: str, user = Depends(verify_token)):
+async def get_customer_info(conversationId: str, user = Depends(verify_token), tenant = Depends(get_tenant)):
     """
     Retrieve customer information.
 
     Args:
         customer_id (str): The customer's unique identifier.
         user (dict): Authenticated user data, injected via dependency.
+        tenant (dict): Resolved company context (schema_name, integrations), injected via dependency.
 
     Returns:
         dict: Customer data.
     """
-    company_info = get_companies("id", user['company_id'])
-    company_schema = company_info["schema_name"]
-    customers = get_customer_by_id(company_schema, conversationId)
+    company_schema = tenant["schema_name"]
+    customers = await get_customer_by_id(company_schema, conversationId)
     
     return {
         "message": "Customers retrieved successfully",
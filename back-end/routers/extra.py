@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, Body, File, Query, Form
 from middleware.auth import verify_token
 from src.utils.file_utills import generate_file_hash
-from db.public_table import get_companies
-from db.company_table import *
+from db.tenant_cache import get_cached_company
+from db.async_company_table import *
+from db.linked_assets import product_key_from_file_name, invalidate_linked_assets
 import os
 from collections import defaultdict
 router = APIRouter()
@@ -24,14 +25,14 @@ async def get_file_list(
     if not company_id:
         raise HTTPException(status_code=400, detail="Project ID is required")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
     company_schema = company_info["schema_name"]
 
     try:
-        files = get_documents_from_table(company_schema, page_size, page_start)
+        files = await get_documents_from_table(company_schema, page_size, page_start)
         # group items by file_hash
         groups = defaultdict(list)
         for item in files:
@@ -60,12 +61,12 @@ async def get_file_list(
                     })
         
         for item in result:
-            update_documents_status_on_table_by_hash(company_id=company_schema, file_hash=item["file_hash"], status=item["target_status"])
+            await update_documents_status_on_table_by_hash(company_id=company_schema, file_hash=item["file_hash"], status=item["target_status"])
         
         if result:
-            files = get_documents_from_table(company_schema, page_size, page_start)
+            files = await get_documents_from_table(company_schema, page_size, page_start)
         
-        count = get_all_documents_from_table(company_schema)
+        count = await get_all_documents_from_table(company_schema)
         return {
             "status": "success",
             "company_id": company_id,
@@ -89,7 +90,7 @@ async def upload_file(
     if not file or not company_id:
         raise HTTPException(status_code=400, detail="No file provided")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
@@ -100,7 +101,7 @@ async def upload_file(
         file_name = file.filename.split("/")[-1].lower()
         file_hash = generate_file_hash(file_content)
         match_field = match_field.strip("'").replace(" ", "_").replace("-", "_").replace("/", "_").replace("(", "_").replace(")", "_").replace(".", "_").lower()
-        existing_file = get_same_documents_from_table(company_id=company_schema, file_hash=file_hash)
+        existing_file = await get_same_documents_from_table(company_id=company_schema, file_hash=file_hash)
 
         if existing_file:
             existing_file_name = [i["file_name"] for i in existing_file]
@@ -122,17 +123,19 @@ async def upload_file(
                 f.write(file_content)
             status = "Completed"
         
-        image_file = add_new_document(
+        image_file = await add_new_document(
             company_id=company_schema,
             file_name=file_name,
             file_type=file.content_type,
             file_hash=file_hash,
             full_path=full_path,
             status=status,
-            match_field=match_field
+            match_field=match_field,
+            product_key=product_key_from_file_name(file_name)
         )
         if not image_file:
             raise HTTPException(status_code=500, detail="Failed to upload file")          
+        invalidate_linked_assets(company_schema)
         return {
             "success": True,
             "message": "File uploaded successfully, vectorization started",
@@ -154,13 +157,13 @@ async def remove_file(
     company_id = user.get("company_id")
     file_id = data.get("file_id")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
     company_schema = company_info["schema_name"]
 
-    existing_file = get_same_documents_from_table_with_id(company_id=company_schema, file_id=file_id)
+    existing_file = await get_same_documents_from_table_with_id(company_id=company_schema, file_id=file_id)
     if not existing_file:
         raise HTTPException(status_code=400, detail="File not found")
 
@@ -168,15 +171,17 @@ async def remove_file(
     file_name, file_hash = file_info["file_name"], file_info["file_hash"]
 
     try:
-        existing_file = get_same_documents_from_table(company_id=company_schema, file_hash=file_hash)
+        existing_file = await get_same_documents_from_table(company_id=company_schema, file_hash=file_hash)
         if len(existing_file) > 1:
-            deleting_file = delete_documents_from_table(company_id=company_schema, file_id=file_id)
+            deleting_file = await delete_documents_from_table(company_id=company_schema, file_id=file_id)
             if not deleting_file:
                 raise HTTPException(status_code=400, detail="Failed to delete database record")
+            invalidate_linked_assets(company_schema)
             return {"message": "File removed successfully"}
-        deleting_file = delete_documents_from_table(company_id=company_schema, file_id=file_id)
+        deleting_file = await delete_documents_from_table(company_id=company_schema, file_id=file_id)
         if not deleting_file:
             raise HTTPException(status_code=400, detail="Failed to delete database record")
+        invalidate_linked_assets(company_schema)
         
         file_path = file_info["full_path"]
         os.remove(file_path)
@@ -197,13 +202,13 @@ async def reprocess_file(
     if not file_id:
         raise HTTPException(status_code=400, detail="file_id is required")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
     company_schema = company_info["schema_name"]
 
-    existing_file = get_same_documents_from_table_with_id(company_id=company_schema, file_id=file_id)
+    existing_file = await get_same_documents_from_table_with_id(company_id=company_schema, file_id=file_id)
     if not existing_file:
         raise HTTPException(status_code=400, detail="File not found")
 
@@ -211,7 +216,7 @@ async def reprocess_file(
     file_name, file_hash, match_field, full_path = file_info["file_name"], file_info["file_hash"], file_info["match_field"], file_info['full_path']
 
     try:
-        existing_file = get_same_documents_from_table(company_id=company_schema, file_hash=file_hash)
+        existing_file = await get_same_documents_from_table(company_id=company_schema, file_hash=file_hash)
         record_ids = []
         status = "Completed"
         if existing_file:
@@ -229,7 +234,7 @@ async def reprocess_file(
                 file_content = f.read()
             file_hash = generate_file_hash(file_content)
         else:
-            update_documents_status_on_table_by_hash(company_id=company_schema, file_hash=file_hash, status='Completed')
+            await update_documents_status_on_table_by_hash(company_id=company_schema, file_hash=file_hash, status='Completed')
 
         return {
             "success": True,
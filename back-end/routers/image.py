@@ -1,10 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, Body, File, Query, Form
 from middleware.auth import verify_token
 from src.image_vectorize import store_image_embedding, delete_image_embedding
+from src.image_import import new_image_import, run_image_import, import_status, is_import_running, stored_image_path
 from src.utils.file_utills import generate_file_hash, validate_and_convert_image
-from db.public_table import get_companies
-from db.company_table import *
-import io, asyncio, threading, os
+from db.tenant_cache import get_cached_company
+from db.async_company_table import *
+from db.linked_assets import product_key_from_file_name, invalidate_linked_assets
+import io, asyncio, threading, os, shutil
 from collections import defaultdict
 router = APIRouter()
 
@@ -16,6 +18,8 @@ def run_vectorize_in_thread(file_content, file_name, file_hash, company_id, reco
 
 async def vectorize_in_background(file_content: bytes, file_name: str, file_hash: str, company_id: str, record_ids: list[str], company_schema:str, match_field:str, full_path:str):
     """Handles background image embedding creation."""
+    # Runs on a worker thread's own event loop, so use the sync helpers
+    from db.company_table import update_image_status_on_table_by_hash
     try:
         file_io = io.BytesIO(file_content)
         result = store_image_embedding(
@@ -56,14 +60,14 @@ async def get_file_list(
     if not company_id:
         raise HTTPException(status_code=400, detail="Project ID is required")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
     company_schema = company_info["schema_name"]
 
     try:
-        files = get_images_from_table(company_schema, page_size, page_start)
+        files = await get_images_from_table(company_schema, page_size, page_start)
         # group items by file_hash
         groups = defaultdict(list)
         for item in files:
@@ -92,12 +96,12 @@ async def get_file_list(
                     })
         
         for item in result:
-            update_image_status_on_table_by_hash(company_id=company_schema, file_hash=item["file_hash"], status=item["target_status"])
+            await update_image_status_on_table_by_hash(company_id=company_schema, file_hash=item["file_hash"], status=item["target_status"])
         
         if result:
-            files = get_images_from_table(company_schema, page_size, page_start)
+            files = await get_images_from_table(company_schema, page_size, page_start)
         
-        count = get_all_image_from_table(company_schema)
+        count = await get_all_image_from_table(company_schema)
         return {
             "status": "success",
             "company_id": company_id,
@@ -121,7 +125,7 @@ async def upload_file(
     if not file or not company_id:
         raise HTTPException(status_code=400, detail="No file provided")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
@@ -139,7 +143,7 @@ async def upload_file(
 
         file_hash = generate_file_hash(file_content)
         match_field = match_field.strip("'").replace(" ", "_").replace("-", "_").replace("/", "_").replace("(", "_").replace(")", "_").replace(".", "_").lower()
-        existing_file = get_same_image_from_table(company_id=company_schema, file_hash=file_hash)
+        existing_file = await get_same_image_from_table(company_id=company_schema, file_hash=file_hash)
 
         if existing_file:
             existing_file_name = [i["file_name"] for i in existing_file]
@@ -153,25 +157,27 @@ async def upload_file(
             save_dir = os.path.join("files", "images",str(company_id))
             os.makedirs(save_dir, exist_ok=True)
 
-            # Build full path for the file
-            full_path = os.path.join(save_dir, file_name)
+            # Build full path for the file, without overwriting another image of the same name
+            full_path = stored_image_path(save_dir, file_name, file_hash)
 
             # Save the file locally
             with open(full_path, "wb") as f:
                 f.write(file_content)
             status = "Processing"
         
-        image_file = add_new_image(
+        image_file = await add_new_image(
             company_id=company_schema,
             file_name=file_name,
             file_type=file.content_type,
             file_hash=file_hash,
             full_path=full_path,
             status=status,
-            match_field=match_field
+            match_field=match_field,
+            product_key=product_key_from_file_name(file_name)
         )
         if not image_file:
             raise HTTPException(status_code=500, detail="Failed to upload file")
+        invalidate_linked_assets(company_schema)
 
         record_id = image_file[0]["id"]
 
@@ -194,6 +200,107 @@ async def upload_file(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def save_upload(upload, path: str):
+    """Copy an uploaded file to disk block by block (blocking)"""
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload, f, 1024 * 1024)
+
+
+def run_import_in_thread(import_id):
+    """Run a bulk image import inside a separate thread."""
+    try:
+        run_image_import(import_id)
+    except Exception as e:
+        print(f"Bulk image import failed: {str(e)}")
+
+
+@router.post("/bulk-upload")
+async def bulk_upload_files(
+    files: list[UploadFile] = File(...),
+    match_field:str = Form(...),
+    user=Depends(verify_token),
+):
+    """
+    Import a catalog of images: ZIP archives and/or many image files.
+
+    Uploads are streamed to disk and imported in the background; poll
+    /image/bulk-upload/{import_id} for progress.
+    """
+    if not user['permission'].get("knowledge"):
+        raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
+
+    company_id = user.get("company_id")
+    match_field = match_field.strip()
+    if not files or not company_id:
+        raise HTTPException(status_code=400, detail="No file provided")
+
+    company_info = await get_cached_company(company_id)
+    if not company_info:
+        raise HTTPException(status_code=400, detail="Company not found")
+
+    company_schema = company_info["schema_name"]
+    match_field = match_field.strip("'").replace(" ", "_").replace("-", "_").replace("/", "_").replace("(", "_").replace(")", "_").replace(".", "_").lower()
+
+    manifest = new_image_import(company_id, company_schema, match_field)
+    try:
+        for file in files:
+            # Written block by block on a worker thread, archives are never held in memory
+            file_name = (file.filename or "upload").split("/")[-1].lower()
+            path = manifest.source_path(file_name)
+            await asyncio.to_thread(save_upload, file.file, path)
+            manifest.add_source(path, file_name)
+        manifest.set_meta(status="queued")
+    finally:
+        manifest.close()
+
+    thread = threading.Thread(target=run_import_in_thread, args=(manifest.import_id,), daemon=True)
+    thread.start()
+
+    return {
+        "success": True,
+        "message": "Files uploaded successfully, import started",
+        "data": {"import_id": manifest.import_id, "files": len(files)},
+    }
+
+
+async def get_company_import(import_id: str, user: dict):
+    """Status of an import that belongs to the user's company"""
+    status = await asyncio.to_thread(import_status, import_id)
+    if not status or status.get("company_id") != str(user.get("company_id")):
+        raise HTTPException(status_code=404, detail="Import not found")
+    return status
+
+
+@router.get("/bulk-upload/{import_id}")
+async def get_bulk_upload_status(
+    import_id: str,
+    user=Depends(verify_token),
+):
+    if not user['permission'].get("knowledge"):
+        raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
+    status = await get_company_import(import_id, user)
+    status.pop("company_schema", None)
+    return {"status": "success", "data": status}
+
+
+@router.post("/bulk-upload/{import_id}/resume")
+async def resume_bulk_upload(
+    import_id: str,
+    user=Depends(verify_token),
+):
+    if not user['permission'].get("knowledge"):
+        raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
+    status = await get_company_import(import_id, user)
+    if status["status"] == "completed" or not status["pending"] and status.get("scanned"):
+        raise HTTPException(status_code=400, detail="Import already completed")
+    if status["status"] == "uploading" or is_import_running(import_id, status):
+        raise HTTPException(status_code=400, detail="Import is still running")
+
+    thread = threading.Thread(target=run_import_in_thread, args=(import_id,), daemon=True)
+    thread.start()
+    return {"success": True, "message": "Import resumed", "data": {"import_id": import_id, "pending": status["pending"]}}
+
+
 @router.delete("/remove")
 async def remove_file(
     data=Body(...),
@@ -205,13 +312,13 @@ async def remove_file(
     company_id = user.get("company_id")
     file_id = data.get("file_id")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
     company_schema = company_info["schema_name"]
 
-    existing_file = get_same_image_from_table_with_id(company_id=company_schema, file_id=file_id)
+    existing_file = await get_same_image_from_table_with_id(company_id=company_schema, file_id=file_id)
     if not existing_file:
         raise HTTPException(status_code=400, detail="File not found")
 
@@ -219,16 +326,18 @@ async def remove_file(
     file_name, file_hash = file_info["file_name"], file_info["file_hash"]
 
     try:
-        existing_file = get_same_image_from_table(company_id=company_schema, file_hash=file_hash)
+        existing_file = await get_same_image_from_table(company_id=company_schema, file_hash=file_hash)
         if len(existing_file) > 1:
-            deleting_file = delete_image_from_table(company_id=company_schema, file_id=file_id)
+            deleting_file = await delete_image_from_table(company_id=company_schema, file_id=file_id)
             if not deleting_file:
                 raise HTTPException(status_code=400, detail="Failed to delete database record")
+            invalidate_linked_assets(company_schema)
             return {"message": "File removed successfully"}
         delete_image_embedding(f"{company_id}-image", file_hash)
-        deleting_file = delete_image_from_table(company_id=company_schema, file_id=file_id)
+        deleting_file = await delete_image_from_table(company_id=company_schema, file_id=file_id)
         if not deleting_file:
             raise HTTPException(status_code=400, detail="Failed to delete database record")
+        invalidate_linked_assets(company_schema)
         
         file_path = file_info["full_path"]
         os.remove(file_path)
@@ -249,13 +358,13 @@ async def reprocess_file(
     if not file_id:
         raise HTTPException(status_code=400, detail="file_id is required")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
     company_schema = company_info["schema_name"]
 
-    existing_file = get_same_image_from_table_with_id(company_id=company_schema, file_id=file_id)
+    existing_file = await get_same_image_from_table_with_id(company_id=company_schema, file_id=file_id)
     if not existing_file:
         raise HTTPException(status_code=400, detail="File not found")
 
@@ -263,7 +372,7 @@ async def reprocess_file(
     file_name, file_hash, match_field, full_path = file_info["file_name"], file_info["file_hash"], file_info["match_field"], file_info['full_path']
 
     try:
-        existing_file = get_same_image_from_table(company_id=company_schema, file_hash=file_hash)
+        existing_file = await get_same_image_from_table(company_id=company_schema, file_hash=file_hash)
         record_ids = []
         status = "Processing"
         if existing_file:
@@ -288,7 +397,7 @@ async def reprocess_file(
             )
             thread.start()
         else:
-            update_image_status_on_table_by_hash(company_id=company_schema, file_hash=file_hash, status='Completed')
+            await update_image_status_on_table_by_hash(company_id=company_schema, file_hash=file_hash, status='Completed')
 
         return {
             "success": True,
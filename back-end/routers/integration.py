@@ -1,6 +1,6 @@
 # Import necessary modules
 from fastapi import APIRouter, HTTPException, Depends, Body
-from db.public_table import *
+from db.async_public_table import *
 from utils.whatsapp import start_whatsapp, combine_uuids, logout_whatsapp
 from middleware.auth import verify_token
 from utils.waca import confirm_phone_number_id, logout_waca
@@ -16,7 +16,7 @@ router = APIRouter()
 async def get_all_integrations(user = Depends(verify_token)):
     if not user['permission'].get("integration", False):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
-    integrations = get_integrations({"company_id": user["company_id"], 'delete': False})
+    integrations = await get_integrations({"company_id": user["company_id"], 'delete': False})
     if not integrations:
         return {
             "integrations":[]
@@ -51,13 +51,13 @@ async def new_integrations(data = Body(...), user = Depends(verify_token)):
     
     if response["success"] == True and response["message"] == "Bot connected":
         phone_number = response['user']['id'].split(':')[0]
-        integrations = get_integrations({"phone_number": phone_number})
+        integrations = await get_integrations({"phone_number": phone_number})
         if integrations:
             if integrations[0]["delete"] == False:
                 response = await logout_whatsapp(instance_name)
                 return HTTPException(status_code=400, detail="Phone number already exists")
             else:
-                new_record = update_integration_by_id(integrations[0]['id'], {
+                new_record = await update_integration_by_id(integrations[0]['id'], {
                     "company_id":company_id,
                     "created_by": request_id,
                     'instance_name':instance_name,
@@ -66,7 +66,7 @@ async def new_integrations(data = Body(...), user = Depends(verify_token)):
                 if not new_record:
                     response["message"] = "Bot running, status unknown"
         else:
-            new_record = add_new_integration(company_id=company_id, created_by=request_id, instance_name=instance_name, phone_number=phone_number, type="whatsapp_web")
+            new_record = await add_new_integration(company_id=company_id, created_by=request_id, instance_name=instance_name, phone_number=phone_number, type="whatsapp_web")
             if not new_record:
                 response["message"] = "Bot running, status unknown"
     
@@ -82,12 +82,12 @@ async def new_integrations(data = Body(...), user = Depends(verify_token)):
     if not integrationId:
         raise HTTPException(status_code=400, detail="integrationId is required")
     
-    integration = get_integrations({"id": integrationId})
+    integration = await get_integrations({"id": integrationId})
     
     if not integration:
         raise HTTPException(status_code=400, detail="integration not found")
     
-    instance_name = update_integration_by_id(integrationId, {"is_active": not integration[0]['is_active']})
+    instance_name = await update_integration_by_id(integrationId, {"is_active": not integration[0]['is_active']})
     
     if not instance_name:
         raise HTTPException(status_code=400, detail="Failed to update integration")
@@ -104,7 +104,7 @@ async def new_integrations(data = Body(...), user = Depends(verify_token)):
     if not integrationId:
         raise HTTPException(status_code=400, detail="integrationId is required")
     
-    integration = get_integrations({"id": integrationId})
+    integration = await get_integrations({"id": integrationId})
     
     if not integration:
         raise HTTPException(status_code=400, detail="integration not found")
@@ -114,7 +114,7 @@ async def new_integrations(data = Body(...), user = Depends(verify_token)):
         response = logout_waca(integration[0]['instance_name'], integration[0]['waba_id'])
     
     if response["success"] == True:
-        update_integration_by_id(integrationId, {"delete": True})
+        await update_integration_by_id(integrationId, {"delete": True})
         raise HTTPException(status_code=400, detail="Failed to update integration")
     
     return {
@@ -143,12 +143,12 @@ async def new_integrations_waca(data = Body(...), user = Depends(verify_token)):
     phone_number_string = phone_number_info["data"]["display_phone_number"]
     phone_number = re.sub(r"\D", "", phone_number_string)
     
-    integrations = get_integrations({"phone_number": phone_number})
+    integrations = await get_integrations({"phone_number": phone_number})
     if integrations:
         if integrations[0]["delete"] == False:
             raise HTTPException(status_code=400, detail="Phone number already exists")
         else:
-            new_integration = update_integration_by_id(integrations[0]["id"], {
+            new_integration = await update_integration_by_id(integrations[0]["id"], {
                 'company_id':company_id, 
                 'created_by':request_id, 
                 'instance_name':api_key, 
@@ -164,7 +164,7 @@ async def new_integrations_waca(data = Body(...), user = Depends(verify_token)):
                 "data": new_integration
             }
     else:
-        new_integration = add_new_integration(company_id=company_id, created_by=request_id, instance_name=api_key, phone_number=phone_number, type="whatsapp_api", phone_number_id=phone_number_id)
+        new_integration = await add_new_integration(company_id=company_id, created_by=request_id, instance_name=api_key, phone_number=phone_number, type="whatsapp_api", phone_number_id=phone_number_id)
         if not new_integration:
             raise HTTPException(status_code=400, detail="Failed to create integration")
         return {
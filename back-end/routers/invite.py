@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends, Body, Query
 from middleware.auth import verify_token
 
-from db.public_table import *
+from db.async_public_table import *
 from utils.token_handler import hash_password, create_access_token, decode_valide_access_token
 from utils.send_email_without_smtp import send_invitation
 import os, time
@@ -22,7 +22,7 @@ async def get_invitations_list(user = Depends(verify_token)):
     if not user['permission'].get("invite", False):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
 
-    invitations = get_invitations_with_users("company_id", user['company_id'])
+    invitations = await get_invitations_with_users("company_id", user['company_id'])
     if invitations is None:
         return {
             "message": "Company settings updated successfully!",
@@ -52,7 +52,7 @@ async def get_roles_list(user = Depends(verify_token)):
     Raises:
         HTTPException: If any error occurs while querying the database.
     """
-    roles = get_roles()
+    roles = await get_roles()
     return {
         "message": "Company settings updated successfully!",
         "roles": roles,
@@ -75,19 +75,19 @@ async def invite_user(data = Body(...), user = Depends(verify_token)):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
     
     # Check if user already exists
-    existed_usr = get_users("email", invited_email)
+    existed_usr = await get_users("email", invited_email)
     if existed_usr:
         if existed_usr['active'] == True:
             raise HTTPException(status_code=400, detail="User already exists")
     
     # Check if invitation already exists
-    existed_invitation = get_invitations("invited_email", invited_email)
+    existed_invitation = await get_invitations("invited_email", invited_email)
     if existed_invitation:
         if existed_invitation[0]['status'] != 'revoked':
             raise HTTPException(status_code=400, detail="Invitation already exists")
     
     # Get inviter user info
-    inviter_user = get_user_with_permission("email", user['email'])
+    inviter_user = await get_user_with_permission("email", user['email'])
     if not inviter_user:
         raise HTTPException(status_code=400, detail="Company not found")
     
@@ -103,13 +103,13 @@ async def invite_user(data = Body(...), user = Depends(verify_token)):
     token_hash = create_access_token(token_data, period=24*3)
     
     if existed_invitation:
-        new_record_invitation = update_invitation_by_id(existed_invitation[0]['id'], {
+        new_record_invitation = await update_invitation_by_id(existed_invitation[0]['id'], {
             "token_hash": token_hash,
             "role": invited_role,
             "status": 'pending'
         })
     else:
-        new_record_invitation = add_invitation(
+        new_record_invitation = await add_invitation(
             company_id=user['company_id'],
             email=invited_email,
             invited_by=user['id'],
@@ -130,7 +130,7 @@ async def invite_user(data = Body(...), user = Depends(verify_token)):
     )
     
     if not re:
-        update_invitation_by_id(new_record_invitation['id'], {"status": 'failed'})
+        await update_invitation_by_id(new_record_invitation['id'], {"status": 'failed'})
         raise HTTPException(status_code=400, detail="Failed to send invitation")
     
     return {
@@ -147,7 +147,7 @@ async def resend_invitation(invitationId = Query(...), user = Depends(verify_tok
     if not invitationId:
         raise HTTPException(status_code=400, detail="invitationId are required")
     
-    invitations = get_invitations_with_users("id", invitationId)
+    invitations = await get_invitations_with_users("id", invitationId)
     if not invitations:
         raise HTTPException(status_code=400, detail="Invitation not found")
     invitation = invitations[0]
@@ -166,7 +166,7 @@ async def resend_invitation(invitationId = Query(...), user = Depends(verify_tok
     token_hash = create_access_token(token_data, period=24*3)
     
     # Update invitation
-    updated_invitation = update_invitation_by_id(invitationId, {"token_hash": token_hash, "status": 'pending'})
+    updated_invitation = await update_invitation_by_id(invitationId, {"token_hash": token_hash, "status": 'pending'})
     
     if updated_invitation is None:
         raise HTTPException(status_code=400, detail="Failed to update invitation")
@@ -181,7 +181,7 @@ async def resend_invitation(invitationId = Query(...), user = Depends(verify_tok
     )
     
     if not re:
-        update_invitation_by_id(invitationId, {"status": 'falied'})
+        await update_invitation_by_id(invitationId, {"status": 'falied'})
         raise HTTPException(status_code=400, detail="Failed to resend invitation")
     
     return {
@@ -202,17 +202,17 @@ async def revoke_invited_user(invitation_id = Query(...), user = Depends(verify_
     if not user['permission'].get("invite", False):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
     
-    existed_invitation = get_invitations("id", invitation_id)
+    existed_invitation = await get_invitations("id", invitation_id)
     if not existed_invitation:
         raise HTTPException(status_code=400, detail="Invitation already exists")
     # Revoke invitation
-    revoke_invitation = update_invitation_by_id(invitation_id, {"status": 'revoked'})
+    revoke_invitation = await update_invitation_by_id(invitation_id, {"status": 'revoked'})
     if not revoke_invitation:
         raise HTTPException(status_code=400, detail="Failed to revoke invitation")
-    invited_user = get_users("email", existed_invitation[0]['invited_email'])
+    invited_user = await get_users("email", existed_invitation[0]['invited_email'])
     if invited_user:
         # Deactivate user
-        user_delete = update_user_by_id(invited_user['id'], {"active": False})
+        user_delete = await update_user_by_id(invited_user['id'], {"active": False})
         if not user_delete:
             raise HTTPException(status_code=400, detail="Failed to revoke invitation")
     return {
@@ -236,7 +236,7 @@ async def validate_invitation(token = Query(...)):
     if not payload:
         raise HTTPException(status_code=401, detail="Expried token")
     
-    invitations = get_invitations_with_users("invited_email", payload.get('email'))
+    invitations = await get_invitations_with_users("invited_email", payload.get('email'))
     if not invitations:
         raise HTTPException(status_code=400, detail="Invitation not found")
     invitation = invitations[0]
@@ -278,7 +278,7 @@ async def complete_invitation(data = Body(...)):
         raise HTTPException(status_code=401, detail="Expried token")
     
     # Validate invitation in DB
-    invitations = get_invitations_with_users("invited_email", payload.get('email'))
+    invitations = await get_invitations_with_users("invited_email", payload.get('email'))
     if not invitations:
         raise HTTPException(status_code=400, detail="Invitation not found")
     invitation = invitations[0]
@@ -299,25 +299,25 @@ async def complete_invitation(data = Body(...)):
         "invited_by": payload.get('invited_by')
     }
 
-    existed_usr = get_users("email", payload.get('email'))
+    existed_usr = await get_users("email", payload.get('email'))
     if existed_usr:
         if existed_usr['active'] == True:
             raise HTTPException(status_code=400, detail="User already exists")
     
     if existed_usr:
-        new_user = update_user_by_id(existed_usr['id'], {"active": True, "password": password, 'role': payload.get('role'), 'invited_by': payload.get('invited_by'), 'company_id': payload.get('company_id'), 'name': name})
+        new_user = await update_user_by_id(existed_usr['id'], {"active": True, "password": password, 'role': payload.get('role'), 'invited_by': payload.get('invited_by'), 'company_id': payload.get('company_id'), 'name': name})
     else:
-        new_user = add_new_user(name, payload.get('email'), password, payload.get('company_id'), payload.get('role'), payload.get('invited_by'))
+        new_user = await add_new_user(name, payload.get('email'), password, payload.get('company_id'), payload.get('role'), payload.get('invited_by'))
     if not new_user:
         raise HTTPException(status_code=400, detail="Failed to create user")
     
     # Mark invitation as accepted
-    updated_invitation = update_invitation_by_id(invitation['id'], {"status": 'accepted'})
+    updated_invitation = await update_invitation_by_id(invitation['id'], {"status": 'accepted'})
     if not updated_invitation:
         raise HTTPException(status_code=400, detail="Failed to update invitation")
     
     # Generate JWT token for new user
-    role_info = get_roles("id", payload.get('role'))
+    role_info = await get_roles("id", payload.get('role'))
     token_data = {
         "sub": new_user["id"],
         "email": new_user["email"],
@@ -5,36 +5,38 @@ import os, json
 from typing import Optional
 from src.vectorize import vectorize_file
 import pandas as pd
-from src.utils.file_utills import generate_file_hash
 from src.utils.chroma_utils import delete_file_vectors
-from db.public_table import get_companies
-from db.company_table import get_all_knowledges, get_knowledge_by_file_hash, add_new_knowledge, update_knowledge_status_by_id, get_knowledge_by_id, delete_knowledge_by_id
+from src.utils.filter_resolver import invalidate_column_filters
+from src.utils.product_table import rebuild_product_table
+from db.tenant_cache import get_cached_company
+from db.async_company_table import get_all_knowledges, get_knowledge_by_file_hash, get_knowledge_by_file_name, add_new_knowledge, update_knowledge_upload_by_id, update_knowledge_status_by_id, get_knowledge_by_id, delete_knowledge_by_id
 import threading
-import io, asyncio
+import hashlib, uuid, asyncio
 
 # Create a new FastAPI router for handling file storage operations
 router = APIRouter()
 
-def run_vectorize_in_thread(file_content, file_name, company_id, record_id, primary_column, company_schema):
-    asyncio.run(vectorize_in_background(file_content, file_name, company_id, record_id, primary_column, company_schema))
+def run_vectorize_in_thread(full_path, file_name, company_id, record_id, primary_column, company_schema, previous_file_hash=None):
+    asyncio.run(vectorize_in_background(full_path, file_name, company_id, record_id, primary_column, company_schema, previous_file_hash))
 
-async def vectorize_in_background(file_content: bytes, file_name: str, company_id: str, record_id: str, primary_column:str, company_schema:str):
+async def vectorize_in_background(full_path: str, file_name: str, company_id: str, record_id: str, primary_column:str, company_schema:str, previous_file_hash: Optional[str] = None):
     """Background task to vectorize uploaded file"""
+    # Runs on a worker thread's own event loop, so use the sync helpers
+    from db.company_table import update_knowledge_status_by_id, update_knowledge_file_hash_by_id
     try:
-        # Convert bytes to BytesIO for vectorize_file function
-        file_io = io.BytesIO(file_content)
-        
-        # Run vectorization
+        # Run vectorization straight from the saved file, so large files are never held in memory
         result = vectorize_file(
-            file_content=file_io,
+            file_content=None,
             file_name=file_name,
             index_name=company_id,
-            primary_column=primary_column
+            primary_column=primary_column,
+            file_path=full_path,
+            previous_file_hash=previous_file_hash
         )
         
-        # Update database record status
+        # Update database record status; the record points at the new version only once it is vectorized
         if result["status"] == "success":
-            update_knowledge_status_by_id(company_schema, record_id, "Completed")
+            update_knowledge_file_hash_by_id(company_schema, record_id, result["file_hash"], "Completed")
         else:
             update_knowledge_status_by_id(company_schema, record_id, "Failed")
             
@@ -42,6 +44,18 @@ async def vectorize_in_background(file_content: bytes, file_name: str, company_i
         print(f"Vectorization failed: {str(e)}")
         update_knowledge_status_by_id(company_schema, record_id, "Failed")
 
+async def save_upload_with_hash(file: UploadFile, path: str, block_size: int = 1024 * 1024) -> str:
+    """Write an upload to `path` block by block and return its hash (same as generate_file_hash)"""
+    digest = hashlib.md5()
+    with open(path, "wb") as f:
+        while True:
+            block = await file.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest()
+
 # ---------------------------
 # ROUTES
 # ---------------------------
@@ -64,14 +78,14 @@ async def get_file_list(
     if not company_id:
         raise HTTPException(status_code=400, detail="Project ID is required")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
     company_schema = company_info["schema_name"]
     
     try:
-        files = get_all_knowledges(company_schema)
+        files = await get_all_knowledges(company_schema)
         return {
             "company_id": company_id,
             "knowledges": files
@@ -100,7 +114,7 @@ async def upload_file(
     if not file or not company_id:
         raise HTTPException(status_code=400, detail="No file provided")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
@@ -108,13 +122,7 @@ async def upload_file(
     primary_column = primary_column.strip("'").replace(" ", "_").replace("-", "_").replace("/", "_").replace("(", "_").replace(")", "_").replace(".", "_").lower()
     selected_columns = json.loads(columns)
     # try:
-    file_content = await file.read()
     file_name = file.filename
-    file_hash = generate_file_hash(file_content)
-    
-    existing_file = get_knowledge_by_file_hash(company_id=company_schema, file_hash=file_hash)
-    if existing_file:
-        raise HTTPException(status_code=400, detail="File already exists")
     
     # Define local save path
     save_dir = os.path.join("files", "knowledges",str(company_id))
@@ -123,11 +131,26 @@ async def upload_file(
     # Build full path for the file
     full_path = os.path.join(save_dir, file_name)
 
-    # Save the file locally
-    with open(full_path, "wb") as f:
-        f.write(file_content)
+    # Stream the upload to a temporary file, hashing it on the way
+    partial_path = f"{full_path}.{uuid.uuid4().hex}.part"
+    try:
+        file_hash = await save_upload_with_hash(file, partial_path)
+        existing_file = await get_knowledge_by_file_hash(company_id=company_schema, file_hash=file_hash)
+        if existing_file:
+            raise HTTPException(status_code=400, detail="File already exists")
+        os.replace(partial_path, full_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
     
-    new_record = add_new_knowledge(company_schema, file_name, file.content_type, file_hash, full_path, "Processing", primary_column, json.dumps(selected_columns))
+    # A new version of an existing file replaces it; only its changed rows are re-embedded
+    previous_file = await get_knowledge_by_file_name(company_schema, file_name)
+    if previous_file:
+        previous_file_hash = previous_file[0]["file_hash"]
+        new_record = await update_knowledge_upload_by_id(company_schema, previous_file[0]["id"], file.content_type, full_path, "Processing", primary_column, json.dumps(selected_columns))
+    else:
+        previous_file_hash = None
+        new_record = await add_new_knowledge(company_schema, file_name, file.content_type, file_hash, full_path, "Processing", primary_column, json.dumps(selected_columns))
     
     if new_record:
         record_id = new_record[0]["id"]
@@ -135,7 +158,7 @@ async def upload_file(
         # Start vectorization in background thread
         thread = threading.Thread(
             target=run_vectorize_in_thread,
-            args=(file_content, file_name, company_id, record_id, primary_column, company_schema)
+            args=(full_path, file_name, company_id, record_id, primary_column, company_schema, previous_file_hash)
         )
         thread.daemon = True
         thread.start()
@@ -147,6 +170,14 @@ async def upload_file(
     # except Exception as e:
     #     raise HTTPException(status_code=500, detail=str(e))
 
+def remove_file_vectors(company_id: str, file_hash: str):
+    """Delete a file's vectors and refresh the tenant's derived indexes (blocking)"""
+    delete_file_vectors(company_id, file_hash)
+    delete_file_vectors(f'{company_id}-columns', file_hash)
+    invalidate_column_filters(company_id)
+    rebuild_product_table(company_id)
+
+
 @router.delete("/remove")
 async def remove_file(
     data = Body(...),
@@ -166,21 +197,21 @@ async def remove_file(
     if not company_id:
         raise HTTPException(status_code=400, detail="No file provided")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
     company_schema = company_info["schema_name"]
     file_id = data["file_id"]
-    file = get_knowledge_by_id(company_schema, file_id)
+    file = await get_knowledge_by_id(company_schema, file_id)
     if not file:
         raise HTTPException(status_code=400, detail="File not found")
     file_name = file[0]["file_name"]
     file_hash = file[0]["file_hash"]
     try:
-        delete_file_vectors(company_id, file_hash)
-        delete_file_vectors(f'{company_id}-columns', file_hash)
-        delete_knowledge_by_id(company_schema, file_id)
+        # ChromaDB deletes and the product table rebuild are blocking, keep them off the event loop
+        await asyncio.to_thread(remove_file_vectors, company_id, file_hash)
+        await delete_knowledge_by_id(company_schema, file_id)
         file_path = file[0]["full_path"]
         os.remove(file_path)
         return {"message": "File removed successfully"}
@@ -197,7 +228,7 @@ async def reprocess_file(
     if not company_id:
         raise HTTPException(status_code=400, detail="No file provided")
 
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
 
@@ -209,7 +240,7 @@ async def reprocess_file(
         raise HTTPException(status_code=400, detail="file_id is required")
 
     # Fetch file record
-    file_info = get_knowledge_by_id(company_schema, file_id)
+    file_info = await get_knowledge_by_id(company_schema, file_id)
     if not file_info:
         raise HTTPException(status_code=404, detail="File not found")
 
@@ -217,27 +248,19 @@ async def reprocess_file(
     full_path = file_info[0]["full_path"]
     primary_column = file_info[0]["primary_column"]
 
-    # Download file from Supabase Storage (as bytes)
-    try:
-        if not os.path.exists(full_path):
-            raise HTTPException(status_code=404, detail="File not found locally")
-
-        # Read file content as bytes
-        with open(full_path, "rb") as f:
-            file_content = f.read()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error downloading file: {str(e)}")
+    if not os.path.exists(full_path):
+        raise HTTPException(status_code=404, detail="File not found locally")
 
     # Process file asynchronously (no local save)
     try:
         thread = threading.Thread(
             target=run_vectorize_in_thread,
-            args=(file_content, file_name, company_id, file_id, primary_column, company_schema),
+            args=(full_path, file_name, company_id, file_id, primary_column, company_schema, file_info[0]["file_hash"]),
             daemon=True
         )
         thread.start()
         
-        update_knowledge_status_by_id(company_schema, file_id, "Processing")
+        await update_knowledge_status_by_id(company_schema, file_id, "Processing")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Background processing failed: {str(e)}")
     
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, Body
 from middleware.auth import verify_token
-from db.public_table import get_companies
+from db.tenant_cache import get_cached_company
 from utils.sustainability import generate_kpi_data
 
 router = APIRouter()
@@ -43,7 +43,7 @@ async def get_kpi_data(
         timespace = 'month'
         period = 'all'
     company_id = user["company_id"]
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
@@ -1,6 +1,6 @@
 # Import necessary modules
 from fastapi import APIRouter, HTTPException, Depends, Body, Query
-from db.public_table import get_users, update_user_by_id, get_users_by_role
+from db.async_public_table import get_users, update_user_by_id, get_users_by_role
 from utils.token_handler import hash_password, verify_password
 from middleware.auth import verify_token
 
@@ -35,7 +35,7 @@ async def update_password(data = Body(...), user = Depends(verify_token)):
         raise HTTPException(status_code=400, detail="Current and new password are required")
     
     # Retrieve user from database by ID
-    request_user = get_users("id", user['id'])
+    request_user = await get_users("id", user['id'])
     if not user:
         raise HTTPException(status_code=401, detail="You are not authorized to perform this action")
     
@@ -44,7 +44,7 @@ async def update_password(data = Body(...), user = Depends(verify_token)):
         raise HTTPException(status_code=500, detail="Current password is incorrect")
     
     # Update the password in the database
-    updated_user = update_user_by_id(user['id'], {"password": new_password})
+    updated_user = await update_user_by_id(user['id'], {"password": new_password})
     if not updated_user:
         raise HTTPException(status_code=500, detail="Failed to update password")
     
@@ -73,7 +73,7 @@ async def update_profile(data = Body(...), user = Depends(verify_token)):
         raise HTTPException(status_code=400, detail="Name is required")
 
     # Update the name in the database
-    updated_user = update_user_by_id(user['id'], {"name": new_name})
+    updated_user = await update_user_by_id(user['id'], {"name": new_name})
     if not updated_user:
         raise HTTPException(status_code=401, detail="Failed to update profile")
 
@@ -103,7 +103,7 @@ async def get_users_by_role_endpoint(role: str = Query(...), user = Depends(veri
         raise HTTPException(status_code=400, detail="Role name is required")
 
     # Get users by role for the authenticated user's company
-    users = get_users_by_role(role, user['company_id'])
+    users = await get_users_by_role(role, user['company_id'])
 
     return {
         "message": f"Users with role '{role}' retrieved successfully",
@@ -1,16 +1,12 @@
 import os, io
 import json
-import threading
 import asyncio
 from fastapi import APIRouter, HTTPException, Request, Query
-from db.public_table import get_companies, get_integration_by_phone_number_id
-from db.company_table import (
-    get_conversatin_by_phone_integration,
-    add_new_conversation,
-    add_new_message
-)
+from db.tenant_cache import get_cached_integration_by_phone_number_id
 from utils.waca import get_media_with_id, download_whatsapp_media
 from utils.stt import speech_to_text_with_path
+from utils.job_queue import job_queue
+from utils.conversation_mailbox import mailbox
 router = APIRouter()
 
 # ---------------------------
@@ -32,7 +28,7 @@ async def verify_webhook(
     We need to verify the token and return the challenge to complete the verification.
     """
     # Verify that the phone_number_id exists in our system
-    integration = get_integration_by_phone_number_id(phone_number_id)
+    integration = await get_cached_integration_by_phone_number_id(phone_number_id)
     if not integration:
         print(f"❌ Webhook verification failed: No integration found for phone_number_id: {phone_number_id}")
         raise HTTPException(status_code=404, detail="Phone number ID not found")
@@ -58,7 +54,7 @@ async def handle_webhook(phone_number_id: str, request: Request):
         print(f"📩 Received webhook for phone_number_id {phone_number_id}:", json.dumps(body, indent=2))
 
         # Verify that the phone_number_id exists in our system
-        integration = get_integration_by_phone_number_id(phone_number_id)
+        integration = await get_cached_integration_by_phone_number_id(phone_number_id)
         if not integration:
             print(f"❌ No integration found for phone_number_id: {phone_number_id}")
             # Return 200 to prevent WhatsApp from retrying
@@ -91,13 +87,9 @@ async def handle_webhook(phone_number_id: str, request: Request):
                             # Still process the message using the URL parameter as the source of truth
 
                         for message in messages:
-                            # Process message in background
-                            thread = threading.Thread(
-                                target=process_waca_message,
-                                args=(message, contacts, phone_number_id)
-                            )
-                            thread.daemon = True
-                            thread.start()
+                            # Process message on the bounded job queue
+                            if not job_queue.submit("waca.message", integration["company_id"], message=message, contacts=contacts, phone_number_id=phone_number_id):
+                                print(f"⚠️ Job queue full, dropping message {message.get('id')} for phone_number_id: {phone_number_id}")
 
                     # Handle status updates (optional)
                     if "statuses" in value:
@@ -113,28 +105,20 @@ async def handle_webhook(phone_number_id: str, request: Request):
         return {"status": "error", "message": str(e)}
 
 
-def process_waca_message(message: dict, contacts:list[dict], phone_number_id: str):
-    """
-    Process incoming WhatsApp message in a background thread.
-
-    Args:
-        message: The message object from WhatsApp
-        phone_number_id: The phone number ID that received the message
-    """
-    asyncio.run(process_waca_message_async(message, contacts, phone_number_id))
-
-
 async def process_waca_message_async(message: dict, contacts:list[dict], phone_number_id: str):
     """
     Async function to process WhatsApp message.
     """
     try:
-        from routers.chat import run_response_in_thread, run_response_for_image_in_thread
+        # Runs on a job worker's event loop next to other jobs: the sync helpers and
+        # the WhatsApp HTTP calls go through asyncio.to_thread so they never stall it
+        from db.tenant_cache import get_cached_company_sync, get_cached_integration_by_phone_number_id_sync
+        from db.company_table import get_conversatin_by_phone_integration, add_new_conversation, add_new_message
         import httpx
         import io
 
         # Get integration by phone_number_id
-        integration = get_integration_by_phone_number_id(phone_number_id)
+        integration = await asyncio.to_thread(get_cached_integration_by_phone_number_id_sync, phone_number_id)
         if not integration:
             print(f"❌ No integration found for phone_number_id: {phone_number_id}")
             return
@@ -147,7 +131,7 @@ async def process_waca_message_async(message: dict, contacts:list[dict], phone_n
         api_key = integration['instance_name']  # API key is stored in instance_name for WACA
         phone_number_id = integration['phone_number_id']
         # Get company info
-        company_info = get_companies("id", company_id)
+        company_info = await asyncio.to_thread(get_cached_company_sync, company_id)
         if not company_info:
             print(f"❌ Company not found: {company_id}")
             return
@@ -163,7 +147,6 @@ async def process_waca_message_async(message: dict, contacts:list[dict], phone_n
         # Extract message content based on type
         content = ""
         file_images = []
-        file_content = ""
         if message_type == "text":
             content = message.get("text", {}).get("body", "")
 
@@ -172,7 +155,7 @@ async def process_waca_message_async(message: dict, contacts:list[dict], phone_n
             image_data = message.get("image", {})
             image_id = image_data.get("id")
             caption = image_data.get("caption", "")
-            media = get_media_with_id(api_key, phone_number_id, image_id)
+            media = await asyncio.to_thread(get_media_with_id, api_key, phone_number_id, image_id)
             if not media["success"]:
                 print(media["error"])
                 return
@@ -182,10 +165,8 @@ async def process_waca_message_async(message: dict, contacts:list[dict], phone_n
             file_name = f'{image_id}.jpg'
             full_path = os.path.join(save_dir, file_name)
             content = caption or "Image received"
-            if not download_whatsapp_media(media["data"]["url"], api_key, full_path):
+            if not await asyncio.to_thread(download_whatsapp_media, media["data"]["url"], api_key, full_path):
                 return
-            with open(full_path, "rb") as f:
-                file_content = f.read()
             file_images.append(full_path)
             # Download image and process
             # TODO: Implement image download and processing
@@ -195,7 +176,7 @@ async def process_waca_message_async(message: dict, contacts:list[dict], phone_n
             # Handle voice messages
             audio_data = message.get("audio") or message.get("voice", {})
             audio_id = audio_data.get("id")
-            media = get_media_with_id(api_key, phone_number_id, audio_id)
+            media = await asyncio.to_thread(get_media_with_id, api_key, phone_number_id, audio_id)
             if not media["success"]:
                 print(media["error"])
                 return
@@ -204,9 +185,9 @@ async def process_waca_message_async(message: dict, contacts:list[dict], phone_n
             os.makedirs(save_dir, exist_ok=True)
             file_name = f'{audio_id}.wav'
             full_path = os.path.join(save_dir, file_name)
-            if not download_whatsapp_media(media["data"]["url"], api_key, full_path):
+            if not await asyncio.to_thread(download_whatsapp_media, media["data"]["url"], api_key, full_path):
                 return
-            content = speech_to_text_with_path(full_path)
+            content = await asyncio.to_thread(speech_to_text_with_path, full_path)
             # TODO: Implement voice message download and transcription
             print(f"🎤 Voice message received: {audio_id}")
 
@@ -225,14 +206,15 @@ async def process_waca_message_async(message: dict, contacts:list[dict], phone_n
             return
 
         # Get or create conversation
-        conversation = get_conversatin_by_phone_integration(company_schema, from_number, phone_number_id)
+        conversation = await asyncio.to_thread(get_conversatin_by_phone_integration, company_schema, from_number, phone_number_id)
 
         if not conversation:
             # Create new conversation
             contact_name = message.get("profile", {}).get("name", from_number)
             if contacts:
                 contact_name = contacts[0].get("profile", {}).get("name", from_number)
-            new_conversation = add_new_conversation(
+            new_conversation = await asyncio.to_thread(
+                add_new_conversation,
                 company_schema,
                 contact_name,
                 "WACA",
@@ -253,7 +235,8 @@ async def process_waca_message_async(message: dict, contacts:list[dict], phone_n
         extra_data = {"images":file_images}
         extra_data = f'{extra_data}'.replace('\'', '\"')
         # Add message to database
-        messages = add_new_message(
+        messages = await asyncio.to_thread(
+            add_new_message,
             company_id=company_schema,
             conversation_id=conversation_id,
             sender_email="",
@@ -269,31 +252,28 @@ async def process_waca_message_async(message: dict, contacts:list[dict], phone_n
         # Generate AI response if enabled
         if conversation_ai_reply:
             if message_type == "image":
-                file_io = io.BytesIO(file_content)
-                # Start vectorization in background thread
-                thread = threading.Thread(
-                    target=run_response_for_image_in_thread,
-                    args=(conversation_id, company_id, company_schema, content, phone_number_id, from_number, "WACA", file_io)
+                accepted = mailbox.post(
+                    conversation_id, company_id, "chat.image_reply", content, coalesce=False,
+                    company_id=company_id,
+                    company_schema=company_schema,
+                    instance_name=phone_number_id,
+                    phone_number=from_number,
+                    platform="WACA",
+                    image_path=file_images[0]
                 )
-                thread.daemon = True
-                thread.start()
             else:
                 # Generate text response
-                thread = threading.Thread(
-                    target=run_response_in_thread,
-                    args=(
-                        conversation_id,
-                        company_id,
-                        company_schema,
-                        content,
-                        phone_number_id,  # instance_name for WACA is phone_number_id
-                        from_number,
-                        "Text",
-                        "WACA"  # Platform identifier for WACA
-                    )
+                accepted = mailbox.post(
+                    conversation_id, company_id, "chat.reply", content,
+                    company_id=company_id,
+                    company_schema=company_schema,
+                    instance_name=phone_number_id,  # instance_name for WACA is phone_number_id
+                    phone_number=from_number,
+                    message_type="Text",
+                    platform="WACA"  # Platform identifier for WACA
                 )
-                thread.daemon = True
-                thread.start()
+            if not accepted:
+                print(f"⚠️ Too many pending messages, no AI reply for message: {message_id}")
 
         print(f"✅ Message processed successfully: {message_id}")
 
@@ -301,3 +281,7 @@ async def process_waca_message_async(message: dict, contacts:list[dict], phone_n
         print(f"❌ Error processing message: {e}")
         import traceback
         traceback.print_exc()
+
+
+# Webhook messages are processed on the bounded job queue (utils.job_queue)
+job_queue.register("waca.message", process_waca_message_async)
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, Body, Query, Form, File, UploadFile
 from middleware.auth import verify_token
-from db.company_table import add_new_workflow, get_all_workflows, get_workflow_by_id, update_workflow_by_id, delete_workflow_by_id, update_workflow_for_enable_except_by_id
-from db.public_table import get_companies, get_integrations
+from db.async_company_table import add_new_workflow, get_all_workflows, get_workflow_by_id, update_workflow_by_id, delete_workflow_by_id, update_workflow_for_enable_except_by_id
+from db.async_public_table import get_integrations
+from db.tenant_cache import get_cached_company
 from src.workflow.confirm import confirm_workflows
 import json, os
 from typing import Optional, List
@@ -27,7 +28,7 @@ async def create_workflow(
     if not name or not nodes or not company_id:
         raise HTTPException(status_code=400, detail="Missing required fields")
     
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
@@ -36,7 +37,7 @@ async def create_workflow(
     edges = json.loads(edges)
     result, warning_message = confirm_workflows({"nodes":nodes, 'edges':edges})
     status = "Success" if result else "Error"
-    new_record = add_new_workflow(company_schema, name, json.dumps(nodes), json.dumps(edges), status)
+    new_record = await add_new_workflow(company_schema, name, json.dumps(nodes), json.dumps(edges), status)
     if new_record:
         if files:
             for file in files:
@@ -69,11 +70,11 @@ async def get_workflow_list(user = Depends(verify_token)):
     if not user['permission'].get("workflow", False):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
     company_id = user["company_id"]
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
-    workflows = get_all_workflows(company_schema)
+    workflows = await get_all_workflows(company_schema)
     return {
         "status": 'success',
         "workflows": workflows
@@ -84,11 +85,11 @@ async def get_workflow(workflow_id: str = Query(...), user = Depends(verify_toke
     if not user['permission'].get("workflow", False):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
     company_id = user["company_id"]
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
-    workflow = get_workflow_by_id(company_schema, workflow_id)
+    workflow = await get_workflow_by_id(company_schema, workflow_id)
     return {
         "status": 'success',
         "workflow": workflow[0]
@@ -106,7 +107,7 @@ async def update_workflow(
     if not user['permission'].get("workflow", False):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
     company_id = user["company_id"]
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
@@ -116,12 +117,12 @@ async def update_workflow(
     
     nodes = json.loads(nodes)
     edges = json.loads(edges)
-    workflow = get_workflow_by_id(company_schema, workflow_id)
+    workflow = await get_workflow_by_id(company_schema, workflow_id)
     if not workflow:
         raise HTTPException(status_code=400, detail="Workflow not found")
     result, warning_message = confirm_workflows({"nodes":nodes, 'edges':edges})
     status = "Success" if result else "Error"
-    updated_workflow = update_workflow_by_id(company_schema, workflow_id, name, json.dumps(nodes), json.dumps(edges), status)
+    updated_workflow = await update_workflow_by_id(company_schema, workflow_id, name, json.dumps(nodes), json.dumps(edges), status)
     if updated_workflow:
         if files:
             for file in files:
@@ -155,15 +156,15 @@ async def delete_workflow(data = Body(...), user = Depends(verify_token)):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
     workflow_id = data['workflow_id']
     company_id = user["company_id"]
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
-    workflow = get_workflow_by_id(company_schema, workflow_id)
+    workflow = await get_workflow_by_id(company_schema, workflow_id)
     if not workflow:
         raise HTTPException(status_code=400, detail="Workflow not found")
     
-    deleted_workflow = delete_workflow_by_id(company_schema, workflow_id)
+    deleted_workflow = await delete_workflow_by_id(company_schema, workflow_id)
     if deleted_workflow:
         return {
             "status": 'success',
@@ -177,7 +178,7 @@ async def update_workflow(data = Body(...), user = Depends(verify_token)):
     if not user['permission'].get("workflow", False):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
     company_id = user["company_id"]
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
@@ -185,10 +186,10 @@ async def update_workflow(data = Body(...), user = Depends(verify_token)):
     if not workflow_id:
         raise HTTPException(status_code=400, detail="Missing required fields")
     
-    workflow = get_workflow_by_id(company_schema, workflow_id)
+    workflow = await get_workflow_by_id(company_schema, workflow_id)
     if not workflow:
         raise HTTPException(status_code=400, detail="Workflow not found")
-    updated_workflow = update_workflow_for_enable_except_by_id(company_schema, workflow_id, not workflow[0]['enable_workflow'], workflow[0]['except_case'])
+    updated_workflow = await update_workflow_for_enable_except_by_id(company_schema, workflow_id, not workflow[0]['enable_workflow'], workflow[0]['except_case'])
     if updated_workflow:
         return {
             "status": 'success',
@@ -202,7 +203,7 @@ async def update_workflow(data = Body(...), user = Depends(verify_token)):
     if not user['permission'].get("workflow", False):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
     company_id = user["company_id"]
-    company_info = get_companies("id", company_id)
+    company_info = await get_cached_company(company_id)
     if not company_info:
         raise HTTPException(status_code=400, detail="Company not found")
     company_schema = company_info["schema_name"]
@@ -211,10 +212,10 @@ async def update_workflow(data = Body(...), user = Depends(verify_token)):
     if not workflow_id:
         raise HTTPException(status_code=400, detail="Missing required fields")
     
-    workflow = get_workflow_by_id(company_schema, workflow_id)
+    workflow = await get_workflow_by_id(company_schema, workflow_id)
     if not workflow:
         raise HTTPException(status_code=400, detail="Workflow not found")
-    updated_workflow = update_workflow_for_enable_except_by_id(company_schema, workflow_id, workflow[0]['enable_workflow'], except_case)
+    updated_workflow = await update_workflow_for_enable_except_by_id(company_schema, workflow_id, workflow[0]['enable_workflow'], except_case)
     if updated_workflow:
         return {
             "status": 'success',
@@ -226,7 +227,7 @@ async def update_workflow(data = Body(...), user = Depends(verify_token)):
 async def get_all_integrations(user = Depends(verify_token)):
     if not user['permission'].get("integration", False):
         raise HTTPException(status_code=400, detail="You are not authorized to perform this action")
-    integrations = get_integrations({"company_id": user["company_id"], 'delete': False})
+    integrations = await get_integrations({"company_id": user["company_id"], 'delete': False})
     if not integrations:
         return {
             "integrations":[]
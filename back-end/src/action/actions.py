@@ -3,10 +3,10 @@ from langchain_core.tools import StructuredTool
 from pydantic import BaseModel, Field
 
 from src.utils.chroma_utils import search_vectors_product
-from db.company_table import get_linked_images_from_table, update_customer_with_key, get_linked_extra_from_table, get_customer_by_id, add_new_customer, update_customer, update_conversation_by_id
+from db.company_table import update_customer_with_key, get_customer_by_id, add_new_customer, update_customer, update_conversation_by_id
+from db.linked_assets import get_linked_assets, normalize_product_key
 import os
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
 
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
@@ -17,10 +17,11 @@ llm_bot = ChatOpenAI(
 
 extra_info_conversations = {}
 
-async def get_linked_info(retrieval_results: list[dict], company_schema: str, conversation_id: str):
-    global extra_info_conversations
+def collect_linked_info(retrieval_results: list[dict], company_schema: str) -> dict:
+    """Images and documents linked to the retrieved products (sync DB helpers)"""
     extra_info = {"images": [], "extra": []}
     seen = set()
+    product_ids = []
 
     for r in retrieval_results:
         pc_text = r["metadata"]["pc_text"]
@@ -28,28 +29,30 @@ async def get_linked_info(retrieval_results: list[dict], company_schema: str, co
             continue
         seen.add(pc_text)
         primary_col = r["metadata"]["pc_primary_column"]
+        product_ids.append(r["metadata"].get(primary_col))
 
-        image_linked = get_linked_images_from_table(
-            company_id=company_schema,
-            product_id=r["metadata"][primary_col],
-        )
-        document_linked = get_linked_extra_from_table(
-            company_id=company_schema,
-            product_id=r["metadata"][primary_col],
-        )
-        try:
-            if image_linked:
-                extra_info["images"].append(image_linked[0]["full_path"])
-            if document_linked:
-                extra_info["extra"].append(document_linked[0]["full_path"])
-        except Exception:
-            pass
+    # One indexed lookup per table for all products
+    linked = get_linked_assets(company_schema, product_ids)
+    for product_id in product_ids:
+        if product_id is None:
+            continue
+        key = normalize_product_key(product_id)
+        if linked["images"].get(key):
+            extra_info["images"].append(linked["images"][key])
+        if linked["extra"].get(key):
+            extra_info["extra"].append(linked["extra"][key])
 
     extra_info["images"] = list(set(extra_info["images"]))
-    extra_info_conversations[conversation_id] = extra_info
+    return extra_info
 
-def search_vectors_with_query(query: str, company_id: str, conversation_id: str, company_schema: str):
-    results, differentiating_features = search_vectors_product(
+async def get_linked_info(retrieval_results: list[dict], company_schema: str, conversation_id: str):
+    # The DB lookups run on a worker thread, so the caller's event loop keeps serving other conversations
+    extra_info_conversations[conversation_id] = await asyncio.to_thread(collect_linked_info, retrieval_results, company_schema)
+
+async def search_vectors_with_query(query: str, company_id: str, conversation_id: str, company_schema: str):
+    """Product search tool: ChromaDB search and DB lookups run off the event loop"""
+    results, differentiating_features = await asyncio.to_thread(
+        search_vectors_product,
         index_name=company_id,
         query_text=query,
         company_id=company_id,
@@ -63,18 +66,7 @@ def search_vectors_with_query(query: str, company_id: str, conversation_id: str,
         return f"Need more details. Please clarify: {differentiating_features}"
 
     retrieval_results = [r["metadata"]["pc_text"] for r in results]
-
-    # Async image linking
-    def run_async():
-        new_loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(new_loop)
-        try:
-            new_loop.run_until_complete(get_linked_info(results, company_schema, conversation_id))
-        finally:
-            new_loop.close()
-
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        executor.submit(run_async).result()
+    await get_linked_info(results, company_schema, conversation_id)
 
     return list(set(retrieval_results))
 
@@ -88,7 +80,7 @@ def make_search_tool(company_id: str, conversation_id: str, company_schema: str)
     return StructuredTool(
         name="search_vectors_with_query",
         description="Search the vector database to find the most relevant products based on the user’s natural language query or product requirements. The input query should include as many specific product details as possible to improve search accuracy and relevance.",
-        func=lambda query: search_vectors_with_query(
+        coroutine=lambda query: search_vectors_with_query(
             query=query,
             company_id=company_id,
             conversation_id=conversation_id,
@@ -167,12 +159,16 @@ def get_customer_info_tool( conversation_id: str, company_schema: str):
                 customer_phone=customer_phone,
             )
 
+        async def aupdate_existing_customer(customer_name: str, customer_email: str, customer_phone: str):
+            return await asyncio.to_thread(update_existing_customer, customer_name, customer_email, customer_phone)
+
         return asking_prompt, StructuredTool(
             name="update_customer_info",
             description=(
                 "Extract customer information such as name, email, and phone number from the conversation. Any field not found must be returned as an empty string."
             ),
             func=update_existing_customer,
+            coroutine=aupdate_existing_customer,
             args_schema=CustomerInfoInput,
         )
 
@@ -188,11 +184,15 @@ def get_customer_info_tool( conversation_id: str, company_schema: str):
                 customer_phone=customer_phone,
             )
 
+        async def acreate_new_customer(customer_name: str | None, customer_email: str | None, customer_phone: str | None):
+            return await asyncio.to_thread(create_new_customer, customer_name, customer_email, customer_phone)
+
         return "---------------\n First of all, ask name, email, and phone number.", StructuredTool(
             name="update_customer_info",
             description=(
                 "Store customer information such as name, email, and phone number from the conversation. Any field not found must be returned as an empty string."
                 ),
             func=create_new_customer,
+            coroutine=acreate_new_customer,
             args_schema=CustomerInfoInput,
         )
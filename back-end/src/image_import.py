@@ -0,0 +1,419 @@
+"""
+Bulk import of product image catalogs (ZIP archives or many image files).
+
+/image/upload handles one image per request: a hash lookup, a thread, a CLIP
+pass and a ChromaDB write each. A bulk import instead:
+
+- stores the uploaded archives and files under IMAGE_IMPORT_DIR/<import_id>/
+  (outside the public files/ mount) and lists the archive entries from the ZIP
+  central directory; entries are read one batch at a time, never the whole archive,
+- decodes, converts, hashes and downscales images in a process pool of
+  IMAGE_IMPORT_WORKERS (prepare_catalog_image),
+- embeds each batch of IMAGE_IMPORT_BATCH_SIZE images through the shared image
+  encoder while the pool already decodes the next batch,
+- writes each batch to ChromaDB (store_image_embeddings) and the images table
+  (add_new_images) in bulk.
+
+Progress lives in a SQLite manifest per import (one row per entry: pending,
+done, duplicate or failed), updated after every batch. An interrupted import
+resumes from its pending entries (/image/bulk-upload/{import_id}/resume);
+entries written to ChromaDB and the images table are found again by hash and
+file name instead of being added twice.
+
+Duplicates follow /image/upload: the same file name and content is skipped,
+the same content under a new name gets a row that reuses the stored file and vector.
+Different images with the same file name (red/shirt.jpg and blue/shirt.jpg) keep
+their file name, but the later one is stored as shirt-<hash prefix>.jpg so it
+does not overwrite the earlier file.
+"""
+import os
+import re
+import time
+import json
+import uuid
+import shutil
+import sqlite3
+import zipfile
+import mimetypes
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from src.image_vectorize import image_encoder, store_image_embeddings
+from src.utils.file_utills import prepare_catalog_image, generate_file_hash_from_stream
+from src.utils.image_hash import image_fingerprint
+from db.linked_assets import product_key_from_file_name, invalidate_linked_assets
+
+load_dotenv()
+
+IMAGE_IMPORT_DIR = os.getenv("IMAGE_IMPORT_DIR", "./image_imports")
+IMAGE_IMPORT_WORKERS = int(os.getenv("IMAGE_IMPORT_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+IMAGE_IMPORT_BATCH_SIZE = int(os.getenv("IMAGE_IMPORT_BATCH_SIZE", "64"))
+IMAGE_IMPORT_MAX_FILE_BYTES = int(os.getenv("IMAGE_IMPORT_MAX_FILE_BYTES", str(25 * 1024 * 1024)))
+
+# An import whose runner has not reported progress for this long is treated as interrupted
+IMAGE_IMPORT_STALE_SECONDS = 600
+
+# Entries of an archive that are imported
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff"}
+
+_IMPORT_ID = re.compile(r"[0-9a-f]{32}")
+
+_running: set = set()
+_running_lock = threading.Lock()
+
+
+# -------------------------------------------------------------------
+# Progress manifest
+# -------------------------------------------------------------------
+class ImportManifest:
+    """Entries and progress of one import, stored in IMAGE_IMPORT_DIR/<import_id>/manifest.db"""
+
+    def __init__(self, import_id: str, directory: str = IMAGE_IMPORT_DIR):
+        if not _IMPORT_ID.fullmatch(import_id):
+            raise ValueError("Invalid import id")
+        self.import_id = import_id
+        self.directory = os.path.join(directory, import_id)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.directory, "sources"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.directory, "manifest.db"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, kind TEXT NOT NULL, name TEXT NOT NULL)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                name TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                file_name TEXT,
+                file_hash TEXT,
+                record_id TEXT,
+                error TEXT,
+                UNIQUE (source, name)
+            )
+            """
+        )
+
+    @classmethod
+    def exists(cls, import_id: str, directory: str = IMAGE_IMPORT_DIR) -> bool:
+        return bool(_IMPORT_ID.fullmatch(import_id)) and os.path.exists(os.path.join(directory, import_id, "manifest.db"))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---- meta ----
+    def get_meta(self) -> Dict[str, Any]:
+        with self._lock:
+            return {key: json.loads(value) for key, value in self._conn.execute("SELECT key, value FROM meta")}
+
+    def set_meta(self, **values):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO meta VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                [(key, json.dumps(value)) for key, value in values.items()],
+            )
+
+    # ---- sources and entries ----
+    def source_path(self, name: str) -> str:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+        return os.path.join(self.directory, "sources", f"{count:05d}_{os.path.basename(name)}")
+
+    def add_source(self, path: str, name: str):
+        kind = "zip" if zipfile.is_zipfile(path) else "file"
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO sources VALUES (?, ?, ?)", (path, kind, name))
+
+    def sources(self) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute("SELECT path, kind, name FROM sources ORDER BY path").fetchall()
+
+    def add_entries(self, entries: List[tuple]):
+        """Register (source, name) entries; already known ones keep their status"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR IGNORE INTO entries (source, name) VALUES (?, ?)", entries)
+            self._conn.execute("COMMIT")
+
+    def pending(self) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute("SELECT id, source, name FROM entries WHERE status = 'pending' ORDER BY id").fetchall()
+
+    def mark(self, results: List[tuple]):
+        """Record (entry_id, status, file_name, file_hash, record_id, error) results in one transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE entries SET status = ?, file_name = ?, file_hash = ?, record_id = ?, error = ? WHERE id = ?",
+                [(status, file_name, file_hash, record_id, error, entry_id) for entry_id, status, file_name, file_hash, record_id, error in results],
+            )
+            self._conn.execute("COMMIT")
+
+    def progress(self, max_errors: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM entries GROUP BY status").fetchall())
+            errors = self._conn.execute(
+                "SELECT name, error FROM entries WHERE status = 'failed' ORDER BY id LIMIT ?", (max_errors,)
+            ).fetchall()
+        total = sum(counts.values())
+        return {
+            "total": total,
+            "pending": counts.get("pending", 0),
+            "done": counts.get("done", 0),
+            "duplicate": counts.get("duplicate", 0),
+            "failed": counts.get("failed", 0),
+            "errors": [{"name": name, "error": error} for name, error in errors],
+        }
+
+
+# -------------------------------------------------------------------
+# Reading entries
+# -------------------------------------------------------------------
+def is_image_entry(name: str) -> bool:
+    base = os.path.basename(name)
+    return (
+        bool(base)
+        and not base.startswith(".")
+        and not name.startswith("__MACOSX/")
+        and os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+    )
+
+
+def scan_sources(manifest: ImportManifest) -> int:
+    """List the image entries of every source into the manifest (archives: central directory only)"""
+    entries = []
+    for path, kind, name in manifest.sources():
+        if kind == "zip":
+            with zipfile.ZipFile(path) as archive:
+                entries.extend((path, info.filename) for info in archive.infolist() if not info.is_dir() and is_image_entry(info.filename))
+        else:
+            entries.append((path, name))
+    manifest.add_entries(entries)
+    return len(entries)
+
+
+class EntryReader:
+    """Reads single entries from the sources of an import, keeping archives open"""
+
+    def __init__(self):
+        self._archives: Dict[str, Optional[zipfile.ZipFile]] = {}
+
+    def read(self, source: str, name: str) -> bytes:
+        if source not in self._archives:
+            self._archives[source] = zipfile.ZipFile(source) if zipfile.is_zipfile(source) else None
+        archive = self._archives[source]
+        if archive is not None:
+            info = archive.getinfo(name)
+            if info.file_size > IMAGE_IMPORT_MAX_FILE_BYTES:
+                raise ValueError(f"File larger than {IMAGE_IMPORT_MAX_FILE_BYTES} bytes")
+            return archive.read(info)
+        if os.path.getsize(source) > IMAGE_IMPORT_MAX_FILE_BYTES:
+            raise ValueError(f"File larger than {IMAGE_IMPORT_MAX_FILE_BYTES} bytes")
+        with open(source, "rb") as f:
+            return f.read()
+
+    def close(self):
+        for archive in self._archives.values():
+            if archive is not None:
+                archive.close()
+        self._archives.clear()
+
+
+# -------------------------------------------------------------------
+# Import
+# -------------------------------------------------------------------
+def _submit_batch(pool: ProcessPoolExecutor, reader: EntryReader, batch: List[tuple]) -> List[tuple]:
+    """Read a batch of entries and start decoding them in the pool: [(entry, future or error)]"""
+    submitted = []
+    for entry_id, source, name in batch:
+        try:
+            data = reader.read(source, name)
+            submitted.append(((entry_id, source, name), pool.submit(prepare_catalog_image, data, os.path.basename(name).lower())))
+        except Exception as e:
+            submitted.append(((entry_id, source, name), e))
+    return submitted
+
+
+def stored_image_path(save_dir: str, file_name: str, file_hash: str) -> str:
+    """Path for a new image file; a name already taken by other content gets a content hash suffix"""
+    full_path = os.path.join(save_dir, file_name)
+    if not os.path.exists(full_path):
+        return full_path
+    # The same content (e.g. written by an import interrupted before its rows were added) keeps its path
+    with open(full_path, "rb") as f:
+        if generate_file_hash_from_stream(f) == file_hash:
+            return full_path
+    stem, extension = os.path.splitext(file_name)
+    return os.path.join(save_dir, f"{stem}-{file_hash[:12]}{extension}")
+
+
+def _store_batch(manifest: ImportManifest, meta: Dict[str, Any], submitted: List[tuple]) -> Dict[str, int]:
+    """Embed and store one decoded batch; every entry of the batch ends up marked"""
+    from db.company_table import get_images_by_file_hashes, add_new_images
+
+    company_id, company_schema, match_field = meta["company_id"], meta["company_schema"], meta["match_field"]
+    save_dir = os.path.join("files", "images", str(company_id))
+    os.makedirs(save_dir, exist_ok=True)
+
+    results, prepared = [], []
+    for entry, outcome in submitted:
+        try:
+            if isinstance(outcome, Exception):
+                raise outcome
+            prepared.append((entry, outcome.result()))
+        except Exception as e:
+            results.append((entry[0], "failed", None, None, None, str(e)))
+
+    known: Dict[str, List[dict]] = {}
+    for row in get_images_by_file_hashes(company_schema, list({file_hash for _, (_, _, file_hash, _) in prepared})):
+        known.setdefault(row["file_hash"], []).append(row)
+
+    rows, embed = [], {}
+    for entry, (content, file_name, file_hash, pixels) in prepared:
+        same_hash = known.setdefault(file_hash, [])
+        existing = next((row for row in same_hash if row["file_name"] == file_name), None)
+        if existing is not None:
+            record_id = str(existing["id"]) if existing.get("id") else None
+            results.append((entry[0], "duplicate", file_name, file_hash, record_id, None))
+            continue
+        if same_hash:
+            full_path, status = same_hash[0]["full_path"], same_hash[0]["status"]
+        else:
+            full_path, status = stored_image_path(save_dir, file_name, file_hash), "Completed"
+            # Renamed into place, so an interrupted write never leaves a truncated file under the name
+            with open(f"{full_path}.partial", "wb") as f:
+                f.write(content)
+            os.replace(f"{full_path}.partial", full_path)
+            phash, colour = image_fingerprint(pixels)
+            embed[file_hash] = {"pixels": pixels, "phash": phash, "colour": colour, "file_name": file_name, "file_hash": file_hash, "match_field": match_field, "full_path": full_path}
+        row = {
+            "entry_id": entry[0],
+            "file_name": file_name,
+            "file_type": mimetypes.guess_type(file_name)[0] or "image/jpeg",
+            "file_hash": file_hash,
+            "full_path": full_path,
+            "status": status,
+            "match_field": match_field,
+            "product_key": product_key_from_file_name(file_name),
+        }
+        rows.append(row)
+        same_hash.append(row)
+
+    # One batched forward pass for the new images of the batch
+    futures = {file_hash: image_encoder.submit(image.pop("pixels")) for file_hash, image in embed.items()}
+    failed_hashes = {}
+    for file_hash, future in futures.items():
+        try:
+            embed[file_hash]["embedding"] = future.result()
+        except Exception as e:
+            failed_hashes[file_hash] = str(e)
+    store_image_embeddings(f"{company_id}-image", [image for file_hash, image in embed.items() if file_hash not in failed_hashes])
+
+    stored = [row for row in rows if row["file_hash"] not in failed_hashes]
+    results.extend((row["entry_id"], "failed", row["file_name"], row["file_hash"], None, failed_hashes[row["file_hash"]]) for row in rows if row["file_hash"] in failed_hashes)
+    records = add_new_images(company_schema, stored) if stored else []
+    if stored and not records:
+        results.extend((row["entry_id"], "failed", row["file_name"], row["file_hash"], None, "Failed to add database record") for row in stored)
+    else:
+        results.extend((row["entry_id"], "done", row["file_name"], row["file_hash"], str(record["id"]), None) for row, record in zip(stored, records))
+    manifest.mark(results)
+    if records:
+        invalidate_linked_assets(company_schema)
+    return {"embedded": len(embed) - len(failed_hashes), "stored": len(records)}
+
+
+def new_image_import(company_id: str, company_schema: str, match_field: str) -> ImportManifest:
+    """Create the manifest of a new import; the caller adds its sources"""
+    manifest = ImportManifest(uuid.uuid4().hex)
+    manifest.set_meta(company_id=str(company_id), company_schema=company_schema, match_field=match_field, status="uploading", created_at=time.time())
+    return manifest
+
+
+def run_image_import(import_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Import (or resume importing) the pending entries of an import.
+
+    Returns:
+        The final progress, or None when the import is already running in this process
+    """
+    with _running_lock:
+        if import_id in _running:
+            return None
+        _running.add(import_id)
+    manifest = ImportManifest(import_id)
+    reader = EntryReader()
+    try:
+        meta = manifest.get_meta()
+        manifest.set_meta(status="processing", started_at=time.time(), heartbeat=time.time())
+        if not meta.get("scanned"):
+            scan_sources(manifest)
+            manifest.set_meta(scanned=True)
+
+        pending = manifest.pending()
+        batches = [pending[i:i + IMAGE_IMPORT_BATCH_SIZE] for i in range(0, len(pending), IMAGE_IMPORT_BATCH_SIZE)]
+        embedded = stored = 0
+        started = time.monotonic()
+        # Spawned workers import only the image helpers, not torch and the CLIP model
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=IMAGE_IMPORT_WORKERS, mp_context=context) as pool:
+            submitted = _submit_batch(pool, reader, batches[0]) if batches else []
+            for i in range(len(batches)):
+                # Decode the next batch while this one is embedded and stored
+                next_submitted = _submit_batch(pool, reader, batches[i + 1]) if i + 1 < len(batches) else []
+                counts = _store_batch(manifest, meta, submitted)
+                embedded += counts["embedded"]
+                stored += counts["stored"]
+                manifest.set_meta(heartbeat=time.time())
+                submitted = next_submitted
+
+        elapsed = time.monotonic() - started
+        progress = manifest.progress()
+        manifest.set_meta(
+            status="completed",
+            finished_at=time.time(),
+            seconds=round(elapsed, 3),
+            images_per_second=round(len(pending) / elapsed, 1) if elapsed else 0.0,
+        )
+        print(f"Image import {import_id}: {progress['done']} stored, {progress['duplicate']} duplicates, {progress['failed']} failed, {embedded} embedded in {elapsed:.1f}s")
+        # Every entry has a final status, the uploaded archives are no longer needed
+        reader.close()
+        shutil.rmtree(os.path.join(manifest.directory, "sources"), ignore_errors=True)
+        return progress
+    except Exception as e:
+        print(f"Image import {import_id} failed: {str(e)}")
+        manifest.set_meta(status="interrupted", error=str(e))
+        raise
+    finally:
+        reader.close()
+        manifest.close()
+        with _running_lock:
+            _running.discard(import_id)
+
+
+def is_import_running(import_id: str, meta: Optional[Dict[str, Any]] = None) -> bool:
+    """Whether an import is being processed, here or by another worker process"""
+    with _running_lock:
+        if import_id in _running:
+            return True
+    if meta is None:
+        return False
+    return meta.get("status") == "processing" and time.time() - meta.get("heartbeat", 0) < IMAGE_IMPORT_STALE_SECONDS
+
+
+def import_status(import_id: str) -> Optional[Dict[str, Any]]:
+    """Meta data and progress of an import, or None when it does not exist"""
+    if not ImportManifest.exists(import_id):
+        return None
+    manifest = ImportManifest(import_id)
+    try:
+        meta = manifest.get_meta()
+        if meta.get("status") == "processing" and not is_import_running(import_id, meta):
+            # The process running it stopped before it finished
+            meta["status"] = "interrupted"
+        return {"import_id": import_id, **meta, **manifest.progress()}
+    finally:
+        manifest.close()
@@ -1,24 +1,27 @@
 import io
 import os
 import uuid
+import threading
 import numpy as np
-from PIL import Image
-import torch
-from transformers import CLIPProcessor, CLIPModel
+from dotenv import load_dotenv
 from src.service_client import chroma_client
+from src.utils.clip_embedder import CLIP_BACKEND, MODEL_NAME, get_embedder
+from src.utils.image_batcher import MicroBatcher
+from src.utils.image_hash import IMAGE_PHASH_MAX_DISTANCE, IMAGE_PHASH_COLOUR_TOLERANCE, PerceptualIndex, get_perceptual_index, image_fingerprint, invalidate_perceptual_index, perceptual_indexes
+from src.utils.embedding_cache import embedding_cache
+from src.utils.file_utills import generate_file_hash
+
+load_dotenv()
 
 # -------------------------------------------------------------------
 # Configuration
 # -------------------------------------------------------------------
-MODEL_NAME = "openai/clip-vit-base-patch32"
-
+# local: CLIP is loaded in this process on first use; socket: images are sent
+# to the embedding service (python -m src.utils.image_embedding_service)
+IMAGE_EMBEDDING_SERVICE = os.getenv("IMAGE_EMBEDDING_SERVICE", "local").lower()
 
-# -------------------------------------------------------------------
-# Device utility
-# -------------------------------------------------------------------
-def get_device() -> str:
-    """Return best available computation device."""
-    return "cuda" if torch.cuda.is_available() else "cpu"
+# Image embeddings are cached by content hash in the embedding cache under this model key
+IMAGE_QUERY_CACHE_MODEL = f"clip:{MODEL_NAME}:{CLIP_BACKEND}"
 
 
 # -------------------------------------------------------------------
@@ -38,36 +41,45 @@ def create_index(index_name: str, embedding_dimension: int) -> None:
 
 
 # -------------------------------------------------------------------
-# CLIP Embedder
+# Image Encoder
 # -------------------------------------------------------------------
-class CLIPEmbedder:
-    """Encapsulates CLIP model + preprocessing for efficient embedding."""
+def get_image_encoder():
+    """Encoder for this process: the embedding service, or a local batcher over the lazily loaded model"""
+    if IMAGE_EMBEDDING_SERVICE == "socket":
+        from src.utils.image_embedding_service import RemoteImageEncoder
+        return RemoteImageEncoder()
+    # The model is loaded by the first batch, not at import
+    return MicroBatcher(
+        lambda image: get_embedder().preprocess(image),
+        lambda pixel_values: get_embedder().forward(pixel_values),
+    )
+
+
+# Concurrent encode requests (uploads, searches) share batched forward passes
+image_encoder = get_image_encoder()
+
+# How search_similar_images obtained its query embeddings
+_query_counters = {"cached": 0, "exact": 0, "near_duplicate": 0, "encoded": 0}
+_query_counters_lock = threading.Lock()
 
-    _model_cache = None
-    _processor_cache = None
 
-    def __init__(self, model_name: str = MODEL_NAME):
-        self.device = get_device()
-        if CLIPEmbedder._model_cache is None:
-            CLIPEmbedder._model_cache = CLIPModel.from_pretrained(model_name).to(self.device)
-        if CLIPEmbedder._processor_cache is None:
-            CLIPEmbedder._processor_cache = CLIPProcessor.from_pretrained(model_name, use_fast=False)
-        self.model = CLIPEmbedder._model_cache
-        self.processor = CLIPEmbedder._processor_cache
-        self.model.eval()
+def _count_query(source: str):
+    with _query_counters_lock:
+        _query_counters[source] += 1
 
-    def encode_image_bytes(self, image_bytes: io.BytesIO) -> np.ndarray:
-        """Encode an image (BytesIO) into a normalized CLIP embedding."""
-        with torch.no_grad(), Image.open(image_bytes) as image:
-            image = image.convert("RGB")
-            inputs = self.processor(images=image, return_tensors="pt").to(self.device)
-            features = self.model.get_image_features(**inputs)
-            features = torch.nn.functional.normalize(features, p=2, dim=-1)
-        return features.squeeze(0).cpu().numpy().astype(np.float32)
 
+def image_search_stats() -> dict:
+    with _query_counters_lock:
+        counters = dict(_query_counters)
+    return {**counters, "phash_max_distance": IMAGE_PHASH_MAX_DISTANCE, "colour_tolerance": IMAGE_PHASH_COLOUR_TOLERANCE, "indexes": perceptual_indexes.stats()}
 
-# Instantiate embedder once (cached model)
-embedder = CLIPEmbedder()
+
+def _image_content(image) -> bytes:
+    if isinstance(image, io.BytesIO):
+        return image.getvalue()
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    return image.read()
 
 
 # -------------------------------------------------------------------
@@ -83,7 +95,8 @@ def store_image_embedding(
 ) -> None:
     """Embed a single image (BytesIO) and store its vector in ChromaDB."""
     # try:
-    emb = embedder.encode_image_bytes(image_bytes)
+    content = _image_content(image_bytes)
+    emb = image_encoder.encode(content)
     dim = emb.shape[0]
 
     # Create collection if it doesn't exist
@@ -97,13 +110,16 @@ def store_image_embedding(
     # Delete existing vectors for this file hash
     _ = delete_image_embedding(index_name, file_hash)
 
+    phash, colour = image_fingerprint(content)
     metadata = {
         "pc_file_name": file_name,
         "pc_file_hash": file_hash,
         "pc_file_type": "IMAGE",
         "pc_file_extension": os.path.splitext(file_name)[1].lower(),
         "match_field": match_field,
-        "full_path": full_path
+        "full_path": full_path,
+        "pc_phash": phash,
+        "pc_colour": colour
     }
 
     vector_id = str(uuid.uuid4())
@@ -113,12 +129,105 @@ def store_image_embedding(
         metadatas=[metadata],
         documents=[file_name]
     )
+    invalidate_perceptual_index(index_name)
+    # A customer resending this exact file is answered without a forward pass
+    embedding_cache.put_many(IMAGE_QUERY_CACHE_MODEL, {generate_file_hash(content): emb})
     return True
     # except Exception as e:
     #     print(f"Error storing image embedding: {str(e)}")
     #     return False
 
 
+def store_image_embeddings(index_name: str, images: list[dict], batch_size: int = 1000) -> int:
+    """
+    Store already computed embeddings of many images in ChromaDB.
+
+    Each item has embedding, file_name, file_hash, match_field, full_path and
+    optionally phash and colour. Vectors stored earlier for the same file hashes are replaced.
+    """
+    if not images:
+        return 0
+    collection = chroma_client.get_or_create_collection(
+        name=index_name,
+        metadata={"hnsw:space": "cosine"}
+    )
+    file_hashes = list({image["file_hash"] for image in images})
+    for i in range(0, len(file_hashes), batch_size):
+        collection.delete(where={"pc_file_hash": {"$in": file_hashes[i : i + batch_size]}})
+
+    for i in range(0, len(images), batch_size):
+        batch = images[i : i + batch_size]
+        collection.add(
+            ids=[str(uuid.uuid4()) for _ in batch],
+            embeddings=[np.asarray(image["embedding"], dtype=np.float32).tolist() for image in batch],
+            metadatas=[{
+                "pc_file_name": image["file_name"],
+                "pc_file_hash": image["file_hash"],
+                "pc_file_type": "IMAGE",
+                "pc_file_extension": os.path.splitext(image["file_name"])[1].lower(),
+                "match_field": image["match_field"],
+                "full_path": image["full_path"],
+                **({"pc_phash": image["phash"], "pc_colour": image["colour"]} if image.get("phash") and image.get("colour") else {})
+            } for image in batch],
+            documents=[image["file_name"] for image in batch]
+        )
+    invalidate_perceptual_index(index_name)
+    embedding_cache.put_many(IMAGE_QUERY_CACHE_MODEL, {image["file_hash"]: image["embedding"] for image in images})
+    return len(images)
+
+
+def _build_perceptual_index(collection, page_size: int = 5000) -> PerceptualIndex:
+    """dHash index of a collection, built from its metadata"""
+    entries, offset = [], 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        # Images without a colour thumbnail cannot be told apart from their colour variants
+        entries.extend(
+            (vector_id, metadata["pc_phash"], metadata["pc_colour"])
+            for vector_id, metadata in zip(page["ids"], page["metadatas"])
+            if metadata and metadata.get("pc_phash") and metadata.get("pc_colour")
+        )
+        if len(page["ids"]) < page_size:
+            break
+        offset += page_size
+    return PerceptualIndex(entries)
+
+
+def query_image_embedding(content: bytes, index_name: str, collection) -> np.ndarray:
+    """
+    Embedding of a query image, without a forward pass when possible:
+
+    1. the embedding cache, keyed by content hash (resent photos, stored files),
+    2. the stored vector of an image whose dHash is within IMAGE_PHASH_MAX_DISTANCE
+       and whose colours match (the same picture re-encoded, resized or
+       screenshotted, not a colour variant of it),
+    3. the CLIP encoder, whose result is cached for the next time.
+    """
+    content_hash = generate_file_hash(content)
+    cached = embedding_cache.get_many(IMAGE_QUERY_CACHE_MODEL, [content_hash])
+    if content_hash in cached:
+        _count_query("cached")
+        return cached[content_hash]
+
+    try:
+        index = get_perceptual_index(index_name, lambda: _build_perceptual_index(collection))
+        match = index.nearest(*image_fingerprint(content)) if index is not None else None
+        if match is not None:
+            vector_id, distance = match
+            stored = collection.get(ids=[vector_id], include=["embeddings"])
+            # The vector may have been deleted by another worker since the index was built
+            if stored["ids"]:
+                _count_query("exact" if distance == 0 else "near_duplicate")
+                return np.asarray(stored["embeddings"][0], dtype=np.float32)
+    except Exception as e:
+        print(f"Perceptual hash lookup failed: {str(e)}")
+
+    embedding = image_encoder.encode(content)
+    embedding_cache.put_many(IMAGE_QUERY_CACHE_MODEL, {content_hash: embedding})
+    _count_query("encoded")
+    return embedding
+
+
 # -------------------------------------------------------------------
 # 2. SEARCH SIMILAR IMAGES
 # -------------------------------------------------------------------
@@ -129,8 +238,8 @@ def search_similar_images(
 ):
     """Find visually similar images for a query image (BytesIO)."""
     try:
-        query_emb = embedder.encode_image_bytes(query_image_bytes)
         collection = chroma_client.get_or_create_collection(name=index_name)
+        query_emb = query_image_embedding(_image_content(query_image_bytes), index_name, collection)
 
         result = collection.query(
             query_embeddings=[query_emb.tolist()],
@@ -182,6 +291,7 @@ def delete_image_embedding(index_name: str, file_hash: str) -> int:
             batch_size = 1000
             for i in range(0, len(ids_to_delete), batch_size):
                 collection.delete(ids=ids_to_delete[i : i + batch_size])
+            invalidate_perceptual_index(index_name)
 
         return len(ids_to_delete)
 
@@ -1,6 +1,7 @@
 import pandas as pd
 from src.utils.file_utills import dataframe_to_texts, dataframe_to_texts_with_columns
 from src.utils.splitter import chunk_file
+from src.loaders.streaming import StreamedTable, FileSource, rewind, KNOWLEDGE_STREAM_BLOCK_ROWS
 import os, io
 
 def load_csv_file(file_content: io.BytesIO, file_name:str, file_hash:str, primary_column:str) -> list[str]:
@@ -32,4 +33,32 @@ def load_csv_file(file_content: io.BytesIO, file_name:str, file_hash:str, primar
     texts, meta_dict = dataframe_to_texts(df)
     column_texts, column_meta_dict = dataframe_to_texts_with_columns(df)
     
-    return chunk_file(texts, meta_dict, max_chunk_size=8000, metadata=metadata), chunk_file(column_texts, column_meta_dict, max_chunk_size=8000, metadata=metadata)
\ No newline at end of file
+    return chunk_file(texts, meta_dict, max_chunk_size=8000, metadata=metadata), chunk_file(column_texts, column_meta_dict, max_chunk_size=8000, metadata=metadata)
+
+
+def stream_csv_file(source: FileSource, file_name:str, file_hash:str, primary_column:str, block_rows: int = KNOWLEDGE_STREAM_BLOCK_ROWS) -> StreamedTable:
+    """
+    Load a CSV file in streaming mode, `block_rows` rows at a time.
+
+    Args:
+        source (str | BinaryIO): Path or binary file object of the CSV file.
+        file_name (str): Name of the CSV file.
+        file_hash (str): Hash of the CSV file.
+        block_rows (int): Rows parsed per block.
+
+    Returns:
+        StreamedTable: Column chunks and a row chunk generator.
+    """
+    metadata = {
+        "pc_file_name": file_name,
+        "pc_file_hash": file_hash,
+        "pc_file_type": 'CSV',
+        "pc_file_extension": os.path.splitext(file_name)[1].lower(),
+        "pc_primary_column": primary_column.lower()
+    }
+
+    def read_blocks(dtype):
+        with pd.read_csv(rewind(source), chunksize=block_rows, dtype=dtype or None) as reader:
+            yield from reader
+
+    return StreamedTable(read_blocks, metadata)
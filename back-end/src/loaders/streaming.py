@@ -0,0 +1,200 @@
+"""
+Streaming mode for large CSV/XLSX knowledge files.
+
+The in-memory loaders read the whole sheet into one DataFrame and build every
+row text, row chunk and column chunk before embedding starts. StreamedTable
+reads the file in blocks of KNOWLEDGE_STREAM_BLOCK_ROWS rows instead:
+
+- a first pass counts rows and chunks (so pc_total_rows / pc_total_chunks keep
+  their meaning), collects the distinct values of every column and settles
+  the dtype of every column over the whole file,
+- the column chunks are built from those distinct values,
+- a second pass yields the row chunks block by block, so the embedding
+  pipeline pulls them as it goes and never holds the whole file.
+
+Distinct values are kept for at most KNOWLEDGE_MAX_COLUMN_VALUES values per
+column; a column with more than that is not used as a filter column.
+
+Each block infers its own dtypes, so a numeric column is int64 in a block
+without gaps and float64 in a block with one, and row texts and metadata
+would depend on the file size and block boundaries. The first pass records
+every block's dtypes and settles each column the way a single read of the
+whole file does. Blocks are then cast to those dtypes, and the file is scanned
+again only when a cast was needed. The row texts, filter metadata and row
+hashes of a streamed file are therefore the same as those of the in-memory
+loaders.
+"""
+import os
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Set, Union
+import numpy as np
+import pandas as pd
+from pandas.core.dtypes.cast import find_common_type
+from dotenv import load_dotenv
+from src.utils.file_utills import dataframe_to_texts, column_meta_key
+from src.utils.splitter import chunk_file, count_row_chunks, iter_chunks
+
+load_dotenv()
+
+KNOWLEDGE_STREAM_MIN_BYTES = int(os.getenv("KNOWLEDGE_STREAM_MIN_BYTES", str(10 * 1024 * 1024)))
+KNOWLEDGE_STREAM_BLOCK_ROWS = int(os.getenv("KNOWLEDGE_STREAM_BLOCK_ROWS", "5000"))
+KNOWLEDGE_MAX_COLUMN_VALUES = int(os.getenv("KNOWLEDGE_MAX_COLUMN_VALUES", "10000"))
+
+MAX_CHUNK_SIZE = 8000
+
+FileSource = Union[str, BinaryIO]
+
+
+def should_stream(file_size: int) -> bool:
+    """Whether a file of `file_size` bytes is loaded in streaming mode"""
+    return file_size >= KNOWLEDGE_STREAM_MIN_BYTES
+
+
+def rewind(source: FileSource) -> FileSource:
+    """Return a source positioned at the start of the file, ready for another pass"""
+    if not isinstance(source, str):
+        source.seek(0)
+    return source
+
+
+# Kind recorded for a block whose column holds only missing values
+EMPTY = "empty"
+
+
+def block_kinds(block: pd.DataFrame) -> Dict[str, Any]:
+    """Dtype of every column of a block, or EMPTY for columns without values"""
+    return {col: EMPTY if block[col].isna().all() else block[col].dtype for col in block.columns}
+
+
+def settle_dtype(kinds: Set[Any], bools_are_numbers: bool = False) -> np.dtype:
+    """
+    Dtype a single read of the whole file gives a column whose blocks had
+    `kinds`, following the common-type rule pandas uses to join the chunks
+    of a low_memory read. pandas' python parser (used by read_excel) reads
+    bools in a numeric column as numbers, so `bools_are_numbers` makes
+    bool + int settle to int64 and bool + float (or gaps) to float64.
+    """
+    dtypes = {kind for kind in kinds if kind is not EMPTY}
+    if EMPTY in kinds or not dtypes:
+        # Gaps are NaN, read as float64 when the column has nothing else
+        dtypes.add(np.dtype("float64"))
+    if bools_are_numbers and len(dtypes) > 1 and all(pd.api.types.is_bool_dtype(d) or pd.api.types.is_numeric_dtype(d) for d in dtypes):
+        dtypes = {d for d in dtypes if not pd.api.types.is_bool_dtype(d)}
+    return find_common_type(list(dtypes))
+
+
+class StreamedTable:
+    """
+    Row and column chunks of a tabular file, produced block by block.
+
+    Args:
+        read_blocks: Returns a fresh iterator of DataFrame blocks, once per pass;
+            receives a parser dtype mapping of the columns to read without
+            type conversion
+        metadata: File metadata added to every chunk
+        max_chunk_size: Maximum characters per chunk
+        max_column_values: Distinct values tracked per column
+        bools_are_numbers: Settle dtypes like pandas' python parser (read_excel)
+    """
+
+    def __init__(
+        self,
+        read_blocks: Callable[[Dict[str, Any]], Iterator[pd.DataFrame]],
+        metadata: Dict[str, Any],
+        max_chunk_size: int = MAX_CHUNK_SIZE,
+        max_column_values: int = KNOWLEDGE_MAX_COLUMN_VALUES,
+        bools_are_numbers: bool = False,
+    ):
+        self.read_blocks = read_blocks
+        self.metadata = metadata
+        self.max_chunk_size = max_chunk_size
+        self.max_column_values = max_column_values
+        self.bools_are_numbers = bools_are_numbers
+        self.total_rows = 0
+        self.total_chunks = 0
+        self.dtypes: Dict[str, Any] = {}
+        self._text_columns: Dict[str, Any] = {}
+        self._column_values: Dict[str, Union[dict, None]] = {}
+        self._column_counts: Dict[str, int] = {}
+        self._scanned = False
+
+    def scan(self) -> "StreamedTable":
+        """First pass: count rows and chunks, collect distinct column values and settle dtypes"""
+        if self._scanned:
+            return self
+        kinds: Dict[str, Set[Any]] = {}
+        block_dtypes = []
+        for block in self.read_blocks({}):
+            for col, kind in block_kinds(block).items():
+                kinds.setdefault(col, set()).add(kind)
+            block_dtypes.append(block.dtypes.to_dict())
+            self._scan_block(block)
+        self.dtypes = {col: settle_dtype(col_kinds, self.bools_are_numbers) for col, col_kinds in kinds.items()}
+        # A single read does not convert the numbers of a column that also holds text:
+        # such columns are parsed again without type conversion
+        self._text_columns = {
+            col: object for col, col_kinds in kinds.items()
+            if self.dtypes[col] == object and any(pd.api.types.is_numeric_dtype(k) and not pd.api.types.is_bool_dtype(k) for k in col_kinds if k is not EMPTY)
+        }
+        if self._text_columns or any(dtypes != self.dtypes for dtypes in block_dtypes):
+            # Counts and values depend on the dtypes, so scan again with the settled ones
+            self.total_rows = self.total_chunks = 0
+            self._column_values, self._column_counts = {}, {}
+            for block in self._blocks():
+                self._scan_block(block)
+        self._scanned = True
+        return self
+
+    def _blocks(self) -> Iterator[pd.DataFrame]:
+        for block in self.read_blocks(self._text_columns):
+            casts = {col: dtype for col, dtype in self.dtypes.items() if col in block and block[col].dtype != dtype}
+            yield block.astype(casts) if casts else block
+
+    def _scan_block(self, block: pd.DataFrame):
+        texts, _ = dataframe_to_texts(block)
+        self.total_rows += len(block)
+        self.total_chunks += sum(count_row_chunks(text, self.max_chunk_size) for text in texts)
+        self._collect_column_values(block)
+
+    def _collect_column_values(self, block: pd.DataFrame):
+        for col in block.columns:
+            non_null_series = block[col].dropna()
+            self._column_counts[col] = self._column_counts.get(col, 0) + len(non_null_series)
+            values = self._column_values.setdefault(col, {})
+            if values is None:
+                continue
+            for val in non_null_series.drop_duplicates().tolist():
+                values.setdefault(val, None)
+            if len(values) > self.max_column_values:
+                # Too many distinct values to be a useful filter column
+                self._column_values[col] = None
+
+    def column_chunks(self) -> List[Dict[str, Any]]:
+        """Column-value chunks, the same ones dataframe_to_texts_with_columns produces"""
+        self.scan()
+        texts = []
+        meta_dict = []
+        for col, values in self._column_values.items():
+            # Include column if number of unique values < half of non-null count
+            if values is None or not len(values) < 0.5 * self._column_counts[col]:
+                continue
+            meta_key = column_meta_key(col)
+            for val in values:
+                texts.append(f"{meta_key}: {str(val).lower()}")
+                meta_dict.append({"column_name": meta_key, "column_value": f'{val}'.lower()})
+        return chunk_file(texts, meta_dict, max_chunk_size=self.max_chunk_size, metadata=self.metadata)
+
+    def row_chunks(self) -> Iterator[Dict[str, Any]]:
+        """Second pass: yield the row chunks block by block"""
+        self.scan()
+        row_offset = 0
+        chunk_offset = 0
+        for block in self._blocks():
+            texts, meta_dict = dataframe_to_texts(block)
+            for chunk in iter_chunks(
+                texts, meta_dict, self.max_chunk_size, self.metadata,
+                total_rows=self.total_rows, total_chunks=self.total_chunks,
+                row_offset=row_offset, chunk_offset=chunk_offset,
+            ):
+                chunk_offset += 1
+                yield chunk
+            row_offset += len(block)
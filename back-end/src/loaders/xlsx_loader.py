@@ -1,6 +1,10 @@
 import pandas as pd
 from src.utils.file_utills import dataframe_to_texts, dataframe_to_texts_with_columns
 from src.utils.splitter import chunk_file
+from src.loaders.streaming import StreamedTable, FileSource, rewind, KNOWLEDGE_STREAM_BLOCK_ROWS
+from pandas.io.parsers import TextParser
+from typing import Iterator
+import numpy as np
 import os, io
 
 def load_xlsx_file(file_content: io.BytesIO, file_name:str, file_hash:str, primary_column:str) -> list[str]:
@@ -32,4 +36,90 @@ def load_xlsx_file(file_content: io.BytesIO, file_name:str, file_hash:str, prima
     texts, meta_dict = dataframe_to_texts(df)
     column_texts, column_meta_dict = dataframe_to_texts_with_columns(df)
     
-    return chunk_file(texts, meta_dict, max_chunk_size=8000, metadata=metadata), chunk_file(column_texts, column_meta_dict, max_chunk_size=8000, metadata=metadata)
\ No newline at end of file
+    return chunk_file(texts, meta_dict, max_chunk_size=8000, metadata=metadata), chunk_file(column_texts, column_meta_dict, max_chunk_size=8000, metadata=metadata)
+
+
+def _excel_cell(cell):
+    """Convert an openpyxl cell the way pandas' openpyxl reader does, before column types are inferred"""
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        return val if val == cell.value else float(cell.value)
+    return cell.value
+
+
+def _parse_block(header: list, rows: list, dtype: dict) -> pd.DataFrame:
+    # The parser read_excel uses: header names, NA strings and per-column types come out the same
+    return TextParser([header] + rows, header=0, dtype=dtype or None).read()
+
+
+def iter_xlsx_blocks(source: FileSource, block_rows: int, dtype: dict = None) -> Iterator[pd.DataFrame]:
+    """
+    Read the first worksheet with openpyxl in read-only mode and yield it as
+    DataFrames of at most `block_rows` rows, parsed like pd.read_excel: blank
+    rows inside the sheet are kept, trailing blank rows are dropped.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(rewind(source), read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        rows = sheet.rows
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [_excel_cell(cell) for cell in header]
+        while header and header[-1] == "":
+            header.pop()
+        width = len(header)
+        if not width:
+            return
+        block, blank = [], []
+        for row in rows:
+            values = [_excel_cell(cell) for cell in row[:width]]
+            while values and values[-1] == "":
+                values.pop()
+            values.extend([""] * (width - len(values)))
+            if all(val == "" for val in values):
+                # Only kept once a later row has data
+                blank.append(values)
+                continue
+            block.extend(blank)
+            blank = []
+            block.append(values)
+            if len(block) >= block_rows:
+                yield _parse_block(header, block, dtype)
+                block = []
+        if block:
+            yield _parse_block(header, block, dtype)
+    finally:
+        workbook.close()
+
+
+def stream_xlsx_file(source: FileSource, file_name:str, file_hash:str, primary_column:str, block_rows: int = KNOWLEDGE_STREAM_BLOCK_ROWS) -> StreamedTable:
+    """
+    Load an Excel (.xlsx) file in streaming mode, `block_rows` rows at a time.
+
+    Args:
+        source (str | BinaryIO): Path or binary file object of the Excel file.
+        file_name (str): Name of the Excel file.
+        file_hash (str): Hash of the Excel file.
+        block_rows (int): Rows read per block.
+
+    Returns:
+        StreamedTable: Column chunks and a row chunk generator.
+    """
+    metadata = {
+        "pc_file_name": file_name,
+        "pc_file_hash": file_hash,
+        "pc_file_type": 'Excel',
+        "pc_file_extension": os.path.splitext(file_name)[1].lower(),
+        "pc_primary_column": primary_column.lower()
+    }
+    return StreamedTable(lambda dtype: iter_xlsx_blocks(source, block_rows, dtype), metadata, bools_are_numbers=True)
@@ -8,13 +8,13 @@ from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain.agents import create_agent
 from pydantic import BaseModel, Field
 
-from src.utils.chroma_utils import search_vectors_product, search_vectors
-from db.company_table import get_linked_images_from_table, get_linked_extra_from_table
+from src.utils.chroma_utils import search_vectors
+from db.linked_assets import get_linked_assets, normalize_product_key
 from db.public_table import get_chatbot_personality
 import os, json
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from src.action.actions import make_search_tool, get_customer_info_tool
+# The search tool records the linked images/documents of each conversation here
+from src.action.actions import make_search_tool, get_customer_info_tool, extra_info_conversations
 
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
 llm_bot = ChatOpenAI(
@@ -22,75 +22,6 @@ llm_bot = ChatOpenAI(
     api_key=OPENAI_KEY,
 )
 
-extra_info_conversations = {}
-
-async def get_linked_info(retrieval_results: list[dict], company_schema: str, conversation_id: str):
-    global extra_info_conversations
-    extra_info = {"images": [], "extra": []}
-    seen = set()
-
-    for r in retrieval_results:
-        pc_text = r["metadata"]["pc_text"]
-        if pc_text in seen:
-            continue
-        seen.add(pc_text)
-        primary_col = r["metadata"]["pc_primary_column"]
-
-        image_linked = get_linked_images_from_table(
-            company_id=company_schema,
-            product_id=r["metadata"][primary_col],
-        )
-        document_linked = get_linked_extra_from_table(
-            company_id=company_schema,
-            product_id=r["metadata"][primary_col],
-        )
-        try:
-            if image_linked:
-                extra_info["images"].append(image_linked[0]["full_path"])
-            if document_linked:
-                extra_info["extra"].append(document_linked[0]["full_path"])
-        except Exception:
-            pass
-
-    extra_info["images"] = list(set(extra_info["images"]))
-    extra_info_conversations[conversation_id] = extra_info
-
-def search_vectors_with_query(query: str, company_id: str, conversation_id: str, company_schema: str):
-    results, differentiating_features = search_vectors_product(
-        index_name=company_id,
-        query_text=query,
-        company_id=company_id,
-        company_schema=company_schema,
-        conversationId=conversation_id,
-        top_k=5
-    )
-    
-    if differentiating_features and len(differentiating_features) > 3:
-        extra_info_conversations[conversation_id] = {}
-        return f"Need more details. Please clarify: {differentiating_features}"
-
-    retrieval_results = [r["metadata"]["pc_text"] for r in results]
-
-    # Async image linking
-    def run_async():
-        new_loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(new_loop)
-        try:
-            new_loop.run_until_complete(get_linked_info(results, company_schema, conversation_id))
-        finally:
-            new_loop.close()
-
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        executor.submit(run_async).result()
-
-    return list(set(retrieval_results))
-
-class RetrievalQueryInput(BaseModel):
-    query: str = Field(
-        ...,
-        description="""The full text query or key points describing the user's product need in feature and value. For example: "'Size': 1.5 | 'Conductor': Copper | 'Sub Category': Unarmoured Power Cables | 'Insulation': PVC | 'Standard': KS".""",
-    )
-
 def make_system_prompt(company_id: str):
     chatbot_personality = get_chatbot_personality(company_id)
     if not chatbot_personality:
@@ -123,8 +54,8 @@ async def ai_response_with_search(
     company_id: str, company_schema: str, conversation_id: str, query: str, memory: InMemoryChatMessageHistory, acions: list[str]
 ):
     extra_info_conversations[conversation_id] = {"images": [], "extra": []}
-    # Make system prompt with chatbot personality
-    system_prompt = make_system_prompt(company_id)
+    # Make system prompt with chatbot personality (sync DB helpers run off the event loop)
+    system_prompt = await asyncio.to_thread(make_system_prompt, company_id)
     tools = []
     # Make search tool
     for i in acions:
@@ -132,7 +63,7 @@ async def ai_response_with_search(
             search_tool = make_search_tool(company_id, conversation_id, company_schema)
             tools.append(search_tool)
         if i == "Get customer information":
-            extra_prompt, customer_tool = get_customer_info_tool(conversation_id, company_schema)
+            extra_prompt, customer_tool = await asyncio.to_thread(get_customer_info_tool, conversation_id, company_schema)
             if customer_tool:
                 tools.append(customer_tool)
             system_prompt = system_prompt + "\n" + extra_prompt
@@ -147,14 +78,15 @@ async def ai_response_with_search(
         history_messages_key="messages",
     )
 
-    result = with_history.invoke({"messages": query}, config={"configurable": {"session_id": conversation_id}})
+    # ainvoke awaits the LLM and the tools' coroutines, so the other jobs on the worker's event loop keep running
+    result = await with_history.ainvoke({"messages": query}, config={"configurable": {"session_id": conversation_id}})
     return result["messages"][-1].content, extra_info_conversations.get(conversation_id, {})
 
 async def ai_response_with_image_search(
     company_id: str, company_schema: str, conversation_id: str, query: str, memory: InMemoryChatMessageHistory, image_search_result: list[dict]
 ):
     # Make system prompt with chatbot personality
-    system_prompt = make_system_prompt(company_id)
+    system_prompt = await asyncio.to_thread(make_system_prompt, company_id)
     
     prompt = ChatPromptTemplate.from_messages([
         ("system", system_prompt),
@@ -171,17 +103,19 @@ async def ai_response_with_image_search(
         file_id = file_name.replace(file_extension, "")
         match_field = image["metadata"]["match_field"]
 
-        items = search_vectors(
+        items = await asyncio.to_thread(
+            search_vectors,
             index_name=company_id,
             company_id=company_id,
             extra_filter={match_field: file_id}
         )
+        linked = await asyncio.to_thread(get_linked_assets, company_schema, [file_id], ("extra",))
+        extra_document = linked["extra"].get(normalize_product_key(file_id))
         
         for i in items['data']:
             extra_info["images"].append(image["metadata"]["full_path"])
-            extra_documents = get_linked_extra_from_table(company_schema, file_id)
-            if extra_documents:
-                extra_info["extra"].append(extra_documents[0]["full_path"])
+            if extra_document:
+                extra_info["extra"].append(extra_document)
             images_info.append(i["metadata"]["pc_text"])
             
     chain = RunnableSequence(
@@ -196,7 +130,7 @@ async def ai_response_with_image_search(
         history_messages_key="history",
     )
 
-    result = with_history.invoke(
+    result = await with_history.ainvoke(
         {"query": f"{query}\n\nSimilar Products Info: {images_info}"},
         config={"configurable": {"session_id": conversation_id}},
     )
@@ -204,7 +138,7 @@ async def ai_response_with_image_search(
 
 async def combine_all_response_into_one(company_id: str, conversation_id:str, memory: InMemoryChatMessageHistory, all_responses: list):
     print("Stop working for final response")
-    system_prompt = make_system_prompt(company_id)
+    system_prompt = await asyncio.to_thread(make_system_prompt, company_id)
 
     final_prompt = f"""
 Combine all response messages into one well-written, unified reply.
@@ -234,7 +168,7 @@ Task:
         history_messages_key="history",
     )
 
-    result = with_history.invoke(
+    result = await with_history.ainvoke(
         {"query": f"\nResponses: {all_responses}"},
         config={"configurable": {"session_id": conversation_id}},
     )
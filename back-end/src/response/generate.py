@@ -6,7 +6,7 @@ from src.response.ai_response import ai_response_with_search, ai_response_with_i
 from utils.whatsapp import send_message_whatsapp
 from utils.waca import send_text_message_by_waca, send_image_message_by_waca
 from src.image_vectorize import search_similar_images
-from utils.track_carbon import tracker
+from utils.track_carbon import start_tracker, stop_tracker
 from langchain_openai import ChatOpenAI
 from langchain_core.tools import StructuredTool
 from langchain_core.chat_history import InMemoryChatMessageHistory
@@ -43,20 +43,31 @@ async def get_history(messages):
 async def generate_response_with_search(
     company_id: str, company_schema: str, conversation_id: str, query: str, from_phone_number: str, instance_name: str, message_type:str, platform:str
 ):
-    tracker.start()
+    # Every blocking call below runs via asyncio.to_thread: the job worker's loop serves other replies meanwhile
+    tracker = await asyncio.to_thread(start_tracker)
+    try:
+        response = await reply_with_search(company_id, company_schema, conversation_id, query, from_phone_number, instance_name, message_type, platform)
+    finally:
+        emissions_kg, energy_kwh = await asyncio.to_thread(stop_tracker, tracker)
+    await asyncio.to_thread(update_message_energy, company_schema, conversation_id, energy_kwh, emissions_kg)
+    return response
+
+async def reply_with_search(
+    company_id: str, company_schema: str, conversation_id: str, query: str, from_phone_number: str, instance_name: str, message_type:str, platform:str
+):
 
     # Get integration details based on platform
     if platform == "WACA":
-        integration = get_integration_by_phone_number_id(instance_name)
+        integration = await asyncio.to_thread(get_integration_by_phone_number_id, instance_name)
         source_phone_number = integration.get("phone_number", None)
         api_key = integration.get("instance_name", None)
         phone_number_id = instance_name
     else:
-        integration = get_integration_by_instance_name(instance_name)
+        integration = await asyncio.to_thread(get_integration_by_instance_name, instance_name)
         source_phone_number = integration.get("phone_number", None)
         api_key = None
         phone_number_id = None
-    active_workflows = get_workflows(company_schema)
+    active_workflows = await asyncio.to_thread(get_workflows, company_schema)
     
     except_case = []
     active_workflows_response = []
@@ -71,7 +82,7 @@ async def generate_response_with_search(
                 if node["type"] == "trigger":
                     print("Pass trigger nodes Processing")
                     if node.get("config", {}).get("blocks", []):
-                        result = trigger_workflow_function(node["config"]["blocks"], company_schema, conversation_id, query, message_type)
+                        result = await asyncio.to_thread(trigger_workflow_function, node["config"]["blocks"], company_schema, conversation_id, query, message_type)
                         if not result or len(result) == 0:
                             worflow_process_flag = False
                             break
@@ -80,7 +91,7 @@ async def generate_response_with_search(
                 if node["type"] == "condition":
                     print("Pass condition nodes Processing")
                     if node.get("config", {}).get("blocks", []):
-                        result = condition_workflow_function(node["config"]["blocks"], from_phone_number, source_phone_number, messages, query, message_type, platform, company_schema, conversation_id)
+                        result = await asyncio.to_thread(condition_workflow_function, node["config"]["blocks"], from_phone_number, source_phone_number, messages, query, message_type, platform, company_schema, conversation_id)
                         if not result:
                             worflow_process_flag = False
                             break
@@ -93,7 +104,7 @@ async def generate_response_with_search(
                 if node["type"] == "delay":
                     print("Pass delay nodes Processing")
                     if node.get("config", {}).get("blocks", []):
-                        result = delay_workflow_function(node["config"]["blocks"])
+                        result = await asyncio.to_thread(delay_workflow_function, node["config"]["blocks"])
             if not worflow_process_flag:
                 except_case.append(workflow["except_case"])
     else:
@@ -101,7 +112,7 @@ async def generate_response_with_search(
     except_case = list(set(except_case))
     for i in except_case:
         if i == "sample":
-            messages = get_all_messages(company_schema, conversation_id)
+            messages = await asyncio.to_thread(get_all_messages, company_schema, conversation_id)
             memory = await get_history(messages)
             final_response, extra_info = await ai_response_with_search(company_id, company_schema, conversation_id, query, memory, [])
             active_workflows_response.append([final_response, extra_info])
@@ -130,13 +141,14 @@ async def generate_response_with_search(
     elif platform == "WACA":
         # Send message via WhatsApp Business API
         if final_combine_extra_files and (final_combine_extra_files.get("images") or final_combine_extra_files.get("extra")):
-            result = send_image_message_by_waca(api_key, phone_number_id, from_phone_number, final_combine_response, final_combine_extra_files)
+            result = await asyncio.to_thread(send_image_message_by_waca, api_key, phone_number_id, from_phone_number, final_combine_response, final_combine_extra_files)
         else:
-            result = send_text_message_by_waca(api_key, phone_number_id, from_phone_number, final_combine_response)
+            result = await asyncio.to_thread(send_text_message_by_waca, api_key, phone_number_id, from_phone_number, final_combine_response)
         if not result.get("success", False):
             store_message = False
     if store_message:
-        add_response = add_new_message(
+        add_response = await asyncio.to_thread(
+            add_new_message,
             company_id=company_schema, 
             conversation_id=conversation_id, 
             sender_email="",
@@ -145,30 +157,37 @@ async def generate_response_with_search(
             extra=json.dumps(final_combine_extra_files)
         )
         active_workflows_response = [add_response[0]]
-    
-    emissions_kg = tracker.stop()
-    energy_kwh = tracker.final_emissions_data.energy_consumed
-    update_message_energy(company_schema, conversation_id, energy_kwh, emissions_kg)
     return active_workflows_response
 
 async def generate_response_with_image_search(
     company_id: str, company_schema: str, conversation_id: str, query: str, from_phone_number: str, instance_name: str, message_type:str, platform:str, sample_image: io.BytesIO
 ):
-    tracker.start()
-    matches = search_similar_images(query_image_bytes=sample_image, index_name=f'{company_id}-image')
+    tracker = await asyncio.to_thread(start_tracker)
+    try:
+        response = await reply_with_image_search(company_id, company_schema, conversation_id, query, from_phone_number, instance_name, message_type, platform, sample_image)
+    finally:
+        emissions_kg, energy_kwh = await asyncio.to_thread(stop_tracker, tracker)
+    await asyncio.to_thread(update_message_energy, company_schema, conversation_id, energy_kwh, emissions_kg)
+    return response
+
+async def reply_with_image_search(
+    company_id: str, company_schema: str, conversation_id: str, query: str, from_phone_number: str, instance_name: str, message_type:str, platform:str, sample_image: io.BytesIO
+):
+    # Encoding waits on the image encoder and may load CLIP or build the collection's hash index
+    matches = await asyncio.to_thread(search_similar_images, query_image_bytes=sample_image, index_name=f'{company_id}-image')
 
     # Get integration details based on platform
     if platform == "WACA":
-        integration = get_integration_by_phone_number_id(instance_name)
+        integration = await asyncio.to_thread(get_integration_by_phone_number_id, instance_name)
         source_phone_number = integration.get("phone_number", None)
         api_key = integration.get("instance_name", None)
         phone_number_id = instance_name
     else:
-        integration = get_integration_by_instance_name(instance_name)
+        integration = await asyncio.to_thread(get_integration_by_instance_name, instance_name)
         source_phone_number = integration.get("phone_number", None)
         api_key = None
         phone_number_id = None
-    active_workflows = get_workflows(company_schema)
+    active_workflows = await asyncio.to_thread(get_workflows, company_schema)
     
     except_case = []
     active_workflows_response = []
@@ -179,14 +198,14 @@ async def generate_response_with_image_search(
             memory = await get_history(messages)
             for node in workflow["nodes"]:
                 if node["type"] == "trigger":
-                    result = trigger_workflow_function(node["config"]["blocks"], company_schema, conversation_id, query, message_type)
+                    result = await asyncio.to_thread(trigger_workflow_function, node["config"]["blocks"], company_schema, conversation_id, query, message_type)
                     if not result or len(messages) > 0:
                         worflow_process_flag = False
                         break
                     messages = result
                     memory = await get_history(messages)
                 if node["type"] == "condition":
-                    result = condition_workflow_function(node["config"]["blocks"], from_phone_number, source_phone_number, messages, query, message_type, platform, company_schema, conversation_id)
+                    result = await asyncio.to_thread(condition_workflow_function, node["config"]["blocks"], from_phone_number, source_phone_number, messages, query, message_type, platform, company_schema, conversation_id)
                     if not result:
                         worflow_process_flag = False
                         break
@@ -195,7 +214,7 @@ async def generate_response_with_image_search(
                     if workflow_response:
                         active_workflows_response.extend(workflow_response)
                 if node["type"] == "delay":
-                    result = delay_workflow_function(node["config"]["blocks"])
+                    result = await asyncio.to_thread(delay_workflow_function, node["config"]["blocks"])
             if not worflow_process_flag:
                 except_case.append(workflow["except_case"])
     else:
@@ -205,7 +224,7 @@ async def generate_response_with_image_search(
     for i in except_case:
         if i == "sample":
             # Get chat history
-            messages = get_all_messages(company_schema, conversation_id)
+            messages = await asyncio.to_thread(get_all_messages, company_schema, conversation_id)
             memory = await get_history(messages)
             
             final_response, extra_info = await ai_response_with_image_search(company_id, company_schema, conversation_id, query, memory, matches)
@@ -235,13 +254,14 @@ async def generate_response_with_image_search(
     elif platform == "WACA":
         # Send message via WhatsApp Business API
         if final_combine_extra_files and (final_combine_extra_files.get("images") or final_combine_extra_files.get("extra")):
-            result = send_image_message_by_waca(api_key, phone_number_id, from_phone_number, final_combine_response, final_combine_extra_files)
+            result = await asyncio.to_thread(send_image_message_by_waca, api_key, phone_number_id, from_phone_number, final_combine_response, final_combine_extra_files)
         else:
-            result = send_text_message_by_waca(api_key, phone_number_id, from_phone_number, final_combine_response)
+            result = await asyncio.to_thread(send_text_message_by_waca, api_key, phone_number_id, from_phone_number, final_combine_response)
         if not result.get("success", False):
             store_message = False
     if store_message:
-        add_response = add_new_message(
+        add_response = await asyncio.to_thread(
+            add_new_message,
             company_id=company_schema, 
             conversation_id=conversation_id, 
             sender_email="",
@@ -249,9 +269,5 @@ async def generate_response_with_image_search(
             content=final_combine_response,
             extra=json.dumps(final_combine_extra_files)
         )
-        active_workflows_response = [add_response[0]]    
-    emissions_kg = tracker.stop()
-    energy_kwh = tracker.final_emissions_data.energy_consumed
-    update_message_energy(company_schema, conversation_id, energy_kwh, emissions_kg)
-    
+        active_workflows_response = [add_response[0]]
     return active_workflows_response
\ No newline at end of file
@@ -1,7 +1,13 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from src.service_client import chroma_client
-from src.utils.embedding_utills import generate_embeddings
-from db.company_table import get_all_knowledges
+from src.utils.embedding_utills import generate_query_embeddings
+from src.utils.mmr import mmr_select
+from src.utils.filter_resolver import resolve_column_filter
+from src.utils.lexical_index import index_chunks, unindex_chunks, search_lexical, reciprocal_rank_fusion
+from src.utils.search_cache import product_search_cache, search_cache_key, bump_collection_version
+from src.utils.feature_ranking import candidate_features, rank_features
+from src.utils.product_table import product_tables
+from db.tenant_cache import TenantCache
 from langchain_openai import ChatOpenAI
 import numpy as np
 import os, json
@@ -21,6 +27,24 @@ llm_bot = ChatOpenAI(
 # Default embedding vector dimension for "text-embedding-3-small"
 EMBEDDING_DIMENSION = 1536
 
+# Candidates retrieved per product search for MMR and feature extraction
+PRODUCT_SEARCH_CANDIDATES = int(os.getenv("PRODUCT_SEARCH_CANDIDATES", "50"))
+
+# "hybrid" fuses BM25 and vector rankings, "vector" uses ChromaDB only
+PRODUCT_SEARCH_MODE = os.getenv("PRODUCT_SEARCH_MODE", "hybrid").lower()
+# BM25 matches fused with the vector candidates in hybrid mode
+LEXICAL_SEARCH_CANDIDATES = int(os.getenv("LEXICAL_SEARCH_CANDIDATES", "50"))
+# Reciprocal rank fusion constant: score = sum of 1 / (RRF_K + rank)
+RRF_K = 60
+
+# "local" ranks differentiating features by entropy, "llm" always asks the LLM
+FEATURE_RANKING_MODE = os.getenv("FEATURE_RANKING_MODE", "local").lower()
+FEATURE_LLM_CACHE_TTL = float(os.getenv("FEATURE_LLM_CACHE_TTL", "3600"))
+FEATURE_LLM_CACHE_MAX_ENTRIES = int(os.getenv("FEATURE_LLM_CACHE_MAX_ENTRIES", "1000"))
+
+# LLM feature picks memoized by candidate feature set
+feature_llm_cache = TenantCache(ttl=FEATURE_LLM_CACHE_TTL, max_entries=FEATURE_LLM_CACHE_MAX_ENTRIES)
+
 vectors_for_each_conversation = {}
 
 # -------------------------------------------------------------------
@@ -92,6 +116,10 @@ def store_vectors_in_chroma(index_name: str, chunks: List[Dict[str, Any]], embed
                 embeddings=vectors[i:i + batch_size]
             )
         
+        # Keep the BM25 index of the collection in step with its vectors
+        index_chunks(index_name, chunks)
+        bump_collection_version(index_name)
+        
         return True
     
     except Exception as e:
@@ -128,6 +156,8 @@ def delete_file_vectors(index_name: str, file_hash: str):
             batch_size = 1000
             for i in range(0, len(ids_to_delete), batch_size):
                 collection.delete(ids=ids_to_delete[i:i + batch_size])
+            unindex_chunks(index_name, ids_to_delete)
+            bump_collection_version(index_name)
         
         return len(ids_to_delete)
     
@@ -139,31 +169,38 @@ def delete_file_vectors(index_name: str, file_hash: str):
 # Vector Search
 # -------------------------------------------------------------------
 
-def search_vectors_by_embedding(index_name: str, company_id: str, query_embedding: List[float] = None, file_name: Optional[str] = None, extra_filter: Optional[dict] = None) -> List[Dict[str, Any]]:
+def search_candidates(index_name: str, query_embedding: List[float] = None, top_k: int = 10, extra_filter: Optional[dict] = None, with_embeddings: bool = False) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
     """
-    Search ChromaDB collection for similar vectors.
+    Retrieve the `top_k` nearest vectors of a ChromaDB collection.
+
+    Embeddings are only fetched when `with_embeddings` is set (e.g. for MMR
+    reranking) and are returned as one contiguous float32 matrix whose rows
+    follow the order of the matches, instead of a list per match.
 
     Args:
         index_name (str): Name of ChromaDB collection.
         query_embedding (List[float]): Query embedding vector.
-        company_id (str): Company ID to filter by.
-        file_name (Optional[str]): Optional file filter.
+        top_k (int): Number of candidates to retrieve.
+        extra_filter (Optional[dict]): Metadata filter.
+        with_embeddings (bool): Also return the candidates' embeddings.
 
     Returns:
-        List[Dict[str, Any]]: Search results containing metadata and similarity scores.
+        Tuple[List[Dict[str, Any]], Optional[np.ndarray]]: Matches (id, score,
+        metadata, document) and the (len(matches), dim) float32 matrix or None.
     """
-    # try:
     if query_embedding is None:
         query_embedding = [0] * EMBEDDING_DIMENSION
 
     collection = chroma_client.get_or_create_collection(name=index_name)
 
+    include = ["metadatas", "documents", "distances"]
+    if with_embeddings:
+        include.append("embeddings")
     results = collection.query(
         query_embeddings=[query_embedding],
-        n_results=1000,
-        where=extra_filter,
-        include=["embeddings", "metadatas", "documents", "distances"],
-        # where_document=where_filter
+        n_results=max(1, top_k),
+        where=extra_filter or None,
+        include=include,
     )
 
     # Transform results to match Pinecone format
@@ -172,22 +209,102 @@ def search_vectors_by_embedding(index_name: str, company_id: str, query_embeddin
         for i, id_ in enumerate(results["ids"][0]):
             # ChromaDB returns distances, convert to similarity scores
             # For cosine distance: similarity = 1 - distance
-            distance = results["distances"][0][i]
-            similarity_score = 1 - distance
-
             matches.append({
                 "id": id_,
-                "score": similarity_score,
-                "values": results["embeddings"][0][i] if results["embeddings"] else None,
+                "score": 1 - results["distances"][0][i],
                 "metadata": results["metadatas"][0][i],
                 "document": results["documents"][0][i]
             })
 
-    return matches
+    embeddings = None
+    if with_embeddings and matches and results.get("embeddings") is not None:
+        embeddings = np.ascontiguousarray(results["embeddings"][0], dtype=np.float32)
+
+    return matches, embeddings
+
+
+def search_hybrid(index_name: str, query_text: str, query_embedding: List[float], top_k: int = 10, extra_filter: Optional[dict] = None, with_embeddings: bool = False, lexical_k: int = LEXICAL_SEARCH_CANDIDATES) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray]]:
+    """
+    Retrieve the `top_k` best candidates by fusing vector and BM25 rankings.
+
+    The vector top_k and the BM25 top `lexical_k` are merged by reciprocal
+    rank fusion. BM25 hits missing from the vector results are read from
+    ChromaDB by id under the same `extra_filter`, so filters hold for both
+    rankings. Without BM25 hits this is search_candidates.
+
+    Args:
+        index_name (str): Name of ChromaDB collection.
+        query_text (str): Query text for the BM25 ranking.
+        query_embedding (List[float]): Query embedding vector.
+        top_k (int): Number of candidates to return.
+        extra_filter (Optional[dict]): Metadata filter.
+        with_embeddings (bool): Also return the candidates' embeddings.
+        lexical_k (int): Number of BM25 matches to fuse.
 
-    # except Exception as e:
-    #     print(f"Error searching vectors: {str(e)}")
-    #     return []
+    Returns:
+        Tuple[List[Dict[str, Any]], Optional[np.ndarray]]: Matches (id, score,
+        rrf_score, metadata, document) in fused order and the float32 matrix or None.
+    """
+    lexical = search_lexical(index_name, query_text, lexical_k)
+    matches, embeddings = search_candidates(index_name, query_embedding, top_k, extra_filter, with_embeddings=with_embeddings or bool(lexical))
+    if not lexical:
+        return matches, embeddings
+
+    positions = {match["id"]: i for i, match in enumerate(matches)}
+    vector_ranking = list(positions)
+    missing = [chunk_id for chunk_id, _ in lexical if chunk_id not in positions]
+    if missing:
+        collection = chroma_client.get_or_create_collection(name=index_name)
+        fetched = collection.get(ids=missing, where=extra_filter or None, include=["metadatas", "documents", "embeddings"])
+        if fetched["ids"]:
+            extra = np.asarray(fetched["embeddings"], dtype=np.float32)
+            query = np.asarray(query_embedding, dtype=np.float32)
+            norms = np.linalg.norm(extra, axis=1) * (np.linalg.norm(query) or 1.0)
+            norms[norms == 0] = 1.0
+            scores = extra @ query / norms
+            for i, chunk_id in enumerate(fetched["ids"]):
+                positions[chunk_id] = len(matches)
+                matches.append({
+                    "id": chunk_id,
+                    "score": float(scores[i]),
+                    "metadata": fetched["metadatas"][i],
+                    "document": fetched["documents"][i]
+                })
+            embeddings = extra if embeddings is None else np.concatenate([embeddings, extra])
+
+    # Only BM25 hits that passed the filter are ranked
+    lexical_ranking = [chunk_id for chunk_id, _ in lexical if chunk_id in positions]
+    fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking], RRF_K)[:top_k]
+    order = [positions[chunk_id] for chunk_id, _ in fused]
+    results = [{**matches[i], "rrf_score": rrf_score} for i, (_, rrf_score) in zip(order, fused)]
+    if not with_embeddings or embeddings is None:
+        return results, None
+    return results, np.ascontiguousarray(embeddings[order])
+
+
+def search_vectors_by_embedding(index_name: str, company_id: str, query_embedding: List[float] = None, file_name: Optional[str] = None, extra_filter: Optional[dict] = None, top_k: int = 1000, include_values: bool = True) -> List[Dict[str, Any]]:
+    """
+    Search ChromaDB collection for similar vectors.
+
+    Kept for callers that want every match as a dict with its embedding under
+    "values"; prefer search_candidates with the real top_k.
+
+    Args:
+        index_name (str): Name of ChromaDB collection.
+        query_embedding (List[float]): Query embedding vector.
+        company_id (str): Company ID to filter by.
+        file_name (Optional[str]): Optional file filter.
+        top_k (int): Number of results to retrieve.
+        include_values (bool): Add each match's embedding as a list under "values".
+
+    Returns:
+        List[Dict[str, Any]]: Search results containing metadata and similarity scores.
+    """
+    matches, embeddings = search_candidates(index_name, query_embedding, top_k, extra_filter, with_embeddings=include_values)
+    if include_values:
+        for match, values in zip(matches, embeddings if embeddings is not None else []):
+            match["values"] = values.tolist()
+    return matches
 
 
 def search_vectors(index_name: str, company_id: str, query_text: str = None, top_k: int = 100, file_name: Optional[str] = None, extra_filter: Optional[dict] = None) -> Dict[str, Any]:
@@ -207,24 +324,22 @@ def search_vectors(index_name: str, company_id: str, query_text: str = None, top
     try:
         # Generate embedding from query text
         if query_text:
-            query_embedding = generate_embeddings([query_text])[0]
+            query_embedding = generate_query_embeddings([query_text])[0]
         else:
             query_embedding = [0] * EMBEDDING_DIMENSION
 
-        # Search using embedding
-        results = search_vectors_by_embedding(
+        # Search using embedding, fetching only the top_k matches and no vectors
+        results, _ = search_candidates(
             index_name=index_name,
-            company_id=company_id,
             query_embedding=query_embedding,
-            file_name=file_name,
+            top_k=top_k,
             extra_filter=extra_filter
         )
 
-        # Return top_k results
         return {
             "status": "success",
-            "data": results[:top_k],
-            "count": len(results[:top_k])
+            "data": results,
+            "count": len(results)
         }
 
     except Exception as e:
@@ -259,36 +374,8 @@ def find_defferent_features(product_vectors: list[dict]):
 # Feature Extraction (LLM Analysis)
 # -------------------------------------------------------------------
 
-def extract_differentiating_features(retrieved_items: List[Dict], query: str) -> Optional[Dict]:
-    """
-    Use LLM to identify top differentiating product features.
-    
-    Args:
-        retrieved_items (List[Dict]): List of ChromaDB search results with metadata.
-        query (str): User query text.
-    
-    Returns:
-        Optional[Dict]: Extracted differentiating features in JSON structure.
-    """
-    
-    text_result = [item["metadata"].get('pc_text', '') for item in retrieved_items]
-    
-    product_vectors = []
-    for item in text_result:
-        product = {}
-        features = item.split("|")
-        for f in features:
-            k = f.split(":")
-            key = k[0].strip()
-            value = f.split(f'{key}:')[-1].strip()
-            product[key] = value
-        product_vectors.append(product)
-    
-    response_content = find_defferent_features(product_vectors)
-    
-    if len(response_content.keys()) <= 3:
-        return None
-    
+def _llm_differentiating_features(candidates: Dict[str, List[Any]]) -> Optional[Dict]:
+    """Ask the LLM which candidate feature matters most for choosing a product"""
     prompt_second = f"""
         You are given a dictionary of candidate product features and their possible values.
     Your task is to select the top 1 most important features that would be most helpful for a user to decide between products.
@@ -305,7 +392,7 @@ def extract_differentiating_features(retrieved_items: List[Dict], query: str) ->
     Return your output in JSON format, with keys as feature names and values as their possible options.
 
     Features:
-    {response_content}
+    {candidates}
     """
     
     response_second = llm_bot.invoke(prompt_second)
@@ -319,57 +406,85 @@ def extract_differentiating_features(retrieved_items: List[Dict], query: str) ->
     return features
 
 
+def extract_differentiating_features(retrieved_items: List[Dict], query: str, index_name: Optional[str] = None) -> Optional[Dict]:
+    """
+    Identify the top differentiating product feature.
+    
+    Candidates come from the tenant's columnar product table (see
+    product_table) when `index_name` is given and the table holds every
+    result, otherwise from the column metadata of each result. In
+    "local" FEATURE_RANKING_MODE the feature with the highest value entropy
+    is picked without an LLM call; the LLM is only asked when no candidate is
+    rankable (or in "llm" mode), and its answers are memoized by candidate set.
+    
+    Args:
+        retrieved_items (List[Dict]): List of ChromaDB search results with metadata.
+        query (str): User query text.
+        index_name (Optional[str]): Collection the results come from.
+    
+    Returns:
+        Optional[Dict]: {feature: possible values}, or None when the results differ in 3 features or fewer.
+    """
+    table = product_tables.get(index_name) if index_name else None
+    analyzed = table.differentiating_features([item["id"] for item in retrieved_items]) if table else None
+    if analyzed:
+        candidates, ranked = analyzed
+    else:
+        products = [item["metadata"] or {} for item in retrieved_items]
+        candidates = candidate_features(products)
+        ranked = None
+    
+    if len(candidates) <= 3:
+        return None
+    
+    if FEATURE_RANKING_MODE == "local":
+        if ranked is None:
+            ranked = rank_features(products, candidates)
+        if ranked:
+            feature = ranked[0][0]
+            return {feature: candidates[feature]}
+    
+    signature = tuple((feature, tuple(sorted(map(str, values)))) for feature, values in sorted(candidates.items()))
+    features = feature_llm_cache.get(signature)
+    if features is None:
+        features = _llm_differentiating_features(candidates)
+        feature_llm_cache.set(signature, features)
+    return features
+
+
 # -------------------------------------------------------------------
 # Maximal Marginal Relevance (MMR)
 # -------------------------------------------------------------------
 
-def mmr(query_vec, doc_vecs, lambda_param=0.7, top_k=5):
+def mmr(query_vec, doc_vecs, lambda_param=0.7, top_k=5, relevance=None):
     """
     Apply Maximal Marginal Relevance (MMR) to diversify retrieval results.
     
     Args:
         query_vec (np.ndarray): Query embedding vector.
-        doc_vecs (List[np.ndarray]): Document embedding vectors.
+        doc_vecs (np.ndarray): (N, d) document embedding matrix (float32 is used as is).
         lambda_param (float): Trade-off between relevance and diversity.
         top_k (int): Number of top results to select.
+        relevance (Optional[np.ndarray]): Relevance per document, cosine similarity to the query by default.
         
     Returns:
-        List[int]: Indices of selected documents.
+        List[int]: Indices of selected documents, never repeated.
     """
-    doc_vecs = np.array(doc_vecs)
-    
-    # Compute similarity between query and all documents
-    similarities = np.dot(doc_vecs, query_vec) / (
-        np.linalg.norm(doc_vecs, axis=1) * np.linalg.norm(query_vec)
-    )
-    
-    selected = []
-    for _ in range(top_k):
-        if not selected:
-            idx = np.argmax(similarities)
-        else:
-            # Compute similarity between selected and remaining docs
-            sim_to_selected = np.max(
-                np.dot(doc_vecs, doc_vecs[selected].T)
-                / (np.linalg.norm(doc_vecs, axis=1)[:, None] * np.linalg.norm(doc_vecs[selected], axis=1)),
-                axis=1
-            )
-            
-            # Combine relevance and diversity
-            mmr_score = lambda_param * similarities - (1 - lambda_param) * sim_to_selected
-            idx = np.argmax(mmr_score)
-        
-        selected.append(idx)
-    
-    return selected
+    return mmr_select(query_vec, doc_vecs, lambda_param=lambda_param, top_k=top_k, relevance=relevance)
+
+
+def fused_relevance(results: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """RRF scores of hybrid results scaled to (0, 1] (best = 1), or None for a vector-only ranking"""
+    if not results or any("rrf_score" not in result for result in results):
+        return None
+    scores = np.asarray([result["rrf_score"] for result in results], dtype=np.float32)
+    return scores / scores.max()
 
 
 def feature_matching_for_filter(user_query:str, company_id:str):
-    """Match user query to available features."""
-    knowledges = get_all_knowledges(company_id)
-    features = []
-    for knowledge in knowledges:
-        features.extend(knowledge["extra"])
+    """Match user query to available features (low-cardinality columns of the tenant's product table)."""
+    table = product_tables.get(company_id)
+    features = table.available_features() if table else {}
         
     prompt = f"""
     You are a product search assistant.
@@ -381,7 +496,7 @@ def feature_matching_for_filter(user_query:str, company_id:str):
     {user_query}
 
     Available features:
-    {list(set(features))}
+    {features}
     """
     response = llm_bot.invoke(prompt)
     response.content = response.content.replace("```", "").replace("json\n{", "{")
@@ -400,6 +515,8 @@ def search_vectors_product(index_name: str, query_text: str, company_id: str, co
     Perform product search using embeddings, MMR diversification, 
     and LLM-based feature differentiation.
     
+    Results are cached per collection version and normalized query (see search_cache).
+    
     Args:
         index_name (str): ChromaDB collection name.
         query_text (str): User query text.
@@ -413,40 +530,34 @@ def search_vectors_product(index_name: str, query_text: str, company_id: str, co
             - diverse_results: Selected diverse product records
             - differentiating_features: Extracted distinguishing features
     """
+    cache_key = search_cache_key(index_name, query_text, top_k, {"file_name": file_name})
+    cached = product_search_cache.get(cache_key)
+    if cached is not None:
+        results, differentiating_features = cached
+        vectors_for_each_conversation[conversationId] = list(results)
+        return vectors_for_each_conversation[conversationId], differentiating_features
+    
     # Step 1: Generate query embedding
-    query_embedding = generate_embeddings([query_text])[0]
+    query_embedding = generate_query_embeddings([query_text])[0]
     
-    extra_filter = [i.strip() for i in query_text.split("|")]
-    filter_info = []
-    extra_filter_embedding = generate_embeddings(extra_filter)
-    for i in extra_filter_embedding:
-        result = search_vectors_by_embedding(f"{index_name}-columns", company_id, i, file_name, None)
-        if result:
-            sub_filter = {
-                "$or": [
-                    {result[0]['document'].split(":")[0].strip(): result[0]['document'].replace(f"{result[0]['document'].split(':')[0]}:", "").strip()},
-                    {result[1]['document'].split(":")[0].strip(): result[1]['document'].replace(f"{result[1]['document'].split(':')[0]}:", "").strip()}
-                ]
-            }
-            filter_info.append(sub_filter)
-    if len(filter_info) > 1:
-        filter_info = {"$and": filter_info}
-    elif len(filter_info) == 1:
-        filter_info = filter_info[0]
+    # Resolve the "|"-separated query parts to column filters in one batched lookup
+    filter_info = resolve_column_filter(index_name, query_text, generate_query_embeddings)
+    
+    # Step 2: Retrieve top matches from ChromaDB, fused with BM25 matches in hybrid mode
+    if PRODUCT_SEARCH_MODE == "hybrid":
+        initial_results, doc_vectors = search_hybrid(index_name, query_text, query_embedding, PRODUCT_SEARCH_CANDIDATES, filter_info, with_embeddings=True)
     else:
-        filter_info = {}
-    # Step 2: Retrieve top matches from ChromaDB
-    initial_results = search_vectors_by_embedding(index_name, company_id, query_embedding, file_name, filter_info)
+        initial_results, doc_vectors = search_candidates(index_name, query_embedding, PRODUCT_SEARCH_CANDIDATES, filter_info, with_embeddings=True)
     
     if not initial_results:
         vectors_for_each_conversation[conversationId] = []
+        product_search_cache.set(cache_key, ([], None))
         return [], None
-    doc_vectors = [r['values'] for r in initial_results if r.get('values') is not None]
 
-    
-    # Step 3: Apply MMR for diverse selection
-    if doc_vectors:
-        selected_indices = mmr(query_embedding, doc_vectors, lambda_param=0.7, top_k=min(top_k, len(initial_results)))
+    # Step 3: Apply MMR for diverse selection; hybrid results keep their fused ranking as relevance,
+    # so exact SKU or keyword hits found by BM25 are not dropped for a low cosine similarity
+    if doc_vectors is not None:
+        selected_indices = mmr(query_embedding, doc_vectors, lambda_param=0.7, top_k=min(top_k, len(initial_results)), relevance=fused_relevance(initial_results))
         vectors_for_each_conversation[conversationId] = [initial_results[i] for i in selected_indices]
     else:
         vectors_for_each_conversation[conversationId] = initial_results[:top_k]
@@ -454,7 +565,8 @@ def search_vectors_product(index_name: str, query_text: str, company_id: str, co
     search_vector_result = vectors_for_each_conversation.get(conversationId, [])
     
     # Step 4: Extract differentiating features
-    differentiating_features = extract_differentiating_features(initial_results, query_text) if initial_results else None
+    differentiating_features = extract_differentiating_features(initial_results, query_text, index_name) if initial_results else None
     
+    product_search_cache.set(cache_key, (search_vector_result, differentiating_features))
     return search_vector_result, differentiating_features
 
@@ -0,0 +1,286 @@
+"""
+CLIP image embedder, loaded on first use.
+
+torch, transformers and the CLIP weights take seconds to import and several
+hundred MB per process, and most API workers only serve auth, dashboard or
+text chat traffic. Nothing is imported until get_embedder() is first called
+(an image upload or search in IMAGE_EMBEDDING_SERVICE=local mode, or the
+embedding service process in socket mode), and the model is then shared by
+every thread of the process.
+
+The image tower runs on one of several backends, chosen with CLIP_BACKEND:
+
+- torch: full-precision CLIPModel.get_image_features (on CUDA when available),
+- torch-int8: the same model with its Linear layers dynamically quantized
+  to int8, on the CPU,
+- onnx: the image tower exported to CLIP_ONNX_PATH (exported on first use
+  when the file is missing) and run by ONNX Runtime on CLIP_ONNX_THREADS
+  threads; torch is then only needed for the export.
+
+Preprocessing is shared, and every backend must stay within PARITY_THRESHOLD
+cosine of the torch embeddings, so vectors from different backends can live
+in the same collection. Running this module measures API worker startup,
+benchmarks the backends (latency, throughput and parity) or exports the ONNX
+model.
+"""
+import io
+import os
+import threading
+from typing import Dict, Optional, Tuple
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_NAME = "openai/clip-vit-base-patch32"
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "torch").lower()
+CLIP_ONNX_PATH = os.getenv("CLIP_ONNX_PATH", "./models/clip-image.onnx")
+CLIP_ONNX_THREADS = int(os.getenv("CLIP_ONNX_THREADS", str(os.cpu_count() or 1)))
+
+# Minimum cosine similarity between a backend's embedding and the torch one
+PARITY_THRESHOLD = 0.99
+
+
+def get_device() -> str:
+    """Return best available computation device."""
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class TorchImageModel:
+    """Full-precision CLIPModel.get_image_features"""
+
+    def __init__(self, model_name: str):
+        from transformers import CLIPModel
+
+        self.device = get_device()
+        self.model = CLIPModel.from_pretrained(model_name).to(self.device)
+        self.model.eval()
+
+    def __call__(self, pixel_values: np.ndarray) -> np.ndarray:
+        import torch
+
+        with torch.no_grad():
+            features = self.model.get_image_features(pixel_values=torch.from_numpy(pixel_values).to(self.device))
+        return features.float().cpu().numpy()
+
+
+class QuantizedTorchImageModel(TorchImageModel):
+    """CLIPModel with int8 Linear weights and activations quantized per batch (CPU only)"""
+
+    def __init__(self, model_name: str):
+        import torch
+        from transformers import CLIPModel
+
+        self.device = "cpu"
+        model = CLIPModel.from_pretrained(model_name)
+        model.eval()
+        self.model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxImageModel:
+    """CLIP image tower exported to ONNX, run by ONNX Runtime on the CPU"""
+
+    def __init__(self, model_name: str, path: str = CLIP_ONNX_PATH, threads: int = CLIP_ONNX_THREADS):
+        import onnxruntime
+
+        if not os.path.exists(path):
+            export_onnx(model_name, path)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = max(1, threads)
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, pixel_values: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {"pixel_values": pixel_values.astype(np.float32, copy=False)})[0]
+
+
+def export_onnx(model_name: str = MODEL_NAME, path: str = CLIP_ONNX_PATH) -> str:
+    """Export the image tower of `model_name` (pixel_values -> image_features, any batch size) to `path`"""
+    import torch
+    from transformers import CLIPModel
+
+    class ImageFeatures(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model.get_image_features(pixel_values=pixel_values)
+
+    model = CLIPModel.from_pretrained(model_name)
+    model.eval()
+    size = model.config.vision_config.image_size
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Written under a temporary name so a failed export never leaves a truncated model behind
+    partial = f"{path}.partial"
+    with torch.no_grad():
+        torch.onnx.export(
+            ImageFeatures(model),
+            (torch.zeros(1, 3, size, size),),
+            partial,
+            input_names=["pixel_values"],
+            output_names=["image_features"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_features": {0: "batch"}},
+            opset_version=17,
+            dynamo=False,
+        )
+    os.replace(partial, path)
+    return path
+
+
+BACKENDS = {
+    "torch": TorchImageModel,
+    "torch-int8": QuantizedTorchImageModel,
+    "onnx": OnnxImageModel,
+}
+
+
+class CLIPEmbedder:
+    """Encapsulates CLIP model + preprocessing for efficient embedding."""
+
+    _model_cache: Dict[Tuple[str, str], object] = {}
+    _processor_cache: Dict[str, object] = {}
+
+    def __init__(self, model_name: str = MODEL_NAME, backend: str = CLIP_BACKEND):
+        from transformers import CLIPImageProcessor
+
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown CLIP backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+        self.backend = backend
+        if (model_name, backend) not in CLIPEmbedder._model_cache:
+            CLIPEmbedder._model_cache[(model_name, backend)] = BACKENDS[backend](model_name)
+        if model_name not in CLIPEmbedder._processor_cache:
+            CLIPEmbedder._processor_cache[model_name] = CLIPImageProcessor.from_pretrained(model_name)
+        self.model = CLIPEmbedder._model_cache[(model_name, backend)]
+        self.processor = CLIPEmbedder._processor_cache[model_name]
+
+    def preprocess(self, image_bytes) -> np.ndarray:
+        """Decode an image (BytesIO, bytes or RGB array) into CLIP pixel values of shape (1, 3, H, W)."""
+        if isinstance(image_bytes, np.ndarray):
+            return self.processor(images=Image.fromarray(image_bytes), return_tensors="np")["pixel_values"]
+        if isinstance(image_bytes, (bytes, bytearray)):
+            image_bytes = io.BytesIO(image_bytes)
+        with Image.open(image_bytes) as image:
+            image = image.convert("RGB")
+            return self.processor(images=image, return_tensors="np")["pixel_values"]
+
+    def forward(self, pixel_values: list) -> np.ndarray:
+        """Encode preprocessed images in one forward pass into normalized CLIP embeddings (n, dim)."""
+        features = self.model(np.concatenate(pixel_values))
+        norms = np.maximum(np.linalg.norm(features, axis=-1, keepdims=True), 1e-12)
+        return (features / norms).astype(np.float32)
+
+    def encode_image_bytes(self, image_bytes: io.BytesIO) -> np.ndarray:
+        """Encode an image (BytesIO) into a normalized CLIP embedding."""
+        return self.forward([self.preprocess(image_bytes)])[0]
+
+
+_embedder: Optional[CLIPEmbedder] = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> CLIPEmbedder:
+    """The process-wide embedder, loaded by the first caller"""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = CLIPEmbedder()
+    return _embedder
+
+
+def is_loaded() -> bool:
+    return _embedder is not None
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import argparse
+    import resource
+
+    parser = argparse.ArgumentParser(description="Measure and compare CLIP image embedding backends")
+    commands = parser.add_subparsers(dest="command", required=True)
+    startup = commands.add_parser("startup", help="API worker startup with and without the CLIP model")
+    startup.add_argument("--app", default="main", help="module imported as the API worker")
+    benchmark = commands.add_parser("benchmark", help="latency, throughput and parity against torch of each backend")
+    benchmark.add_argument("--model", default=MODEL_NAME)
+    benchmark.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    benchmark.add_argument("--images", type=int, default=64)
+    benchmark.add_argument("--batch", type=int, default=16)
+    export = commands.add_parser("export-onnx", help="export the image tower for CLIP_BACKEND=onnx")
+    export.add_argument("--model", default=MODEL_NAME)
+    export.add_argument("--path", default=CLIP_ONNX_PATH)
+    args = parser.parse_args()
+
+    def rss_mb() -> float:
+        # ru_maxrss is in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    if args.command == "startup":
+        started = time.perf_counter()
+        __import__(args.app)
+        print(f"import {args.app}: {time.perf_counter() - started:.2f}s rss={rss_mb():.0f}MB torch_loaded={'torch' in sys.modules}")
+
+        started = time.perf_counter()
+        sample = io.BytesIO()
+        Image.new("RGB", (640, 480), "white").save(sample, format="JPEG")
+        get_embedder().encode_image_bytes(sample)
+        print(f"load + first encode ({CLIP_BACKEND}): {time.perf_counter() - started:.2f}s rss={rss_mb():.0f}MB")
+
+    elif args.command == "export-onnx":
+        started = time.perf_counter()
+        export_onnx(args.model, args.path)
+        print(f"exported {args.model} to {args.path} in {time.perf_counter() - started:.1f}s")
+
+    else:
+        # Product-photo-like inputs: a shape on a colour gradient, JPEG-compressed
+        rng = np.random.default_rng(0)
+        gradient = np.linspace(0, 1, 224)[None, :, None]
+        samples = []
+        for _ in range(args.images):
+            pixels = (rng.uniform(0, 255, 3) * gradient + rng.uniform(0, 255, 3) * (1 - gradient)).repeat(224, axis=0)
+            top, left = rng.integers(0, 150, 2)
+            pixels[top:top + 70, left:left + 70] = rng.uniform(0, 255, 3)
+            pixels += rng.normal(0, 8, pixels.shape)
+            buffer = io.BytesIO()
+            Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(buffer, format="JPEG")
+            samples.append(buffer.getvalue())
+
+        # torch always runs first: it is the parity baseline
+        baseline = None
+        failed = False
+        for backend in ["torch"] + [name for name in args.backends if name != "torch"]:
+            started = time.perf_counter()
+            embedder = CLIPEmbedder(args.model, backend)
+            loaded = time.perf_counter() - started
+            pixel_values = [embedder.preprocess(sample) for sample in samples]
+            embedder.forward(pixel_values[:1])
+
+            latencies = []
+            for values in pixel_values:
+                started = time.perf_counter()
+                embedder.forward([values])
+                latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            embeddings = np.concatenate([
+                embedder.forward(pixel_values[i:i + args.batch]) for i in range(0, len(pixel_values), args.batch)
+            ])
+            elapsed = time.perf_counter() - started
+
+            if baseline is None:
+                baseline = embeddings
+            cosine = (embeddings * baseline).sum(axis=1)
+            failed = failed or cosine.min() < PARITY_THRESHOLD
+            if backend in args.backends:
+                print(
+                    f"{backend:<11} load={loaded:.1f}s p50={np.percentile(latencies, 50) * 1000:.1f}ms "
+                    f"p95={np.percentile(latencies, 95) * 1000:.1f}ms images/s@{args.batch}={len(samples) / elapsed:.1f} "
+                    f"cosine_min={cosine.min():.4f} cosine_mean={cosine.mean():.4f} "
+                    f"parity={'ok' if cosine.min() >= PARITY_THRESHOLD else 'FAIL'} peak_rss={rss_mb():.0f}MB"
+                )
+        sys.exit(1 if failed else 0)
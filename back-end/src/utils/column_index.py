@@ -0,0 +1,242 @@
+"""
+In-memory index of the distinct column values of each tenant.
+
+Filter terms in product queries ("'Conductor': Copper", "PVC", "'Size': 1.5")
+usually name a column value literally. Each tenant gets a local index of the
+(column_name, column_value) pairs stored in its "<company_id>-columns"
+collection, so those terms resolve without an embedding or a ChromaDB query:
+
+1. exact: the lowercased value equals a stored value,
+2. normalized: equal once everything but letters and digits is dropped
+   ("4 mm" / "4mm", "P.V.C" / "pvc"),
+3. fuzzy: trigram candidates re-scored with an edit-distance ratio of at least
+   COLUMN_INDEX_FUZZY_RATIO ("coper" / "copper").
+
+When the term names a column ("'Conductor': Copper") only that column is
+searched. Terms that resolve to nothing are left to the embedding-based
+lookup in filter_resolver.
+
+Indexes are built from ChromaDB after each vectorization (and lazily after a
+restart) and dropped together with the filter cache by
+filter_resolver.invalidate_column_filters. That only happens in the worker that
+handled the upload or removal, so every index is also rebuilt once it is
+COLUMN_INDEX_TTL seconds old. That rebuild scans the whole collection, so it
+runs on a background thread while lookups keep using the expired index; only
+a tenant's first lookup waits for a build. At most COLUMN_INDEX_MAX_TENANTS
+indexes are kept per process (least recently used are dropped).
+"""
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from src.service_client import chroma_client
+from src.utils.file_utills import column_meta_key
+
+load_dotenv()
+
+COLUMN_INDEX_ENABLED = os.getenv("COLUMN_INDEX_ENABLED", "true").lower() == "true"
+COLUMN_INDEX_FUZZY_RATIO = float(os.getenv("COLUMN_INDEX_FUZZY_RATIO", "0.85"))
+COLUMN_INDEX_TTL = float(os.getenv("COLUMN_INDEX_TTL", "300"))
+COLUMN_INDEX_MAX_TENANTS = int(os.getenv("COLUMN_INDEX_MAX_TENANTS", "256"))
+
+# Shorter terms are only matched exactly or normalized ("ks" must not match "ss")
+FUZZY_MIN_LENGTH = 4
+# Trigram candidates re-scored per fuzzy lookup
+FUZZY_CANDIDATES = 20
+# Pairs read from ChromaDB per call while building
+BUILD_BATCH_SIZE = 5000
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+Pair = Tuple[str, str]
+
+
+def normalize_value(text: str) -> str:
+    """Lowercase, unicode-normalize, unquote and collapse whitespace (stored values are lowercased)"""
+    text = unicodedata.normalize("NFKC", str(text)).strip().strip("'\"").strip()
+    return " ".join(text.lower().split())
+
+
+def compact_value(text: str) -> str:
+    """Letters and digits only"""
+    return _NON_ALNUM.sub("", normalize_value(text))
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def split_filter_term(term: str) -> Tuple[Optional[str], str]:
+    """Split "'Column': value" into (column meta key, value); a bare value has no column"""
+    if ":" in term:
+        column, value = term.split(":", 1)
+        column = column.strip().strip("'\"").strip()
+        if column:
+            return column_meta_key(column), value
+    return None, term
+
+
+class ColumnValueIndex:
+    """Exact, normalized and fuzzy lookup of the column values of one tenant"""
+
+    def __init__(self, pairs: List[Pair]):
+        self.columns: Set[str] = set()
+        self._exact: Dict[str, List[Pair]] = {}
+        self._compact: Dict[str, List[Pair]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        for column, value in dict.fromkeys(pairs):
+            self.columns.add(column)
+            self._exact.setdefault(normalize_value(value), []).append((column, value))
+            key = compact_value(value)
+            if not key:
+                continue
+            if key not in self._compact:
+                for gram in _trigrams(key):
+                    self._trigrams.setdefault(gram, set()).add(key)
+            self._compact.setdefault(key, []).append((column, value))
+
+    def __len__(self):
+        return sum(len(pairs) for pairs in self._exact.values())
+
+    def lookup(self, term: str, limit: int = 2) -> Tuple[List[Pair], Optional[str]]:
+        """
+        Resolve a filter term to (column, value) pairs.
+
+        Returns:
+            (pairs, match kind) where kind is "exact", "normalized" or "fuzzy",
+            or ([], None) when the term has to go to the embedding lookup
+        """
+        column, value = split_filter_term(term)
+        if column not in self.columns:
+            column = None
+
+        def keep(pairs: List[Pair]) -> List[Pair]:
+            return [pair for pair in pairs if column is None or pair[0] == column][:limit]
+
+        pairs = keep(self._exact.get(normalize_value(value), []))
+        if pairs:
+            return pairs, "exact"
+
+        key = compact_value(value)
+        if not key:
+            return [], None
+        pairs = keep(self._compact.get(key, []))
+        if pairs:
+            return pairs, "normalized"
+
+        if len(key) < FUZZY_MIN_LENGTH:
+            return [], None
+        overlap: Dict[str, int] = {}
+        for gram in _trigrams(key):
+            for candidate in self._trigrams.get(gram, ()):
+                overlap[candidate] = overlap.get(candidate, 0) + 1
+        best = sorted(overlap, key=overlap.get, reverse=True)[:FUZZY_CANDIDATES]
+        scored = sorted(
+            ((SequenceMatcher(None, key, candidate).ratio(), candidate) for candidate in best),
+            reverse=True,
+        )
+        pairs = []
+        for ratio, candidate in scored:
+            if ratio < COLUMN_INDEX_FUZZY_RATIO:
+                break
+            pairs.extend(keep(self._compact[candidate]))
+        if pairs:
+            return pairs[:limit], "fuzzy"
+        return [], None
+
+
+class ColumnIndexRegistry:
+    """Per-tenant ColumnValueIndex instances, built on first use and rebuilt in the background once older than `ttl`"""
+
+    def __init__(self, ttl: float = COLUMN_INDEX_TTL, max_tenants: int = COLUMN_INDEX_MAX_TENANTS):
+        self.ttl = ttl
+        self.max_tenants = max(1, max_tenants)
+        self._indexes: "OrderedDict[str, Tuple[float, ColumnValueIndex]]" = OrderedDict()  # index_name -> (built_at, index)
+        self._generations: Dict[str, int] = {}  # index_name -> bumped by every build and invalidation
+        self._rebuilding: Set[str] = set()
+        self._lock = threading.Lock()
+        self._counters = {"builds": 0, "expired": 0, "stale": 0, "exact": 0, "normalized": 0, "fuzzy": 0, "residue": 0}
+
+    def build(self, index_name: str) -> ColumnValueIndex:
+        """(Re)build the index of a tenant from its columns collection"""
+        with self._lock:
+            generation = self._generations[index_name] = self._generations.get(index_name, 0) + 1
+        collection = chroma_client.get_or_create_collection(name=f"{index_name}-columns", metadata={"hnsw:space": "cosine"})
+        pairs = []
+        offset = 0
+        while True:
+            results = collection.get(include=["metadatas"], limit=BUILD_BATCH_SIZE, offset=offset)
+            for metadata in results["metadatas"]:
+                if metadata and "column_name" in metadata and "column_value" in metadata:
+                    pairs.append((metadata["column_name"], str(metadata["column_value"])))
+            if len(results["ids"]) < BUILD_BATCH_SIZE:
+                break
+            offset += len(results["ids"])
+        index = ColumnValueIndex(pairs)
+        with self._lock:
+            self._counters["builds"] += 1
+            # A later build or an invalidation started while this one was reading; its result wins
+            if self._generations.get(index_name) != generation:
+                return index
+            self._indexes[index_name] = (time.monotonic(), index)
+            self._indexes.move_to_end(index_name)
+            while len(self._indexes) > self.max_tenants:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _rebuild(self, index_name: str):
+        try:
+            self.build(index_name)
+        except Exception as e:
+            print(f"Column index rebuild failed for {index_name}: {str(e)}")
+        finally:
+            with self._lock:
+                self._rebuilding.discard(index_name)
+
+    def get(self, index_name: str) -> ColumnValueIndex:
+        """
+        The index of a tenant. Only the first lookup waits for a build: an
+        expired index keeps answering while a background thread rebuilds it,
+        since another worker may have changed the collection since this one
+        built it.
+        """
+        with self._lock:
+            entry = self._indexes.get(index_name)
+            if entry is not None:
+                self._indexes.move_to_end(index_name)
+                if self.ttl > 0 and time.monotonic() - entry[0] > self.ttl:
+                    self._counters["stale"] += 1
+                    if index_name not in self._rebuilding:
+                        self._rebuilding.add(index_name)
+                        self._counters["expired"] += 1
+                        threading.Thread(target=self._rebuild, args=(index_name,), name="column-index-rebuild", daemon=True).start()
+        return entry[1] if entry is not None else self.build(index_name)
+
+    def lookup(self, index_name: str, term: str, limit: int = 2) -> List[Pair]:
+        pairs, kind = self.get(index_name).lookup(term, limit)
+        with self._lock:
+            self._counters[kind or "residue"] += 1
+        return pairs
+
+    def invalidate(self, index_name: str):
+        with self._lock:
+            self._indexes.pop(index_name, None)
+            self._generations[index_name] = self._generations.get(index_name, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tenants": len(self._indexes),
+                "values": sum(len(index) for _, index in self._indexes.values()),
+                "ttl_seconds": self.ttl,
+                **self._counters,
+            }
+
+
+column_index = ColumnIndexRegistry()
@@ -0,0 +1,171 @@
+"""
+Two-tier cache for query embeddings.
+
+Product questions repeat heavily across customers, so embeddings for query
+strings are cached by (model, normalized text):
+
+- an in-memory LRU (EMBEDDING_CACHE_SIZE entries, optional EMBEDDING_CACHE_TTL)
+- an optional SQLite tier (EMBEDDING_CACHE_PATH) holding float32 vectors,
+  so the cache survives restarts and is shared by all workers on a host.
+  It keeps at most EMBEDDING_CACHE_DISK_MAX_ROWS vectors; the oldest
+  written rows are pruned first.
+
+Embeddings are deterministic for a given model and text, so the TTL only
+exists to bound memory for long-running processes; 0 disables it.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "0"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+EMBEDDING_CACHE_DISK = os.getenv("EMBEDDING_CACHE_DISK", "true").lower() == "true"
+EMBEDDING_CACHE_DISK_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ROWS", "200000"))
+
+# Rows written between two checks of the disk tier's size
+_PRUNE_EVERY = 1000
+
+
+def normalize_text(text: str) -> str:
+    """Normalize unicode and whitespace so trivially different strings share an entry"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """In-memory LRU backed by an optional SQLite store of float32 vectors"""
+
+    def __init__(
+        self,
+        max_entries: int = EMBEDDING_CACHE_SIZE,
+        ttl: float = EMBEDDING_CACHE_TTL,
+        path: Optional[str] = EMBEDDING_CACHE_PATH if EMBEDDING_CACHE_DISK else None,
+        max_disk_rows: int = EMBEDDING_CACHE_DISK_MAX_ROWS,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_rows = max_disk_rows
+        self._unpruned = 0
+        self._memory = OrderedDict()  # key -> (stored_at, float32 vector)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stored": 0, "pruned": 0}
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at_idx ON embeddings (created_at)")
+                self._prune()
+            except sqlite3.Error as e:
+                print(f"Embedding disk cache disabled: {e}")
+                self._conn = None
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[str, np.ndarray]:
+        """Return {normalized text: vector} for every text found in either tier"""
+        found = {}
+        now = time.time()
+        keys = {cache_key(model, text): text for text in texts}
+        disk_keys = []
+        with self._lock:
+            for key, text in keys.items():
+                entry = self._memory.get(key)
+                if entry is not None and (self.ttl <= 0 or now - entry[0] < self.ttl):
+                    self._memory.move_to_end(key)
+                    found[text] = entry[1]
+                    self._counters["memory_hits"] += 1
+                else:
+                    disk_keys.append(key)
+
+            if disk_keys and self._conn is not None:
+                placeholders = ",".join("?" * len(disk_keys))
+                try:
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", disk_keys
+                    ).fetchall()
+                except sqlite3.Error as e:
+                    print(f"Error reading embedding cache: {e}")
+                    rows = []
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[keys[key]] = vector
+                    self._remember(key, vector, now)
+                    self._counters["disk_hits"] += 1
+
+            self._counters["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, np.ndarray]):
+        """Store {normalized text: vector} in both tiers"""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in items.items():
+                key = cache_key(model, text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector, now)
+                rows.append((key, model, int(vector.shape[0]), vector.tobytes(), now))
+            self._counters["stored"] += len(rows)
+            if rows and self._conn is not None:
+                try:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)", rows
+                    )
+                except sqlite3.Error as e:
+                    print(f"Error writing embedding cache: {e}")
+                self._unpruned += len(rows)
+                if self._unpruned >= _PRUNE_EVERY:
+                    self._prune()
+
+    def _prune(self):
+        # Caller holds self._lock (or is the constructor). Drops the oldest rows past max_disk_rows.
+        self._unpruned = 0
+        if self.max_disk_rows <= 0:
+            return
+        try:
+            (rows,) = self._conn.execute("SELECT count(*) FROM embeddings").fetchone()
+            excess = rows - self.max_disk_rows
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY created_at LIMIT ?)", (excess,)
+                )
+                self._counters["pruned"] += excess
+        except sqlite3.Error as e:
+            print(f"Error pruning embedding cache: {e}")
+
+    def _remember(self, key: str, vector: np.ndarray, now: float):
+        # Caller holds self._lock
+        self._memory[key] = (now, vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                "memory_entries": len(self._memory),
+                "disk": self._conn is not None,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                **self._counters,
+            }
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,381 @@
+"""
+Concurrent, rate-limited embedding pipeline for file ingestion.
+
+vectorize_file used to embed one token-bounded batch at a time and write it
+to ChromaDB before requesting the next one. This pipeline:
+
+- plans request-sized batches (token and item limits of the embeddings API),
+- keeps EMBEDDING_CONCURRENCY embedding requests in flight,
+- throttles them with token-per-minute and request-per-minute buckets,
+- retries failed requests with exponential backoff and jitter,
+- writes finished batches to ChromaDB from the calling thread while the
+  next requests are still running, so embedding and storage overlap,
+- pulls chunks lazily, so a streaming loader's generator is read only as
+  fast as batches are submitted and memory stays bounded.
+
+EMBEDDING_PROVIDER=fake swaps OpenAI for a deterministic local provider,
+which makes ingestion throughput measurable offline (see the __main__ block).
+"""
+import os
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSION = 1536
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_TPM_LIMIT = int(os.getenv("EMBEDDING_TPM_LIMIT", "1000000"))
+EMBEDDING_RPM_LIMIT = int(os.getenv("EMBEDDING_RPM_LIMIT", "3000"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_FAKE_LATENCY_MS = float(os.getenv("EMBEDDING_FAKE_LATENCY_MS", "0"))
+
+# Per-request limits of the OpenAI embeddings endpoint
+MAX_TOKENS_PER_REQUEST = 300000
+MAX_ITEMS_PER_REQUEST = 2000
+# Chunks token-counted and split into batches at a time
+PLANNING_WINDOW = MAX_ITEMS_PER_REQUEST * 5
+
+
+# -------------------------------------------------------------------
+# Providers
+# -------------------------------------------------------------------
+
+class OpenAIEmbeddingProvider:
+    """Embeds texts with the OpenAI embeddings API"""
+
+    name = "openai"
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        from src.utils.embedding_utills import generate_embeddings
+        return generate_embeddings(texts)
+
+
+class FakeEmbeddingProvider:
+    """
+    Deterministic local embeddings for offline benchmarking.
+
+    Each text maps to a unit vector seeded by its hash, so identical texts get
+    identical vectors. `latency_ms` simulates the round trip of one request.
+    """
+
+    name = "fake"
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, latency_ms: float = EMBEDDING_FAKE_LATENCY_MS):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.dimension, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors.tolist()
+
+
+def get_embedding_provider(name: str = EMBEDDING_PROVIDER):
+    """Return the embedding provider configured by EMBEDDING_PROVIDER"""
+    if name == "fake":
+        return FakeEmbeddingProvider()
+    return OpenAIEmbeddingProvider()
+
+
+# -------------------------------------------------------------------
+# Rate Limiting
+# -------------------------------------------------------------------
+
+class RateLimiter:
+    """Token bucket refilled continuously up to `per_minute` units"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Block until `amount` units are available. Returns the time spent waiting."""
+        if self.capacity <= 0:
+            return 0.0
+        # A single request larger than the bucket waits for a full bucket, then goes through
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return waited
+                delay = (amount - self.available) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+# -------------------------------------------------------------------
+# Batch Planning
+# -------------------------------------------------------------------
+
+def count_tokens(texts: List[str], model: str = EMBEDDING_MODEL) -> List[int]:
+    """Exact token counts with tiktoken (batch encoding runs in parallel native threads)"""
+    import tiktoken
+
+    enc = tiktoken.encoding_for_model(model)
+    return [len(tokens) for tokens in enc.encode_ordinary_batch(texts)]
+
+
+def estimate_tokens(texts: List[str]) -> List[int]:
+    """Rough token counts (~4 characters per token), for offline benchmarks"""
+    return [len(text) // 4 + 1 for text in texts]
+
+
+def plan_embedding_batches(
+    chunks: List[Dict[str, Any]],
+    max_tokens: int = MAX_TOKENS_PER_REQUEST,
+    max_items: int = MAX_ITEMS_PER_REQUEST,
+    token_counter: Callable[[List[str]], List[int]] = count_tokens,
+) -> List[Tuple[List[Dict[str, Any]], List[str], int]]:
+    """
+    Split chunks into request-sized batches.
+
+    Args:
+        chunks: Chunks with a "text" key
+        max_tokens: Token limit per request
+        max_items: Input limit per request
+        token_counter: Returns the token count of every text
+
+    Returns:
+        List of (chunks, texts, token_count) tuples
+    """
+    texts = [chunk["text"] for chunk in chunks]
+    token_counts = token_counter(texts)
+
+    batches = []
+    start, current_tokens = 0, 0
+    for i, tokens in enumerate(token_counts):
+        if tokens > max_tokens:
+            raise Exception(f"Single text too large ({tokens} tokens) exceeds limit {max_tokens}")
+        if i > start and (current_tokens + tokens > max_tokens or i - start >= max_items):
+            batches.append((chunks[start:i], texts[start:i], current_tokens))
+            start, current_tokens = i, 0
+        current_tokens += tokens
+    if start < len(chunks):
+        batches.append((chunks[start:], texts[start:], current_tokens))
+    return batches
+
+
+def iter_embedding_batches(
+    chunks: Iterable[Dict[str, Any]],
+    token_counter: Callable[[List[str]], List[int]] = count_tokens,
+    window: int = PLANNING_WINDOW,
+) -> Iterator[Tuple[List[Dict[str, Any]], List[str], int]]:
+    """
+    Plan batches lazily, `window` chunks at a time, so chunk generators from the
+    streaming loaders are consumed only as fast as batches are submitted.
+    """
+    if isinstance(chunks, list):
+        for start in range(0, len(chunks), window):
+            yield from plan_embedding_batches(chunks[start:start + window], token_counter=token_counter)
+        return
+    iterator = iter(chunks)
+    while True:
+        part = list(islice(iterator, window))
+        if not part:
+            return
+        yield from plan_embedding_batches(part, token_counter=token_counter)
+
+
+# -------------------------------------------------------------------
+# Pipeline
+# -------------------------------------------------------------------
+
+# HTTP statuses worth retrying: timeout, conflict, rate limit and server errors
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """
+    Whether a failed embedding request may succeed when repeated: rate limits,
+    timeouts, connection errors and 5xx responses. Bad requests (400, context
+    length) and auth errors (401/403) fail immediately. Wrapped errors are
+    judged by their cause.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status = getattr(error, "status_code", None)
+        if isinstance(status, int):
+            return status in RETRYABLE_STATUS or status >= 500
+        # openai.APIConnectionError / APITimeoutError carry no status code
+        if isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in ("APIConnectionError", "APITimeoutError"):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _embed_with_retry(provider, texts: List[str], tokens: int, rpm: RateLimiter, tpm: RateLimiter, max_retries: int, stats: Dict[str, Any], lock):
+    attempt = 0
+    while True:
+        throttled = rpm.acquire(1) + tpm.acquire(tokens)
+        try:
+            embeddings = provider.embed(texts)
+            with lock:
+                stats["throttled_seconds"] += throttled
+            return embeddings
+        except Exception as e:
+            attempt += 1
+            if attempt > max_retries or not is_retryable_error(e):
+                raise
+            delay = min(60.0, 2 ** (attempt - 1)) * (1 + random.random())
+            print(f"Embedding request failed ({e}), retry {attempt}/{max_retries} in {delay:.1f}s")
+            with lock:
+                stats["retries"] += 1
+                stats["throttled_seconds"] += throttled
+            time.sleep(delay)
+
+
+def run_embedding_pipeline(
+    jobs: List[Tuple[str, Iterable[Dict[str, Any]]]],
+    store: Callable[[str, List[Dict[str, Any]], List[List[float]]], Any] = None,
+    provider=None,
+    concurrency: int = EMBEDDING_CONCURRENCY,
+    tpm_limit: int = EMBEDDING_TPM_LIMIT,
+    rpm_limit: int = EMBEDDING_RPM_LIMIT,
+    max_retries: int = EMBEDDING_MAX_RETRIES,
+    token_counter: Callable[[List[str]], List[int]] = count_tokens,
+) -> Dict[str, Any]:
+    """
+    Embed chunks concurrently and store each finished batch.
+
+    Args:
+        jobs: List of (index_name, chunks) pairs. Chunks may be a generator; it is
+            consumed lazily and jobs run one after another.
+        store: Called as store(index_name, chunks, embeddings) for every finished
+            batch, always from the calling thread. Defaults to store_vectors_in_chroma.
+        provider: Embedding provider, defaults to EMBEDDING_PROVIDER
+        concurrency: Embedding requests in flight
+        tpm_limit: Tokens per minute across all requests (0 disables)
+        rpm_limit: Requests per minute across all requests (0 disables)
+        max_retries: Retries per request before the pipeline fails
+        token_counter: Token counter used to size batches and feed the TPM limiter
+
+    Returns:
+        Dictionary with batch, text and token counts, timings and throughput
+    """
+    if store is None:
+        from src.utils.chroma_utils import store_vectors_in_chroma
+        store = store_vectors_in_chroma
+    provider = provider or get_embedding_provider()
+    concurrency = max(1, concurrency)
+
+    started = time.monotonic()
+    work = (
+        (index_name, batch_chunks, texts, tokens)
+        for index_name, chunks in jobs
+        for batch_chunks, texts, tokens in iter_embedding_batches(chunks, token_counter=token_counter)
+    )
+
+    rpm, tpm = RateLimiter(rpm_limit), RateLimiter(tpm_limit)
+    lock = threading.Lock()
+    stats = {
+        "provider": provider.name,
+        "concurrency": concurrency,
+        "batches": 0,
+        "texts": 0,
+        "tokens": 0,
+        "retries": 0,
+        "throttled_seconds": 0.0,
+        "store_seconds": 0.0,
+        "plan_seconds": 0.0,
+    }
+
+    # Keep a bounded number of batches in flight or finished-but-unstored in memory
+    max_pending = concurrency * 2
+    pending = {}
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed") as executor:
+        try:
+            while not exhausted or pending:
+                while not exhausted and len(pending) < max_pending:
+                    # Pulling the next batch may read and convert the next block of the file
+                    plan_started = time.monotonic()
+                    item = next(work, None)
+                    stats["plan_seconds"] += time.monotonic() - plan_started
+                    if item is None:
+                        exhausted = True
+                        break
+                    index_name, batch_chunks, texts, tokens = item
+                    stats["batches"] += 1
+                    stats["texts"] += len(texts)
+                    stats["tokens"] += tokens
+                    future = executor.submit(_embed_with_retry, provider, texts, tokens, rpm, tpm, max_retries, stats, lock)
+                    pending[future] = (index_name, batch_chunks)
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index_name, batch_chunks = pending.pop(future)
+                    embeddings = future.result()
+                    store_started = time.monotonic()
+                    store(index_name, batch_chunks, embeddings)
+                    stats["store_seconds"] += time.monotonic() - store_started
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    finished = time.monotonic()
+    stats["total_seconds"] = round(finished - started, 3)
+    elapsed = max(finished - started - stats["plan_seconds"], 1e-9)
+    stats["plan_seconds"] = round(stats["plan_seconds"], 3)
+    stats["store_seconds"] = round(stats["store_seconds"], 3)
+    stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+    stats["texts_per_second"] = round(stats["texts"] / elapsed, 1)
+    stats["tokens_per_second"] = round(stats["tokens"] / elapsed, 1)
+    return stats
+
+
+if __name__ == "__main__":
+    # Offline throughput benchmark: fake provider with simulated latency, no-op store
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the embedding pipeline offline")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--dimension", type=int, default=256)
+    args = parser.parse_args()
+
+    rows = [
+        {"text": f"sku: P{i:07d}, name: Product {i}, color: {['red', 'blue', 'green'][i % 3]}, price: {i % 500}.99", "metadata": {}}
+        for i in range(args.rows)
+    ]
+    provider = FakeEmbeddingProvider(dimension=args.dimension, latency_ms=args.latency_ms)
+    for concurrency in args.concurrency:
+        result = run_embedding_pipeline(
+            [("benchmark", rows)],
+            store=lambda *_: None,
+            provider=provider,
+            concurrency=concurrency,
+            tpm_limit=0,
+            rpm_limit=0,
+            token_counter=estimate_tokens,
+        )
+        print(
+            f"concurrency={concurrency:<3} batches={result['batches']:<5} "
+            f"total={result['total_seconds']:.2f}s texts/s={result['texts_per_second']:.0f}"
+        )
@@ -1,4 +1,5 @@
 from typing import List
+import numpy as np
 from src.service_client import openai_service
 
 # Constants
@@ -21,4 +22,29 @@ def generate_embeddings(texts: List[str]) -> List[List[float]]:
         )
         return [embedding.embedding for embedding in response.data]
     except Exception as e:
-        raise Exception(f"Error generating embeddings: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error generating embeddings: {str(e)}") from e
+
+def generate_query_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Generate embeddings for search queries, served from the embedding cache when possible
+
+    Texts are normalized (unicode and whitespace) before lookup, and only the
+    misses are sent to OpenAI in a single request.
+
+    Args:
+        texts: List of query strings to embed
+
+    Returns:
+        List of embedding vectors, in the same order as texts
+    """
+    from src.utils.embedding_cache import embedding_cache, normalize_text
+
+    normalized = [normalize_text(text) for text in texts]
+    found = embedding_cache.get_many(EMBEDDING_MODEL, normalized)
+    missing = list(dict.fromkeys(text for text in normalized if text not in found))
+    if missing:
+        # Keep fresh vectors in float32 as well, so a hit returns exactly what a miss did
+        fresh = {text: np.asarray(vector, dtype=np.float32) for text, vector in zip(missing, generate_embeddings(missing))}
+        embedding_cache.put_many(EMBEDDING_MODEL, fresh)
+        found.update(fresh)
+    return [found[text].tolist() for text in normalized]
@@ -0,0 +1,67 @@
+"""
+Local ranking of the features that tell retrieved products apart.
+
+Works on the structured metadata stored with every row chunk (one key per
+column, see dataframe_to_texts) instead of re-parsing pc_text. A feature is a
+candidate when every product has it and it takes more than one but fewer than
+len(products) distinct values (as find_defferent_features does on pc_text).
+
+Candidates are ranked by the Shannon entropy of their value distribution,
+i.e. the information gained by asking the user about that feature. Features
+with more than FEATURE_RANKING_MAX_OPTIONS values make poor clarifying
+questions and are not ranked, nor are internal fields and ids.
+"""
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FEATURE_RANKING_MAX_OPTIONS = int(os.getenv("FEATURE_RANKING_MAX_OPTIONS", "10"))
+
+# Column keys that identify a record rather than describe it
+_ID_KEY = re.compile(r"(^|_)(id|ids|uuid|guid)($|_)")
+
+
+def is_feature_key(key: str) -> bool:
+    return not key.startswith("pc_") and not _ID_KEY.search(key)
+
+
+def candidate_features(products: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """{feature: distinct values} of the features that differ between some, but not all, products"""
+    if not products:
+        return {}
+    common_keys = set(products[0]).intersection(*map(set, products[1:]))
+    candidates = {}
+    for key in sorted(common_keys):
+        if not is_feature_key(key):
+            continue
+        values = list(dict.fromkeys(product[key] for product in products))
+        if 1 < len(values) < len(products):
+            candidates[key] = values
+    return candidates
+
+
+def value_entropy(values: List[Any]) -> float:
+    """Shannon entropy (bits) of the distribution of `values`"""
+    total = len(values)
+    return -sum(count / total * math.log2(count / total) for count in Counter(values).values())
+
+
+def rank_features(products: List[Dict[str, Any]], candidates: Dict[str, List[Any]], max_options: int = FEATURE_RANKING_MAX_OPTIONS) -> List[Tuple[str, float]]:
+    """
+    Rank candidate features by entropy over the products, best first.
+
+    Ties go to the feature with fewer options. Features with more than
+    `max_options` distinct values are left out.
+    """
+    ranked = [
+        (key, value_entropy([product[key] for product in products]), len(values))
+        for key, values in candidates.items()
+        if len(values) <= max_options
+    ]
+    ranked.sort(key=lambda item: (-item[1], item[2], item[0]))
+    return [(key, entropy) for key, entropy, _ in ranked]
@@ -1,5 +1,6 @@
 import hashlib
 import pandas as pd
+import numpy as np
 from PIL import Image
 import io
 import os
@@ -8,6 +9,38 @@ def generate_file_hash(file_content: bytes) -> str:
     """Generate unique hash for file content"""
     return hashlib.md5(file_content).hexdigest()
 
+
+def generate_file_hash_from_stream(stream, block_size: int = 1024 * 1024) -> str:
+    """Generate the same hash as generate_file_hash, reading a binary file object in blocks"""
+    digest = hashlib.md5()
+    for block in iter(lambda: stream.read(block_size), b""):
+        digest.update(block)
+    return digest.hexdigest()
+
+# Characters replaced by "_" when a column name becomes a metadata key
+_META_KEY_TABLE = str.maketrans({c: "_" for c in " -/()."})
+
+# Marks a null cell in the per-column metadata lists
+_MISSING = object()
+
+
+def column_meta_key(col: str) -> str:
+    """Sanitize a column name into the metadata key stored in ChromaDB"""
+    return col.strip("'").translate(_META_KEY_TABLE).lower()
+
+
+def _column_cells(values: np.ndarray) -> list:
+    """
+    Return the cells of one column of `df.values` as Python objects, exactly
+    as iterating a row Series from df.iterrows() would produce them.
+    """
+    if values.dtype.kind in "biufcO":
+        # ndarray.tolist() converts like Series iteration (ndarray.item per cell)
+        return values.tolist()
+    # datetime64 / timedelta64: Series iteration yields Timestamp / Timedelta
+    return list(pd.Series(values, copy=False))
+
+
 def dataframe_to_texts(df: pd.DataFrame) -> list[str]:
     """
     Convert a DataFrame into a list of row-based text strings.
@@ -15,30 +48,41 @@ def dataframe_to_texts(df: pd.DataFrame) -> list[str]:
     Each row becomes a string in the format:
         column1: value1 | column2: value2 | ...
 
+    Works column by column over `df.values` (the same common-dtype matrix
+    df.iterrows() walks), so cell types, and therefore the output, match a
+    row-by-row conversion exactly.
+
     Args:
         df (pd.DataFrame): Input DataFrame.
 
     Returns:
         list[str]: List of row-based text strings.
     """
-    texts = []
-    meta_dict = []
-    for _,row in df.iterrows():
-        # Convert row to string representation
-        row_values = []
-        result = {}
-        for col, val in row.items():
-            if pd.notna(val):
-                key = col.strip("'")
-                meta_key = col.strip("'").replace(" ", "_").replace("-", "_").replace("/", "_").replace("(", "_").replace(")", "_").replace(".", "_").lower()
-                row_values.append(f"{key}: {str(val)}")
-                if type(val) == int or type(val) == float:
-                    result[meta_key] = val
-                else:
-                    result[meta_key] = f'{val}'.lower()
-        row_text = " | ".join(row_values)
-        texts.append(row_text)
-        meta_dict.append(result)
+    if len(df) == 0:
+        return [], []
+    if len(df.columns) == 0:
+        return [""] * len(df), [{} for _ in range(len(df))]
+
+    values = df.values
+    text_columns = []
+    meta_columns = []
+    meta_keys = []
+    for j, col in enumerate(df.columns):
+        key = col.strip("'")
+        meta_keys.append(column_meta_key(col))
+        cells = _column_cells(values[:, j])
+        present = pd.notna(values[:, j]).tolist()
+        text_columns.append([f"{key}: {str(val)}" if ok else None for val, ok in zip(cells, present)])
+        meta_columns.append([
+            (val if type(val) == int or type(val) == float else f'{val}'.lower()) if ok else _MISSING
+            for val, ok in zip(cells, present)
+        ])
+
+    texts = [" | ".join([part for part in parts if part is not None]) for parts in zip(*text_columns)]
+    meta_dict = [
+        {meta_key: val for meta_key, val in zip(meta_keys, row) if val is not _MISSING}
+        for row in zip(*meta_columns)
+    ]
     return texts, meta_dict
 
 
@@ -71,9 +115,8 @@ def dataframe_to_texts_with_columns(df: pd.DataFrame) -> list[str]:
             filtered_columns[col] = unique_values.tolist()
     
     for i, (col, values) in enumerate(filtered_columns.items()):
+        meta_key = column_meta_key(col)
         for y, val in enumerate(values):
-            
-            meta_key = col.strip("'").replace(" ", "_").replace("-", "_").replace("/", "_").replace("(", "_").replace(")", "_").replace(".", "_").lower()
             texts.append(f"{meta_key}: {str(val).lower()}")
             result = {"column_name": meta_key, "column_value": f'{val}'.lower()}
             meta_dict.append(result)
@@ -166,4 +209,99 @@ def is_supported_image_format(filename: str) -> bool:
     """
     SUPPORTED_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
     file_extension = os.path.splitext(filename)[1].lower()
-    return file_extension in SUPPORTED_EXTENSIONS
\ No newline at end of file
+    return file_extension in SUPPORTED_EXTENSIONS
+
+
+def prepare_catalog_image(file_content: bytes, original_filename: str, embed_size: int = 224) -> tuple[bytes, str, str, np.ndarray]:
+    """
+    Validate, convert and hash one catalog image, and downscale it for embedding.
+
+    Runs in the bulk import's process pool, so the CPU-heavy decode and resize
+    happen outside the API process. The embedding copy is resized (bicubic, like
+    the CLIP processor) so that its shorter side is `embed_size`; JPEGs are
+    decoded at reduced scale when they are much larger than that.
+
+    Returns:
+        tuple: (stored_file_content, file_name, file_hash, rgb_pixels)
+
+    Raises:
+        ValueError: If the file cannot be decoded as an image
+    """
+    file_content, file_name = validate_and_convert_image(file_content, original_filename, output_format="JPEG")
+    try:
+        with Image.open(io.BytesIO(file_content)) as image:
+            image.draft("RGB", (embed_size, embed_size))
+            image = image.convert("RGB")
+            scale = embed_size / min(image.size)
+            if scale < 1:
+                image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BICUBIC)
+            pixels = np.asarray(image, dtype=np.uint8)
+    except Exception as e:
+        raise ValueError(f"Failed to process image file '{original_filename}': {str(e)}")
+    return file_content, file_name, generate_file_hash(file_content), pixels
+
+
+if __name__ == "__main__":
+    # Parity check and benchmark of dataframe_to_texts against the former iterrows implementation
+    import argparse
+    import time
+
+    def dataframe_to_texts_iterrows(df: pd.DataFrame):
+        texts = []
+        meta_dict = []
+        for _, row in df.iterrows():
+            row_values = []
+            result = {}
+            for col, val in row.items():
+                if pd.notna(val):
+                    key = col.strip("'")
+                    meta_key = col.strip("'").replace(" ", "_").replace("-", "_").replace("/", "_").replace("(", "_").replace(")", "_").replace(".", "_").lower()
+                    row_values.append(f"{key}: {str(val)}")
+                    if type(val) == int or type(val) == float:
+                        result[meta_key] = val
+                    else:
+                        result[meta_key] = f'{val}'.lower()
+            texts.append(" | ".join(row_values))
+            meta_dict.append(result)
+        return texts, meta_dict
+
+    def synthetic_catalog(rows: int, seed: int = 0) -> pd.DataFrame:
+        rng = np.random.default_rng(seed)
+        price = rng.uniform(1, 500, rows).round(2)
+        price[rng.random(rows) < 0.05] = np.nan
+        color = rng.choice(np.array(["Red", "Blue", "Green", None], dtype=object), rows)
+        return pd.DataFrame({
+            "SKU": [f"P{i:07d}" for i in range(rows)],
+            "Product Name": [f"Product {i}" for i in range(rows)],
+            "Color": color,
+            "Size (EU)": rng.integers(34, 48, rows),
+            "Price/Unit": price,
+            "In-Stock": rng.random(rows) < 0.8,
+            "'Brand'": rng.choice(["Acme", "Globex", "Initech"], rows),
+        })
+
+    parser = argparse.ArgumentParser(description="Benchmark dataframe_to_texts")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--skip-legacy-above", type=int, default=100000,
+                        help="only time the iterrows version up to this many rows")
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        df = synthetic_catalog(rows)
+        started = time.perf_counter()
+        texts, metas = dataframe_to_texts(df)
+        fast = time.perf_counter() - started
+        line = f"rows={rows:<8} columnwise={fast:.2f}s"
+        if rows <= args.skip_legacy_above:
+            started = time.perf_counter()
+            expected = dataframe_to_texts_iterrows(df)
+            slow = time.perf_counter() - started
+            # Compare values, key order and value types (5 vs 5.0 vs "5")
+            identical = texts == expected[0] and [
+                [(k, type(v), repr(v)) for k, v in meta.items()] for meta in metas
+            ] == [
+                [(k, type(v), repr(v)) for k, v in meta.items()] for meta in expected[1]
+            ]
+            line += f" iterrows={slow:.2f}s speedup={slow / fast:.1f}x identical={identical}"
+        print(line)
+
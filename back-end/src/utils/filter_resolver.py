@@ -0,0 +1,126 @@
+"""
+Resolves the "|"-separated parts of a product query to column filters.
+
+Each part is first looked up in the tenant's in-memory column value index
+(exact, normalized or fuzzy match, see column_index). Only the parts it cannot
+resolve are matched against the "<company_id>-columns" collection (one vector
+per distinct column value): all of them that are not cached go to ChromaDB in
+a single query with n_results=2. The (up to) two matching column values of
+each part become an $or condition; the parts are combined with $and.
+
+Resolutions are cached per tenant by normalized part text in an LRU with a
+TTL (COLUMN_FILTER_CACHE_TTL) and dropped by invalidate_column_filters when a
+knowledge file of the tenant is vectorized or removed. A fully cached query
+needs no embedding and no ChromaDB call.
+"""
+import os
+from typing import Any, Callable, Dict, List, Tuple
+from dotenv import load_dotenv
+from db.tenant_cache import TenantCache
+from src.service_client import chroma_client
+from src.utils.embedding_cache import normalize_text
+from src.utils.column_index import COLUMN_INDEX_ENABLED, column_index
+
+load_dotenv()
+
+COLUMN_FILTER_CACHE_TTL = float(os.getenv("COLUMN_FILTER_CACHE_TTL", "300"))
+COLUMN_FILTER_CACHE_MAX_ENTRIES = int(os.getenv("COLUMN_FILTER_CACHE_MAX_ENTRIES", "20000"))
+
+# Closest column values OR-ed together for each query part
+MATCHES_PER_PART = 2
+
+column_filter_cache = TenantCache(ttl=COLUMN_FILTER_CACHE_TTL, max_entries=COLUMN_FILTER_CACHE_MAX_ENTRIES)
+
+
+def columns_index_name(index_name: str) -> str:
+    return f"{index_name}-columns"
+
+
+def split_query_parts(query_text: str) -> List[str]:
+    """The "|"-separated parts of a product query"""
+    return [part.strip() for part in query_text.split("|")]
+
+
+def _column_match(metadata: Dict[str, Any], document: str) -> Tuple[str, str]:
+    if metadata and "column_name" in metadata and "column_value" in metadata:
+        return metadata["column_name"], metadata["column_value"]
+    # Vectors stored without column metadata: parse "column: value"
+    key = document.split(":")[0].strip()
+    return key, document.replace(f"{document.split(':')[0]}:", "").strip()
+
+
+def resolve_column_matches(
+    index_name: str,
+    parts: List[str],
+    embed: Callable[[List[str]], List[List[float]]],
+) -> List[List[Tuple[str, str]]]:
+    """
+    Return the matching (column, value) pairs of every query part.
+
+    Args:
+        index_name: Tenant collection name (the columns collection is derived from it)
+        parts: Query parts
+        embed: Embeds the parts that are neither in the column index nor cached (e.g. generate_query_embeddings)
+
+    Returns:
+        One list of up to MATCHES_PER_PART (column, value) pairs per part
+    """
+    resolved = [None] * len(parts)
+    if COLUMN_INDEX_ENABLED:
+        resolved = [column_index.lookup(index_name, part, MATCHES_PER_PART) or None for part in parts]
+
+    keys = [(index_name, normalize_text(part)) for part in parts]
+    for i, matches in enumerate(resolved):
+        if matches is None:
+            resolved[i] = column_filter_cache.get(keys[i])
+    missing = [i for i, matches in enumerate(resolved) if matches is None]
+    if not missing:
+        return resolved
+
+    collection = chroma_client.get_or_create_collection(name=columns_index_name(index_name))
+    results = collection.query(
+        query_embeddings=embed([parts[i] for i in missing]),
+        n_results=MATCHES_PER_PART,
+        include=["metadatas", "documents"],
+    )
+    for row, i in enumerate(missing):
+        metadatas = results["metadatas"][row] if results.get("metadatas") else []
+        documents = results["documents"][row] if results.get("documents") else []
+        matches = [_column_match(metadata, document) for metadata, document in zip(metadatas, documents)]
+        resolved[i] = matches
+        column_filter_cache.set(keys[i], matches)
+    return resolved
+
+
+def build_column_filter(matches: List[List[Tuple[str, str]]]) -> dict:
+    """Combine per-part matches into a ChromaDB where filter ({} when there is none)"""
+    conditions = []
+    for part_matches in matches:
+        options = [{column: value} for column, value in part_matches]
+        if len(options) > 1:
+            conditions.append({"$or": options})
+        elif options:
+            conditions.append(options[0])
+    if len(conditions) > 1:
+        return {"$and": conditions}
+    if conditions:
+        return conditions[0]
+    return {}
+
+
+def resolve_column_filter(index_name: str, query_text: str, embed: Callable[[List[str]], List[List[float]]]) -> dict:
+    """Metadata filter for a product query, from its "|"-separated parts"""
+    return build_column_filter(resolve_column_matches(index_name, split_query_parts(query_text), embed))
+
+
+def invalidate_column_filters(index_name: str, rebuild: bool = False) -> int:
+    """
+    Drop the cached resolutions and the column index of a tenant (its column values changed).
+
+    With `rebuild` the column index is built again right away (after ingest)
+    instead of on the next product query.
+    """
+    column_index.invalidate(index_name)
+    if rebuild and COLUMN_INDEX_ENABLED:
+        column_index.build(index_name)
+    return column_filter_cache.invalidate_where(lambda key, _: key[0] == index_name)
@@ -0,0 +1,197 @@
+"""
+Dynamic micro-batching for image embeddings.
+
+Every image upload runs on its own thread and every customer photo is
+searched on a job queue worker, so encode requests arrive concurrently but
+one at a time. Running a CLIP forward pass per image leaves most of a CPU
+host's throughput unused. The batcher:
+
+- queues encode requests from any thread and hands each caller a Future,
+- closes a batch once IMAGE_BATCH_SIZE images are waiting or the oldest has
+  waited IMAGE_BATCH_WAIT_MS,
+- decodes and preprocesses the batch on IMAGE_PREPROCESS_WORKERS threads
+  (a broken image fails its own request only),
+- runs one batched forward pass and splits the result rows back to callers.
+
+The model-specific preprocess and forward functions are passed in (see
+src/image_vectorize.py), which keeps this module free of torch. Throughput
+counters are reported on /health/cache, and running this module benchmarks
+the CLIP embedder at several batch sizes.
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IMAGE_BATCH_SIZE = int(os.getenv("IMAGE_BATCH_SIZE", "16"))
+IMAGE_BATCH_WAIT_MS = float(os.getenv("IMAGE_BATCH_WAIT_MS", "20"))
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", "4"))
+
+
+class MicroBatcher:
+    """Collects concurrent encode requests into batched forward passes"""
+
+    def __init__(
+        self,
+        preprocess: Callable[[Any], Any],
+        forward: Callable[[List[Any]], np.ndarray],
+        max_batch: int = IMAGE_BATCH_SIZE,
+        max_wait_ms: float = IMAGE_BATCH_WAIT_MS,
+        preprocess_workers: int = IMAGE_PREPROCESS_WORKERS,
+    ):
+        self.preprocess = preprocess
+        self.forward = forward
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.preprocess_workers = max(1, preprocess_workers)
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._pool = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "images": 0,
+            "failed": 0,
+            "largest_batch": 0,
+            "wait_seconds": 0.0,
+            "preprocess_seconds": 0.0,
+            "forward_seconds": 0.0,
+        }
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.preprocess_workers, thread_name_prefix="image-preprocess")
+                self._thread = threading.Thread(target=self._run, name="image-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue one image; the Future resolves to its embedding"""
+        if self._thread is None:
+            self._start()
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def encode(self, item: Any) -> np.ndarray:
+        """Embedding of one image, batched with whatever else is in flight"""
+        return self.submit(item).result()
+
+    def encode_many(self, items: Iterable[Any]) -> List[np.ndarray]:
+        """Embeddings of several images, in order (raises on the first image that failed)"""
+        return [future.result() for future in [self.submit(item) for item in items]]
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._process(batch)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _safe_preprocess(self, item: Any):
+        try:
+            return True, self.preprocess(item)
+        except Exception as e:
+            return False, e
+
+    def _process(self, batch: List[tuple]):
+        started = time.monotonic()
+        wait_seconds = sum(started - queued_at for _, _, queued_at in batch)
+        prepared = list(self._pool.map(self._safe_preprocess, [item for item, _, _ in batch]))
+        preprocessed = time.monotonic()
+
+        ready = []
+        for (_, future, _), (ok, value) in zip(batch, prepared):
+            if ok:
+                ready.append((future, value))
+            else:
+                future.set_exception(value)
+        if ready:
+            embeddings = self.forward([value for _, value in ready])
+            for row, (future, _) in enumerate(ready):
+                future.set_result(embeddings[row])
+        finished = time.monotonic()
+
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["images"] += len(ready)
+            self._stats["failed"] += len(batch) - len(ready)
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+            self._stats["wait_seconds"] += wait_seconds
+            self._stats["preprocess_seconds"] += preprocessed - started
+            self._stats["forward_seconds"] += finished - preprocessed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        busy = stats["preprocess_seconds"] + stats["forward_seconds"]
+        handled = stats["images"] + stats["failed"]
+        stats.update({
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize(),
+            "avg_batch_size": round(handled / stats["batches"], 2) if stats["batches"] else 0.0,
+            "avg_wait_ms": round(stats["wait_seconds"] / handled * 1000, 2) if handled else 0.0,
+            "images_per_second": round(stats["images"] / busy, 1) if busy else 0.0,
+        })
+        for key in ("wait_seconds", "preprocess_seconds", "forward_seconds"):
+            stats[key] = round(stats[key], 3)
+        return stats
+
+
+if __name__ == "__main__":
+    # Throughput of the CLIP embedder at several batch sizes, with concurrent callers
+    import io
+    import argparse
+    from PIL import Image
+
+    parser = argparse.ArgumentParser(description="Benchmark batched CLIP image embedding")
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 8, 16, 32])
+    parser.add_argument("--callers", type=int, default=16, help="threads submitting images concurrently")
+    args = parser.parse_args()
+
+    from src.utils.clip_embedder import get_embedder
+
+    embedder = get_embedder()
+
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(args.images):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)).save(buffer, format="JPEG")
+        images.append(buffer.getvalue())
+
+    # Warm up the model outside the measurements
+    embedder.forward([embedder.preprocess(images[0])])
+    for max_batch in args.batch:
+        batcher = MicroBatcher(embedder.preprocess, embedder.forward, max_batch=max_batch)
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.callers) as callers:
+            list(callers.map(lambda image: batcher.encode(io.BytesIO(image)), images))
+        elapsed = time.monotonic() - started
+        stats = batcher.stats()
+        print(
+            f"batch={max_batch:<3} batches={stats['batches']:<4} avg_batch={stats['avg_batch_size']:<6} "
+            f"total={elapsed:.2f}s images/s={args.images / elapsed:.1f}"
+        )
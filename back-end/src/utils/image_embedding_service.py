@@ -0,0 +1,146 @@
+"""
+Dedicated image embedding process shared by all API workers.
+
+With IMAGE_EMBEDDING_SERVICE=socket the uvicorn workers never load CLIP.
+They send images to one embedding process over a local Unix socket
+(IMAGE_EMBEDDING_SOCKET) instead:
+
+    python -m src.utils.image_embedding_service
+
+The service loads the model once, at start, and feeds every request into a
+single MicroBatcher. Concurrent uploads and searches from all workers
+therefore share batched forward passes, and the model is held in memory once
+per host rather than once per worker.
+
+Requests and replies are pickled tuples on a multiprocessing connection
+authenticated with IMAGE_EMBEDDING_AUTHKEY:
+("encode", bytes or RGB array) -> ("ok", embedding) and ("stats",) -> ("ok", {...});
+failures come back as ("error", message).
+"""
+import io
+import os
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, Iterable, List
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IMAGE_EMBEDDING_SOCKET = os.getenv("IMAGE_EMBEDDING_SOCKET", "/tmp/image-embedding.sock")
+IMAGE_EMBEDDING_AUTHKEY = os.getenv("IMAGE_EMBEDDING_AUTHKEY", "image-embedding").encode()
+IMAGE_EMBEDDING_CLIENT_THREADS = int(os.getenv("IMAGE_EMBEDDING_CLIENT_THREADS", "16"))
+
+
+def _payload(item: Any):
+    """Picklable form of an image: bytes, or the RGB array of a bulk import"""
+    if isinstance(item, io.BytesIO):
+        return item.getvalue()
+    if isinstance(item, (bytes, bytearray, np.ndarray)):
+        return item
+    return item.read()
+
+
+class RemoteImageEncoder:
+    """Same interface as MicroBatcher (submit, encode, encode_many, stats), served by the embedding process"""
+
+    def __init__(self, address: str = IMAGE_EMBEDDING_SOCKET, threads: int = IMAGE_EMBEDDING_CLIENT_THREADS):
+        self.address = address
+        self._local = threading.local()
+        # Each in-flight request holds one connection, so the service can batch across them
+        self._pool = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="image-embedding-client")
+
+    def _connection(self, reconnect: bool = False):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or reconnect:
+            if conn is not None:
+                conn.close()
+            conn = self._local.conn = Client(self.address, family="AF_UNIX", authkey=IMAGE_EMBEDDING_AUTHKEY)
+        return conn
+
+    def _call(self, *message):
+        try:
+            conn = self._connection()
+            conn.send(message)
+            status, value = conn.recv()
+        except (EOFError, OSError):
+            # The service restarted since this thread last connected
+            conn = self._connection(reconnect=True)
+            conn.send(message)
+            status, value = conn.recv()
+        if status != "ok":
+            raise RuntimeError(value)
+        return value
+
+    def encode(self, item: Any) -> np.ndarray:
+        return self._call("encode", _payload(item))
+
+    def submit(self, item: Any) -> Future:
+        return self._pool.submit(self.encode, _payload(item))
+
+    def encode_many(self, items: Iterable[Any]) -> List[np.ndarray]:
+        return [future.result() for future in [self.submit(item) for item in items]]
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            return {"service": "socket", **self._call("stats")}
+        except Exception as e:
+            return {"service": "socket", "error": str(e)}
+
+
+def _handle(conn, batcher, started: float):
+    with conn:
+        while True:
+            try:
+                kind, *args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if kind == "encode":
+                    reply = ("ok", batcher.encode(args[0]))
+                elif kind == "stats":
+                    reply = ("ok", {**batcher.stats(), "uptime_seconds": round(time.monotonic() - started, 1)})
+                else:
+                    reply = ("error", f"Unknown request: {kind}")
+            except Exception as e:
+                reply = ("error", str(e))
+            try:
+                conn.send(reply)
+            except (EOFError, OSError):
+                return
+
+
+def serve(address: str = IMAGE_EMBEDDING_SOCKET):
+    """Load the model and answer encode requests until the process is stopped"""
+    from src.utils.clip_embedder import get_embedder
+    from src.utils.image_batcher import MicroBatcher
+
+    started = time.monotonic()
+    embedder = get_embedder()
+    batcher = MicroBatcher(embedder.preprocess, embedder.forward)
+    print(f"Image embedding model loaded in {time.monotonic() - started:.1f}s")
+
+    if os.path.exists(address):
+        os.remove(address)
+    with Listener(address, family="AF_UNIX", authkey=IMAGE_EMBEDDING_AUTHKEY) as listener:
+        os.chmod(address, 0o600)
+        print(f"Serving image embeddings on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                # Failed handshake (wrong authkey) or a client that went away
+                print(f"Rejected image embedding connection: {str(e)}")
+                continue
+            threading.Thread(target=_handle, args=(conn, batcher, started), daemon=True).start()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve CLIP image embeddings to the API workers over a Unix socket")
+    parser.add_argument("--socket", default=IMAGE_EMBEDDING_SOCKET)
+    args = parser.parse_args()
+    serve(args.socket)
@@ -0,0 +1,167 @@
+"""
+Perceptual hashes of catalog images, for image searches that skip CLIP.
+
+Customers often resend the same product photo, or send a screenshot of a
+catalog image we already store. Every stored image carries a 64-bit
+difference hash (dHash, metadata key pc_phash): the image is reduced to 9x8
+grayscale and each bit records whether a pixel is brighter than its right
+neighbour. Re-encoding, resizing and small colour shifts keep the hash
+within a few bits.
+
+dHash only sees brightness gradients, so colour variants of one product shot
+(red, blue, navy, black) share a hash. Every stored image therefore also
+carries an 8x8 RGB thumbnail (metadata key pc_colour).
+
+At query time search_similar_images looks the query's hash up in the
+PerceptualIndex of the collection. A stored image within
+IMAGE_PHASH_MAX_DISTANCE bits whose thumbnail is within
+IMAGE_PHASH_COLOUR_TOLERANCE (0-255, every cell and channel) of the query's is
+treated as the same picture, and its stored vector is used as the query
+embedding. Images stored without a thumbnail are never reused this way. The index of a collection is built from
+the ChromaDB metadata and cached per process (IMAGE_PHASH_INDEX_TTL). Building
+it reads every metadata of the collection, so that happens on a background
+thread: searches fall through to CLIP until the first build is in place and
+keep using an expired index while it is rebuilt. Writes through
+src/image_vectorize.py drop it in this process; other workers see the change
+once their entry expires.
+"""
+import io
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import numpy as np
+from PIL import Image
+from dotenv import load_dotenv
+from db.tenant_cache import TenantCache
+
+load_dotenv()
+
+IMAGE_PHASH_MAX_DISTANCE = int(os.getenv("IMAGE_PHASH_MAX_DISTANCE", "4"))
+IMAGE_PHASH_COLOUR_TOLERANCE = int(os.getenv("IMAGE_PHASH_COLOUR_TOLERANCE", "24"))
+IMAGE_PHASH_INDEX_TTL = float(os.getenv("IMAGE_PHASH_INDEX_TTL", "300"))
+IMAGE_PHASH_INDEX_MAX_ENTRIES = int(os.getenv("IMAGE_PHASH_INDEX_MAX_ENTRIES", "256"))
+
+# Side of the RGB thumbnail compared before a stored vector is reused
+COLOUR_GRID = 8
+
+# Set bits of every byte value
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def _open_rgb(image: Any) -> Image.Image:
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image).convert("RGB")
+    if isinstance(image, (bytes, bytearray)):
+        image = io.BytesIO(image)
+    with Image.open(image) as opened:
+        opened.draft("RGB", (64, 64))
+        return opened.convert("RGB")
+
+
+def _dhash(rgb: Image.Image) -> str:
+    pixels = np.asarray(rgb.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+
+def _colour(rgb: Image.Image) -> str:
+    return np.asarray(rgb.resize((COLOUR_GRID, COLOUR_GRID), Image.BOX), dtype=np.uint8).tobytes().hex()
+
+
+def dhash(image: Any) -> str:
+    """64-bit difference hash (16 hex chars) of an image given as BytesIO, bytes or RGB array"""
+    return _dhash(_open_rgb(image))
+
+
+def image_fingerprint(image: Any) -> Tuple[str, str]:
+    """(dHash, RGB thumbnail as hex) of an image given as BytesIO, bytes or RGB array, decoded once"""
+    rgb = _open_rgb(image)
+    return _dhash(rgb), _colour(rgb)
+
+
+def colours_match(colour: str, other: str, tolerance: int = IMAGE_PHASH_COLOUR_TOLERANCE) -> bool:
+    """Whether two thumbnails differ by at most `tolerance` in every cell and channel"""
+    if not colour or not other or len(colour) != len(other):
+        return False
+    difference = np.abs(np.frombuffer(bytes.fromhex(colour), dtype=np.uint8).astype(np.int16) - np.frombuffer(bytes.fromhex(other), dtype=np.uint8))
+    return int(difference.max()) <= tolerance
+
+
+class PerceptualIndex:
+    """dHashes and colour thumbnails of the images of one collection, searched by Hamming distance"""
+
+    def __init__(self, entries: List[Tuple[str, str, str]]):
+        self.ids = [vector_id for vector_id, _, _ in entries]
+        self.colours = [colour for _, _, colour in entries]
+        self.size = len(self.ids)
+        self._bytes = np.array([bytes.fromhex(phash) for _, phash, _ in entries], dtype="S8").view(np.uint8).reshape(-1, 8)
+
+    def nearest(
+        self,
+        phash: str,
+        colour: str,
+        max_distance: int = IMAGE_PHASH_MAX_DISTANCE,
+        tolerance: int = IMAGE_PHASH_COLOUR_TOLERANCE,
+    ) -> Optional[Tuple[str, int]]:
+        """(vector id, distance) of the closest stored image of the same colours, or None if none is within max_distance"""
+        if not self.size:
+            return None
+        query = np.frombuffer(bytes.fromhex(phash), dtype=np.uint8)
+        distances = _POPCOUNT[self._bytes ^ query].sum(axis=1, dtype=np.int32)
+        candidates = np.flatnonzero(distances <= max_distance)
+        for position in candidates[np.argsort(distances[candidates], kind="stable")]:
+            if colours_match(colour, self.colours[position], tolerance):
+                return self.ids[position], int(distances[position])
+        return None
+
+
+# index_name -> PerceptualIndex
+perceptual_indexes = TenantCache(ttl=IMAGE_PHASH_INDEX_TTL, max_entries=IMAGE_PHASH_INDEX_MAX_ENTRIES)
+
+
+# index_name -> bumped by every build and invalidation, so an older build never replaces a newer state
+_index_generations: Dict[str, int] = {}
+_index_builds: Set[str] = set()
+_index_lock = threading.Lock()
+
+
+def _build_perceptual_index(index_name: str, build: Callable[[], PerceptualIndex], generation: int):
+    try:
+        index = build()
+        with _index_lock:
+            if _index_generations.get(index_name) == generation:
+                perceptual_indexes.set(index_name, index)
+    except Exception as e:
+        print(f"Perceptual hash index build failed for {index_name}: {str(e)}")
+    finally:
+        with _index_lock:
+            _index_builds.discard(index_name)
+
+
+def get_perceptual_index(index_name: str, build: Callable[[], PerceptualIndex]) -> Optional[PerceptualIndex]:
+    """
+    The cached index of a collection, or None while its first build runs.
+
+    A missing or expired index is (re)built by `build` on a background thread,
+    one build per collection at a time; an expired index is served meanwhile.
+    """
+    cached = perceptual_indexes.get_stale(index_name)
+    if cached is None or cached[1]:
+        with _index_lock:
+            if index_name not in _index_builds:
+                _index_builds.add(index_name)
+                generation = _index_generations[index_name] = _index_generations.get(index_name, 0) + 1
+                threading.Thread(
+                    target=_build_perceptual_index,
+                    args=(index_name, build, generation),
+                    name="perceptual-index-build",
+                    daemon=True,
+                ).start()
+    return cached[0] if cached else None
+
+
+def invalidate_perceptual_index(index_name: str) -> int:
+    """Drop the cached index of a collection after images were added or deleted"""
+    with _index_lock:
+        _index_generations[index_name] = _index_generations.get(index_name, 0) + 1
+    return perceptual_indexes.invalidate_where(lambda key, _: key == index_name)
@@ -0,0 +1,182 @@
+"""
+Incremental (diff-based) re-vectorization of knowledge files.
+
+Every row chunk carries a row key (the value of the primary column, or the
+row text hash when the row has none) and a hash of the full row text. When a
+file is reprocessed or re-uploaded, the rows already stored in ChromaDB for
+the previous version are compared with the new file:
+
+- unchanged rows keep their vectors; only their metadata (file hash, row and
+  chunk indices) is rewritten,
+- inserted and changed rows are passed on to the embedding pipeline,
+- vectors of changed and removed rows are deleted once the new ones are stored.
+
+Vectors stored before row keys existed cannot be diffed; load_stored_rows
+returns None for them and the caller falls back to a full rebuild.
+"""
+import hashlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from src.service_client import chroma_client
+from src.utils.lexical_index import unindex_chunks
+from src.utils.search_cache import bump_collection_version
+
+ROW_KEY_FIELD = "pc_row_key"
+ROW_HASH_FIELD = "pc_row_hash"
+
+# Vectors read, updated or deleted per ChromaDB call
+SYNC_BATCH_SIZE = 1000
+
+
+def row_hash(text: str) -> str:
+    """Content hash of a full row text"""
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def assign_row_keys(chunks: Iterable[Dict[str, Any]], key_field: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Add pc_row_key and pc_row_hash to every chunk.
+
+    Sub-chunks of a split row are buffered so they all get the hash of the
+    whole row. Rows are keyed by their `key_field` metadata value; rows without
+    one are keyed by their hash. A key seen again gets a "#n" suffix.
+
+    Args:
+        chunks: Chunks in row order, as produced by the loaders
+        key_field: Metadata key of the primary column, or None to key by content
+    """
+    seen: Dict[str, int] = {}
+    row: List[Dict[str, Any]] = []
+    for chunk in chunks:
+        row.append(chunk)
+        if len(row) < chunk["metadata"].get("pc_total_row_subchunks", 1):
+            continue
+        digest = row_hash("".join(part["text"] for part in row))
+        value = row[0]["metadata"].get(key_field) if key_field else None
+        key = digest if value is None or value == "" else str(value)
+        count = seen.get(key, 0)
+        seen[key] = count + 1
+        if count:
+            key = f"{key}#{count}"
+        for part in row:
+            part["metadata"][ROW_KEY_FIELD] = key
+            part["metadata"][ROW_HASH_FIELD] = digest
+            yield part
+        row = []
+    # A truncated last row (should not happen) is still stored
+    for part in row:
+        part["metadata"].setdefault(ROW_HASH_FIELD, row_hash(part["text"]))
+        part["metadata"].setdefault(ROW_KEY_FIELD, part["metadata"][ROW_HASH_FIELD])
+        yield part
+
+
+def load_stored_rows(index_name: str, file_hashes: List[str]) -> Optional[Dict[str, Dict[str, List[tuple]]]]:
+    """
+    Read the row keys and hashes stored for the given file hashes.
+
+    Args:
+        index_name: Name of the ChromaDB collection
+        file_hashes: Hashes of the previous and the current file version
+
+    Returns:
+        {row_key: {row_hash: [(sub_index, chunk_id), ...]}}, or None when some
+        stored chunk has no row key (vectorized before incremental mode)
+    """
+    collection = chroma_client.get_or_create_collection(name=index_name, metadata={"hnsw:space": "cosine"})
+    where = {"pc_file_hash": {"$in": list(file_hashes)}}
+    stored: Dict[str, Dict[str, List[tuple]]] = {}
+    offset = 0
+    while True:
+        results = collection.get(where=where, include=["metadatas"], limit=SYNC_BATCH_SIZE, offset=offset)
+        ids = results["ids"]
+        for chunk_id, meta in zip(ids, results["metadatas"]):
+            if ROW_KEY_FIELD not in meta or ROW_HASH_FIELD not in meta:
+                return None
+            versions = stored.setdefault(meta[ROW_KEY_FIELD], {})
+            versions.setdefault(meta[ROW_HASH_FIELD], []).append((meta.get("pc_row_sub_index", 0), chunk_id))
+        if len(ids) < SYNC_BATCH_SIZE:
+            return stored
+        offset += len(ids)
+
+
+class IncrementalSync:
+    """
+    Diffs the chunks of a new file version against the stored rows of one collection.
+
+    Usage:
+        sync = IncrementalSync(index_name, load_stored_rows(index_name, hashes))
+        run_embedding_pipeline([(index_name, sync.filter(chunks))])
+        stats = sync.finish()
+    """
+
+    def __init__(self, index_name: str, stored: Dict[str, Dict[str, List[tuple]]]):
+        self.index_name = index_name
+        self.stored = stored
+        self.collection = chroma_client.get_or_create_collection(name=index_name, metadata={"hnsw:space": "cosine"})
+        self.stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0, "deleted_vectors": 0}
+        self._seen = set()
+        self._stale_ids: List[str] = []
+        self._updates: List[Dict[str, Any]] = []
+
+    def filter(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Yield the chunks of inserted and changed rows; refresh metadata of unchanged ones"""
+        row: List[Dict[str, Any]] = []
+        for chunk in chunks:
+            row.append(chunk)
+            if len(row) < chunk["metadata"].get("pc_total_row_subchunks", 1):
+                continue
+            yield from self._diff_row(row)
+            row = []
+        if row:
+            yield from self._diff_row(row)
+        self._flush_updates()
+
+    def _diff_row(self, row: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        key = row[0]["metadata"][ROW_KEY_FIELD]
+        digest = row[0]["metadata"][ROW_HASH_FIELD]
+        self._seen.add(key)
+        versions = self.stored.get(key)
+        if not versions:
+            self.stats["added"] += 1
+            return row
+
+        kept = versions.get(digest)
+        if kept and len(kept) == len(row):
+            # Same content: reuse the stored vectors under the new metadata
+            for part, (_, chunk_id) in zip(row, sorted(kept)):
+                part["metadata"]["pc_chunk_id"] = chunk_id
+                self._updates.append(part)
+            self._stale_ids.extend(chunk_id for version, ids in versions.items() if version != digest for _, chunk_id in ids)
+            self.stats["unchanged"] += 1
+            if len(self._updates) >= SYNC_BATCH_SIZE:
+                self._flush_updates()
+            return []
+
+        self._stale_ids.extend(chunk_id for ids in versions.values() for _, chunk_id in ids)
+        self.stats["changed"] += 1
+        return row
+
+    def _flush_updates(self):
+        if not self._updates:
+            return
+        self.collection.update(
+            ids=[part["metadata"]["pc_chunk_id"] for part in self._updates],
+            metadatas=[{**part["metadata"], "pc_text": part["text"]} for part in self._updates],
+        )
+        bump_collection_version(self.index_name)
+        self._updates = []
+
+    def finish(self) -> Dict[str, int]:
+        """Delete the vectors of changed and removed rows. Call after the new chunks are stored."""
+        self._flush_updates()
+        for key, versions in self.stored.items():
+            if key not in self._seen:
+                self.stats["removed"] += 1
+                self._stale_ids.extend(chunk_id for ids in versions.values() for _, chunk_id in ids)
+        for i in range(0, len(self._stale_ids), SYNC_BATCH_SIZE):
+            self.collection.delete(ids=self._stale_ids[i:i + SYNC_BATCH_SIZE])
+        if self._stale_ids:
+            unindex_chunks(self.index_name, self._stale_ids)
+            bump_collection_version(self.index_name)
+        self.stats["deleted_vectors"] = len(self._stale_ids)
+        self._stale_ids = []
+        return self.stats
@@ -0,0 +1,287 @@
+"""
+Per-tenant BM25 index over the stored chunk texts (pc_text).
+
+Exact SKUs, sizes ("1.5") and standards ("KS") are poorly served by cosine
+similarity alone, so every chunk written to a collection is also indexed
+lexically in a SQLite file per collection (LEXICAL_INDEX_DIR/<index_name>.db):
+
+- docs(chunk_id, length) and postings(term, chunk_id, tf), keyed by the
+  ChromaDB chunk id, plus running document count and total length and the
+  document frequency of every term (terms),
+- updated incrementally by store_vectors_in_chroma, delete_file_vectors and
+  IncrementalSync (only added and deleted chunks are touched),
+- collections stored before the index existed are backfilled from ChromaDB
+  by ensure_lexical_index (called by vectorize_file) or by running this module.
+
+Tokens are lowercase alphanumeric runs that keep inner ".", "-" and "/"
+("1.5", "xlpe/swa", "ks-1234"); mixed tokens also index their letter and
+number parts ("1.5mm" -> "1.5mm", "1.5", "mm").
+
+Chunk texts are "column: value | ..." rows, so column names ("size",
+"conductor") occur in every chunk. Their idf is close to 0, yet reading their
+postings costs a full scan of the index. Query terms found in more than
+LEXICAL_MAX_DF_RATIO of the chunks are therefore skipped before any postings
+are read.
+"""
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from src.service_client import chroma_client
+
+load_dotenv()
+
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "./lexical_index")
+LEXICAL_MAX_DF_RATIO = float(os.getenv("LEXICAL_MAX_DF_RATIO", "0.5"))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Chunks read from ChromaDB per call while backfilling
+BACKFILL_BATCH_SIZE = 1000
+
+_TOKEN = re.compile(r"[0-9a-z]+(?:[./-][0-9a-z]+)*")
+_PART = re.compile(r"[0-9]+(?:\.[0-9]+)?|[a-z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms of a text, compound terms followed by their parts"""
+    terms = []
+    for token in _TOKEN.findall(str(text).lower()):
+        terms.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1 or (parts and parts[0] != token):
+            terms.extend(parts)
+    return terms
+
+
+class LexicalIndex:
+    """BM25 index of one collection, stored in SQLite"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS docs (chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id)")
+        has_terms = self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'terms'").fetchone()
+        self._conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID")
+        if not has_terms:
+            # Index written before document frequencies were kept
+            self._conn.execute("INSERT INTO terms SELECT term, COUNT(*) FROM postings GROUP BY term")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), docs INTEGER NOT NULL, length INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO totals VALUES (0, 0, 0)")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT docs FROM totals").fetchone()[0]
+
+    def _delete(self, chunk_ids: List[str]):
+        for i in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            removed, length = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs WHERE chunk_id IN ({marks})", batch
+            ).fetchone()
+            if not removed:
+                continue
+            counts = self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE chunk_id IN ({marks}) GROUP BY term", batch
+            ).fetchall()
+            self._conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(count, term) for term, count in counts])
+            for j in range(0, len(counts), 500):
+                terms = [term for term, _ in counts[j:j + 500]]
+                self._conn.execute(f"DELETE FROM terms WHERE df <= 0 AND term IN ({','.join('?' * len(terms))})", terms)
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", batch)
+            self._conn.execute(f"DELETE FROM docs WHERE chunk_id IN ({marks})", batch)
+            self._conn.execute("UPDATE totals SET docs = docs - ?, length = length - ?", (removed, length))
+
+    def add(self, chunks: Iterable[Tuple[str, str]]):
+        """Index (chunk_id, text) pairs, replacing chunks that are already indexed"""
+        chunks = list(chunks)
+        if not chunks:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._delete([chunk_id for chunk_id, _ in chunks])
+                docs, postings, length = [], [], 0
+                frequencies = Counter()
+                for chunk_id, text in chunks:
+                    terms = tokenize(text)
+                    counts = Counter(terms)
+                    docs.append((chunk_id, len(terms)))
+                    postings.extend((term, chunk_id, tf) for term, tf in counts.items())
+                    frequencies.update(counts.keys())
+                    length += len(terms)
+                self._conn.executemany("INSERT INTO docs VALUES (?, ?)", docs)
+                self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+                self._conn.executemany(
+                    "INSERT INTO terms VALUES (?, ?) ON CONFLICT (term) DO UPDATE SET df = df + excluded.df",
+                    list(frequencies.items()),
+                )
+                self._conn.execute("UPDATE totals SET docs = docs + ?, length = length + ?", (len(docs), length))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, chunk_ids: Iterable[str]):
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._delete(chunk_ids)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.execute("DELETE FROM terms")
+            self._conn.execute("UPDATE totals SET docs = 0, length = 0")
+            self._conn.execute("COMMIT")
+
+    def search(self, query_text: str, top_k: int = 50) -> List[Tuple[str, float]]:
+        """Return up to `top_k` (chunk_id, BM25 score) pairs, best first"""
+        terms = Counter(tokenize(query_text))
+        if not terms:
+            return []
+        with self._lock:
+            total_docs, total_length = self._conn.execute("SELECT docs, length FROM totals").fetchone()
+            if not total_docs:
+                return []
+            avg_length = total_length / total_docs
+            marks = ",".join("?" * len(terms))
+            frequencies = dict(self._conn.execute(f"SELECT term, df FROM terms WHERE term IN ({marks})", list(terms)).fetchall())
+            scores: Dict[str, float] = {}
+            for term, query_tf in terms.items():
+                df = frequencies.get(term, 0)
+                # Absent terms, and terms too common to rank (column names) are never read
+                if not df or df > LEXICAL_MAX_DF_RATIO * total_docs:
+                    continue
+                rows = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, d.length FROM postings p JOIN docs d ON d.chunk_id = p.chunk_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                for chunk_id, tf, length in rows:
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + query_tf * idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+class LexicalIndexRegistry:
+    """One LexicalIndex per collection, opened on first use"""
+
+    def __init__(self, directory: str = LEXICAL_INDEX_DIR):
+        self.directory = directory
+        self._indexes: Dict[str, LexicalIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, index_name: str) -> LexicalIndex:
+        with self._lock:
+            index = self._indexes.get(index_name)
+            if index is None:
+                os.makedirs(self.directory, exist_ok=True)
+                index = LexicalIndex(os.path.join(self.directory, f"{index_name}.db"))
+                self._indexes[index_name] = index
+            return index
+
+    def stats(self):
+        with self._lock:
+            indexes = dict(self._indexes)
+        return {"enabled": LEXICAL_INDEX_ENABLED, "open": len(indexes), "chunks": {name: len(index) for name, index in indexes.items()}}
+
+
+lexical_indexes = LexicalIndexRegistry()
+
+
+def is_lexical_collection(index_name: str) -> bool:
+    """Row collections are indexed; the per-value "-columns" collections are not"""
+    return LEXICAL_INDEX_ENABLED and not index_name.endswith("-columns")
+
+
+def index_chunks(index_name: str, chunks: List[Dict]):
+    """Index stored chunks ({"text", "metadata": {"pc_chunk_id"}}) of a collection"""
+    if is_lexical_collection(index_name):
+        lexical_indexes.get(index_name).add((chunk["metadata"]["pc_chunk_id"], chunk["text"]) for chunk in chunks)
+
+
+def unindex_chunks(index_name: str, chunk_ids: List[str]):
+    """Drop deleted chunks of a collection from its index"""
+    if is_lexical_collection(index_name):
+        lexical_indexes.get(index_name).delete(chunk_ids)
+
+
+def ensure_lexical_index(index_name: str, rebuild: bool = False) -> int:
+    """
+    Backfill the index of a collection from ChromaDB when it is empty (or always with `rebuild`).
+
+    Returns:
+        int: Number of chunks indexed
+    """
+    if not is_lexical_collection(index_name):
+        return 0
+    index = lexical_indexes.get(index_name)
+    if len(index) and not rebuild:
+        return 0
+    collection = chroma_client.get_or_create_collection(name=index_name, metadata={"hnsw:space": "cosine"})
+    if rebuild:
+        index.clear()
+    indexed = 0
+    offset = 0
+    while True:
+        results = collection.get(include=["documents"], limit=BACKFILL_BATCH_SIZE, offset=offset)
+        index.add(zip(results["ids"], (document or "" for document in results["documents"])))
+        indexed += len(results["ids"])
+        if len(results["ids"]) < BACKFILL_BATCH_SIZE:
+            return indexed
+        offset += len(results["ids"])
+
+
+def search_lexical(index_name: str, query_text: str, top_k: int = 50) -> List[Tuple[str, float]]:
+    """BM25 (chunk_id, score) pairs of a collection, best first ([] when disabled)"""
+    if not is_lexical_collection(index_name) or not query_text:
+        return []
+    return lexical_indexes.get(index_name).search(query_text, top_k)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: score(id) = sum of 1 / (k + rank), best first"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+if __name__ == "__main__":
+    # Rebuild the index of a collection from ChromaDB, e.g. after restoring chroma_data
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild the BM25 index of a ChromaDB collection")
+    parser.add_argument("index_name")
+    parser.add_argument("--query", help="Run a BM25 query after rebuilding")
+    args = parser.parse_args()
+
+    print(f"Indexed {ensure_lexical_index(args.index_name, rebuild=True)} chunks of {args.index_name}")
+    if args.query:
+        for chunk_id, score in search_lexical(args.index_name, args.query, 10):
+            print(f"{score:8.3f}  {chunk_id}")
@@ -0,0 +1,129 @@
+"""
+Incremental Maximal Marginal Relevance (MMR).
+
+The documents are normalized once. A running vector holds each document's
+maximum similarity to the documents picked so far, so every step costs one
+matrix-vector product (N x d) instead of recomputing N x |selected|
+similarities and all norms. Picked documents are masked out and can never be
+selected twice. float32 matrices (as returned by search_candidates) are used
+as they are, without a copy to float64.
+
+Relevance is the cosine similarity to the query unless the caller passes its
+own scores, e.g. the normalized fusion scores of a hybrid search, so lexical
+matches are not judged by their embedding alone.
+"""
+from typing import List, Optional, Sequence, Union
+import numpy as np
+
+VectorLike = Union[np.ndarray, Sequence[float]]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_select(query_vec: VectorLike, doc_vecs: Union[np.ndarray, Sequence[VectorLike]], lambda_param: float = 0.7, top_k: int = 5, relevance: Optional[VectorLike] = None) -> List[int]:
+    """
+    Select `top_k` documents by MMR.
+
+    Args:
+        query_vec: Query embedding vector.
+        doc_vecs: (N, d) document embedding matrix, or a list of vectors.
+        lambda_param: Trade-off between relevance (1.0) and diversity (0.0).
+        top_k: Number of documents to select (capped at N).
+        relevance: Relevance of each document, on the scale of a cosine
+            similarity (defaults to the cosine similarity to the query).
+
+    Returns:
+        List[int]: Indices of the selected documents, in selection order.
+    """
+    docs = np.asarray(doc_vecs)
+    if docs.dtype != np.float32 and docs.dtype != np.float64:
+        docs = docs.astype(np.float32)
+    if docs.ndim != 2 or len(docs) == 0 or top_k <= 0:
+        return []
+
+    docs = _normalize_rows(docs)
+    if relevance is None:
+        query = np.asarray(query_vec, dtype=docs.dtype).ravel()
+        query_norm = np.linalg.norm(query)
+        relevance = docs @ (query / query_norm if query_norm else query)
+    else:
+        relevance = np.asarray(relevance, dtype=docs.dtype).ravel()
+
+    n = len(docs)
+    max_sim = np.full(n, -np.inf, dtype=docs.dtype)
+    picked = np.zeros(n, dtype=bool)
+    selected = []
+    score = relevance.copy()
+    for step in range(min(top_k, n)):
+        if step:
+            np.multiply(relevance, lambda_param, out=score)
+            score -= (1 - lambda_param) * max_sim
+        score[picked] = -np.inf
+        idx = int(np.argmax(score))
+        selected.append(idx)
+        picked[idx] = True
+        np.maximum(max_sim, docs @ docs[idx], out=max_sim)
+    return selected
+
+
+if __name__ == "__main__":
+    # Micro-benchmark against the former implementation, which recomputed
+    # doc_vecs @ doc_vecs[selected].T and every norm on each step
+    import argparse
+    import time
+
+    def mmr_legacy(query_vec, doc_vecs, lambda_param=0.7, top_k=5):
+        doc_vecs = np.array(doc_vecs)
+        similarities = np.dot(doc_vecs, query_vec) / (
+            np.linalg.norm(doc_vecs, axis=1) * np.linalg.norm(query_vec)
+        )
+        selected = []
+        for _ in range(top_k):
+            if not selected:
+                idx = np.argmax(similarities)
+            else:
+                sim_to_selected = np.max(
+                    np.dot(doc_vecs, doc_vecs[selected].T)
+                    / (np.linalg.norm(doc_vecs, axis=1)[:, None] * np.linalg.norm(doc_vecs[selected], axis=1)),
+                    axis=1
+                )
+                mmr_score = lambda_param * similarities - (1 - lambda_param) * sim_to_selected
+                idx = np.argmax(mmr_score)
+            selected.append(idx)
+        return selected
+
+    def best_of(fn, repeat):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - started)
+        return best, result
+
+    parser = argparse.ArgumentParser(description="Benchmark MMR selection")
+    parser.add_argument("--n", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 20, 50])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    docs32 = rng.standard_normal((args.n, args.dim), dtype=np.float32)
+    query32 = rng.standard_normal(args.dim, dtype=np.float32)
+    # The old chat path passed lists of lists (one per match)
+    docs_lists = docs32.astype(np.float64).tolist()
+    query_list = query32.astype(np.float64).tolist()
+
+    for k in args.k:
+        legacy_time, legacy = best_of(lambda: mmr_legacy(np.array(query_list), docs_lists, top_k=k), args.repeat)
+        fast_time, fast = best_of(lambda: mmr_select(query32, docs32, top_k=k), args.repeat)
+        legacy = [int(i) for i in legacy]
+        same = "n/a (legacy repeated a pick)" if len(set(legacy)) < len(legacy) else fast == legacy
+        print(
+            f"N={args.n} d={args.dim} k={k:<3} legacy={legacy_time * 1000:8.2f}ms "
+            f"incremental={fast_time * 1000:7.2f}ms speedup={legacy_time / fast_time:6.1f}x same_picks={same}"
+        )
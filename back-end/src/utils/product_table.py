@@ -0,0 +1,226 @@
+"""
+Columnar product table per tenant, built at ingest time.
+
+The column metadata of every row chunk (the meta_dict of dataframe_to_texts)
+is stored once per collection as a NumPy archive (PRODUCT_TABLE_DIR/<index_name>.npz):
+
+- ids: chunk ids, one per table row,
+- columns: sorted column metadata keys (pc_ fields excluded),
+- codes: int32 matrix (columns x rows) of dictionary-encoded values, -1 where missing,
+- dictionary: JSON list with the distinct values of each column.
+
+Query-time feature analysis (extract_differentiating_features) then works on
+integer arrays of the retrieved rows instead of per-result dictionaries or
+re-split pc_text. The archive is rebuilt from ChromaDB after every
+vectorization and knowledge removal and written atomically; each process
+reloads it when its modification time changes. A collection without an
+archive (ingested before this table existed) gets one from a background
+build on first use.
+"""
+import os
+import json
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from src.service_client import chroma_client
+from src.utils.feature_ranking import is_feature_key, FEATURE_RANKING_MAX_OPTIONS
+
+load_dotenv()
+
+PRODUCT_TABLE_ENABLED = os.getenv("PRODUCT_TABLE_ENABLED", "true").lower() == "true"
+PRODUCT_TABLE_DIR = os.getenv("PRODUCT_TABLE_DIR", "./product_tables")
+
+# Chunks read from ChromaDB per call while building
+BUILD_BATCH_SIZE = 5000
+
+
+class ProductTable:
+    """Dictionary-encoded column metadata of one collection"""
+
+    def __init__(self, ids: List[str], columns: List[str], codes: np.ndarray, dictionary: List[List[Any]]):
+        self.ids = ids
+        self.columns = columns
+        self.codes = codes
+        self.dictionary = dictionary
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        self._feature_mask = np.array([is_feature_key(column) for column in columns], dtype=bool)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_metadatas(cls, ids: List[str], metadatas: List[Dict[str, Any]]) -> "ProductTable":
+        encoders: Dict[str, Dict[Any, int]] = {}
+        for metadata in metadatas:
+            for key, value in (metadata or {}).items():
+                if not key.startswith("pc_"):
+                    encoder = encoders.setdefault(key, {})
+                    if value not in encoder:
+                        encoder[value] = len(encoder)
+        columns = sorted(encoders)
+        codes = np.full((len(columns), len(ids)), -1, dtype=np.int32)
+        for c, column in enumerate(columns):
+            encoder = encoders[column]
+            codes[c] = [encoder.get(metadata.get(column), -1) if metadata and column in metadata else -1 for metadata in metadatas]
+        dictionary = [list(encoders[column]) for column in columns]
+        return cls(list(ids), columns, codes, dictionary)
+
+    @classmethod
+    def load(cls, path: str) -> "ProductTable":
+        with np.load(path, allow_pickle=False) as archive:
+            return cls(
+                archive["ids"].tolist(),
+                archive["columns"].tolist(),
+                archive["codes"],
+                json.loads(str(archive["dictionary"])),
+            )
+
+    def save(self, path: str):
+        """Write the archive atomically (readers in other processes never see a partial file)"""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, partial_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    ids=np.array(self.ids, dtype=str),
+                    columns=np.array(self.columns, dtype=str),
+                    codes=self.codes,
+                    dictionary=np.array(json.dumps(self.dictionary, default=str)),
+                )
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def differentiating_features(self, chunk_ids: List[str], max_options: int = FEATURE_RANKING_MAX_OPTIONS) -> Optional[Tuple[Dict[str, List[Any]], List[Tuple[str, float]]]]:
+        """
+        Candidate features of the given rows and their entropy ranking.
+
+        Same result as feature_ranking.candidate_features / rank_features over
+        the rows' metadata, computed on the code matrix.
+
+        Returns:
+            (candidates, ranked), or None when some chunk is not in the table
+        """
+        rows = [self._rows.get(chunk_id) for chunk_id in chunk_ids]
+        if not rows or any(row is None for row in rows):
+            return None
+        codes = self.codes[:, rows]
+        total = codes.shape[1]
+        distinct = 1 + (np.diff(np.sort(codes, axis=1), axis=1) != 0).sum(axis=1)
+        mask = self._feature_mask & (codes >= 0).all(axis=1) & (distinct > 1) & (distinct < total)
+
+        candidates, ranked = {}, []
+        for c in np.flatnonzero(mask):
+            values, first, counts = np.unique(codes[c], return_index=True, return_counts=True)
+            column = self.columns[c]
+            candidates[column] = [self.dictionary[c][value] for value in values[np.argsort(first)]]
+            if len(values) <= max_options:
+                p = counts / total
+                ranked.append((column, float(-(p * np.log2(p)).sum()), len(values)))
+        ranked.sort(key=lambda item: (-item[1], item[2], item[0]))
+        return candidates, [(column, entropy) for column, entropy, _ in ranked]
+
+    def available_features(self, max_options: int = FEATURE_RANKING_MAX_OPTIONS) -> Dict[str, List[Any]]:
+        """{feature: distinct values} of the columns with at most `max_options` values"""
+        return {
+            column: values
+            for column, values, is_feature in zip(self.columns, self.dictionary, self._feature_mask)
+            if is_feature and 1 < len(values) <= max_options
+        }
+
+
+class ProductTableRegistry:
+    """Loaded product tables, reloaded when their archive changes on disk"""
+
+    def __init__(self, directory: str = PRODUCT_TABLE_DIR):
+        self.directory = directory
+        self._tables: Dict[str, Tuple[float, ProductTable]] = {}
+        self._generations: Dict[str, int] = {}  # index_name -> bumped by every build
+        self._building: Set[str] = set()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def path(self, index_name: str) -> str:
+        return os.path.join(self.directory, f"{index_name}.npz")
+
+    def build(self, index_name: str) -> ProductTable:
+        """(Re)build the table of a collection from the metadata stored in ChromaDB"""
+        with self._lock:
+            generation = self._generations[index_name] = self._generations.get(index_name, 0) + 1
+        collection = chroma_client.get_or_create_collection(name=index_name, metadata={"hnsw:space": "cosine"})
+        ids, metadatas = [], []
+        offset = 0
+        while True:
+            results = collection.get(include=["metadatas"], limit=BUILD_BATCH_SIZE, offset=offset)
+            ids.extend(results["ids"])
+            metadatas.extend(results["metadatas"])
+            if len(results["ids"]) < BUILD_BATCH_SIZE:
+                break
+            offset += len(results["ids"])
+        table = ProductTable.from_metadatas(ids, metadatas)
+        path = self.path(index_name)
+        with self._save_lock:
+            # A later build (after new vectors) started while this one was reading; its archive wins
+            if self._generations.get(index_name) != generation:
+                return table
+            table.save(path)
+            with self._lock:
+                self._tables[index_name] = (os.path.getmtime(path), table)
+        return table
+
+    def _build_in_background(self, index_name: str):
+        try:
+            self.build(index_name)
+        except Exception as e:
+            print(f"Product table build failed for {index_name}: {str(e)}")
+        finally:
+            with self._lock:
+                self._building.discard(index_name)
+
+    def get(self, index_name: str) -> Optional[ProductTable]:
+        """
+        The current table of a collection, or None when disabled or not built yet.
+
+        A missing archive (first use) is built on a background thread, since
+        that scans the whole collection; callers fall back to the metadata of
+        their results until it is in place.
+        """
+        if not PRODUCT_TABLE_ENABLED:
+            return None
+        path = self.path(index_name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            with self._lock:
+                loaded = self._tables.get(index_name)
+                if index_name not in self._building:
+                    self._building.add(index_name)
+                    threading.Thread(target=self._build_in_background, args=(index_name,), name="product-table-build", daemon=True).start()
+            return loaded[1] if loaded else None
+        with self._lock:
+            loaded = self._tables.get(index_name)
+        if loaded and loaded[0] == mtime:
+            return loaded[1]
+        table = ProductTable.load(path)
+        with self._lock:
+            self._tables[index_name] = (mtime, table)
+        return table
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": PRODUCT_TABLE_ENABLED, "loaded": {name: len(table) for name, (_, table) in self._tables.items()}}
+
+
+product_tables = ProductTableRegistry()
+
+
+def rebuild_product_table(index_name: str) -> Optional[ProductTable]:
+    """Rebuild a collection's table after its vectors changed"""
+    if not PRODUCT_TABLE_ENABLED:
+        return None
+    return product_tables.build(index_name)
@@ -0,0 +1,53 @@
+"""
+Result cache for product searches.
+
+The same product questions are asked over and over across conversations, and
+each search_vectors_product call pays for embeddings, filter resolution, the
+ChromaDB query, MMR and the feature extraction LLM call. Results are cached in
+an LRU with a TTL (PRODUCT_SEARCH_CACHE_TTL) keyed by collection, collection
+version, normalized query, filters and top_k.
+
+Every write to a collection (store_vectors_in_chroma, delete_file_vectors,
+IncrementalSync) bumps its version, so cached results of the old contents can
+no longer be hit and are dropped. Versions are per process: other workers see
+a change once their entries expire.
+"""
+import os
+import threading
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from db.tenant_cache import TenantCache
+from src.utils.embedding_cache import normalize_text
+
+load_dotenv()
+
+PRODUCT_SEARCH_CACHE_TTL = float(os.getenv("PRODUCT_SEARCH_CACHE_TTL", "300"))
+PRODUCT_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("PRODUCT_SEARCH_CACHE_MAX_ENTRIES", "5000"))
+
+product_search_cache = TenantCache(ttl=PRODUCT_SEARCH_CACHE_TTL, max_entries=PRODUCT_SEARCH_CACHE_MAX_ENTRIES)
+
+_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+
+
+def collection_version(index_name: str) -> int:
+    with _versions_lock:
+        return _versions.get(index_name, 0)
+
+
+def bump_collection_version(index_name: str) -> int:
+    """Mark a collection as modified and drop the cached searches of its tenant"""
+    # Searches of a tenant read the "-columns" collection too
+    tenant = index_name[:-len("-columns")] if index_name.endswith("-columns") else index_name
+    with _versions_lock:
+        for name in {index_name, tenant}:
+            _versions[name] = _versions.get(name, 0) + 1
+        version = _versions[index_name]
+    product_search_cache.invalidate_where(lambda key, _: key[0] == tenant)
+    return version
+
+
+def search_cache_key(index_name: str, query_text: str, top_k: int, filters: Optional[Dict[str, Any]] = None) -> tuple:
+    """Key of a search; includes the current collection version"""
+    normalized_filters = tuple(sorted((name, str(value)) for name, value in (filters or {}).items() if value is not None))
+    return (index_name, collection_version(index_name), normalize_text(query_text).casefold(), normalized_filters, top_k)
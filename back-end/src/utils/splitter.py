@@ -1,27 +1,33 @@
 import uuid
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 
-def chunk_file(
+def iter_chunks(
     input_texts: List[str],
     meta_dict: List[Dict],
     max_chunk_size: int,
-    metadata: Dict[str, Any]
-) -> List[Dict[str, Any]]:
+    metadata: Dict[str, Any],
+    total_rows: int,
+    total_chunks: int = 0,
+    row_offset: int = 0,
+    chunk_offset: int = 0
+) -> Iterator[Dict[str, Any]]:
     """
-    Splits each row into one or more chunks.
-    - If a row is shorter than `max_chunk_size`, it becomes one chunk.
-    - If a row exceeds `max_chunk_size`, it is split into multiple chunks.
+    Yield the chunks of a block of rows, one row (or row part) at a time.
+
+    Used directly by the streaming loaders, which know the file totals from a
+    first pass and feed the rows in blocks.
 
     Args:
-        input_texts: List of row strings from CSV/XLSX.
+        input_texts: Row strings of this block.
+        meta_dict: Per-row metadata of this block.
         max_chunk_size: Maximum characters allowed per chunk.
         metadata: File metadata (e.g., file_name, file_extension, file_type, file_hash).
-
-    Returns:
-        List of dicts, each containing text and metadata.
+        total_rows: Rows in the whole file.
+        total_chunks: Chunks in the whole file, if already known.
+        row_offset: File row index of the first row of this block.
+        chunk_offset: File chunk index of the first chunk of this block.
     """
-    chunks = []
-    total_rows = len(input_texts)
+    chunk_index = chunk_offset
 
     def make_chunk(text: str, meta:dict, row_index: int, sub_index: int, total_subchunks: int) -> Dict[str, Any]:
         """Helper to create a chunk dictionary with metadata."""
@@ -30,8 +36,8 @@ def chunk_file(
             "metadata": {
                 **metadata,
                 "pc_chunk_id": str(uuid.uuid4()),
-                "pc_chunk_index": len(chunks),
-                "pc_total_chunks": 0,  # updated later
+                "pc_chunk_index": chunk_index,
+                "pc_total_chunks": total_chunks,
                 "pc_row_index": row_index,
                 "pc_row_sub_index": sub_index,
                 "pc_total_row_subchunks": total_subchunks,
@@ -41,23 +47,53 @@ def chunk_file(
         }
 
     # Process each row independently
-    for row_index, row_text in enumerate(input_texts):
+    for i, row_text in enumerate(input_texts):
         if not row_text:
             continue
 
+        row_index = row_offset + i
         row_length = len(row_text)
 
         # If row fits in one chunk
         if row_length <= max_chunk_size:
-            chunks.append(make_chunk(row_text, meta_dict[row_index], row_index, 0, 1))
+            yield make_chunk(row_text, meta_dict[i], row_index, 0, 1)
+            chunk_index += 1
         else:
             # Split long row into multiple parts
-            total_subchunks = (row_length + max_chunk_size - 1) // max_chunk_size
-            for i in range(total_subchunks):
-                start = i * max_chunk_size
+            total_subchunks = count_row_chunks(row_text, max_chunk_size)
+            for sub_index in range(total_subchunks):
+                start = sub_index * max_chunk_size
                 end = start + max_chunk_size
                 part = row_text[start:end]
-                chunks.append(make_chunk(part, meta_dict[row_index], row_index, i, total_subchunks))
+                yield make_chunk(part, meta_dict[i], row_index, sub_index, total_subchunks)
+                chunk_index += 1
+
+
+def count_row_chunks(row_text: str, max_chunk_size: int) -> int:
+    """Number of chunks a row string is split into (0 for an empty row)"""
+    return (len(row_text) + max_chunk_size - 1) // max_chunk_size
+
+
+def chunk_file(
+    input_texts: List[str],
+    meta_dict: List[Dict],
+    max_chunk_size: int,
+    metadata: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """
+    Splits each row into one or more chunks.
+    - If a row is shorter than `max_chunk_size`, it becomes one chunk.
+    - If a row exceeds `max_chunk_size`, it is split into multiple chunks.
+
+    Args:
+        input_texts: List of row strings from CSV/XLSX.
+        max_chunk_size: Maximum characters allowed per chunk.
+        metadata: File metadata (e.g., file_name, file_extension, file_type, file_hash).
+
+    Returns:
+        List of dicts, each containing text and metadata.
+    """
+    chunks = list(iter_chunks(input_texts, meta_dict, max_chunk_size, metadata, total_rows=len(input_texts)))
 
     # Update total_chunks
     total_chunks = len(chunks)
@@ -2,140 +2,142 @@ import pandas as pd
 import numpy as np
 from typing import List, Dict, Any, Optional
 from src.utils.chroma_utils import create_index, store_vectors_in_chroma, delete_file_vectors, search_vectors_by_embedding
-from src.utils.embedding_utills import generate_embeddings
-from src.utils.file_utills import generate_file_hash
+from src.utils.embedding_pipeline import run_embedding_pipeline
+from src.utils.file_utills import generate_file_hash_from_stream
 from src.utils.splitter import chunk_file
-from src.loaders.xlsx_loader import load_xlsx_file
-from src.loaders.csv_loader import load_csv_file
+from src.loaders.xlsx_loader import load_xlsx_file, stream_xlsx_file
+from src.loaders.csv_loader import load_csv_file, stream_csv_file
+from src.loaders.streaming import should_stream, rewind
+from src.utils.incremental import IncrementalSync, assign_row_keys, load_stored_rows
+from src.utils.filter_resolver import invalidate_column_filters
+from src.utils.lexical_index import ensure_lexical_index
+from src.utils.product_table import rebuild_product_table
+from dotenv import load_dotenv
 import os, io
-import tiktoken
+
+load_dotenv()
+
+# Diff against the vectors already stored for the file instead of rebuilding them
+KNOWLEDGE_INCREMENTAL = os.getenv("KNOWLEDGE_INCREMENTAL", "true").lower() == "true"
 
 # Constants
 MAX_CHUNK_SIZE = 8000  # OpenAI embedding limit
 EMBEDDING_MODEL = "text-embedding-3-small"
 EMBEDDING_DIMENSION = 1536
 MAX_TOKENS_PER_REQUEST=300000
-def split_texts_into_batches(chunks, max_tokens=MAX_TOKENS_PER_REQUEST, model=EMBEDDING_MODEL):
-    """
-    Split a list of texts into batches such that total tokens per batch is under the limit.
-    """
-    enc = tiktoken.encoding_for_model(model)
-    batches_chuncks, batches, current_batch_chunks, current_batch, current_tokens = [], [], [], [], 0
-
-    for i, chunck in enumerate(chunks):
-        tokens = len(enc.encode(chunck['text']))
-        if tokens > max_tokens:
-            raise Exception(f"Single text too large ({tokens} tokens) exceeds limit {max_tokens}")
-
-        # If adding this text exceeds limit, start a new batch
-        if current_tokens + tokens > max_tokens:
-            batches.append(current_batch)
-            batches_chuncks.append(current_batch_chunks)
-            current_batch_chunks, current_batch, current_tokens = [], [], 0
 
-        current_batch.append(chunck['text'])
-        current_batch_chunks.append(chunck)
-        current_tokens += tokens
-
-    if current_batch:
-        batches.append(current_batch)
-        batches_chuncks.append(current_batch_chunks)
-
-    return batches_chuncks, batches
-
-def vectorize_file(file_content: io.BytesIO, file_name: str, index_name: str, primary_column: str) -> Dict[str, Any]:
+def vectorize_file(file_content: Optional[io.BytesIO], file_name: str, index_name: str, primary_column: str, file_path: Optional[str] = None, previous_file_hash: Optional[str] = None) -> Dict[str, Any]:
     """
     Main function to vectorize a CSV/XLSX file and store in Pinecone
     
     Args:
-        file_path: Path to the CSV or XLSX file
+        file_content: Content of the file, or None when file_path is given
+        file_name: Name of the uploaded file
         index_name: Name of Pinecone index
-        company_id: Company ID for metadata
+        primary_column: Primary column of the catalog
+        file_path: Path of the file on disk; read in blocks instead of loaded into memory
+        previous_file_hash: Hash of the version being replaced (re-upload or reprocess).
+            Rows unchanged since that version keep their vectors.
         
     Returns:
         Dictionary with processing results
     """
-    # try:
-    # Check file size
-    # file_size = os.path.getsize(file_content)
-    # max_file_size = 50 * 1024 * 1024  # 50MB limit
-    
-    # if file_size > max_file_size:
-    #     raise Exception(f"File size ({file_size} bytes) exceeds maximum allowed size ({max_file_size} bytes)")
     print("Start Vectorizing File")
+    # Validate file type
+    file_extension = os.path.splitext(file_name)[1].lower()
+    if file_extension not in ['.xlsx', '.xls', '.csv']:
+        raise Exception(f"Unsupported file type: {file_extension}. Only CSV and Excel files are supported.")
+    
     # Create index if needed
     create_index(index_name)
+    # Rows kept by the incremental sync are never re-stored, so index vectors stored before the BM25 index existed
+    ensure_lexical_index(index_name)
     
     # Generate file hash for tracking
-    file_hash = generate_file_hash(file_content.read())
-    
-    # Delete existing vectors for this file (if updating)
-    deleted_count = delete_file_vectors(index_name, file_hash)
-    
-    # Validate file type and chunk the file
-    file_extension = os.path.splitext(file_name)[1].lower()
-    if file_extension in ['.xlsx', '.xls']:
-        chunks, column_chunks = load_xlsx_file(file_content, file_name, file_hash, primary_column)
-    elif file_extension in ['.csv']:
-        chunks, column_chunks = load_csv_file(file_content, file_name, file_hash, primary_column)
+    if file_path is not None:
+        source = file_path
+        file_size = os.path.getsize(file_path)
+        with open(file_path, "rb") as f:
+            file_hash = generate_file_hash_from_stream(f)
     else:
-        raise Exception(f"Unsupported file type: {file_extension}. Only CSV and Excel files are supported.")
+        source = file_content
+        file_size = file_content.seek(0, io.SEEK_END)
+        file_hash = generate_file_hash_from_stream(rewind(file_content))
+        rewind(file_content)
     
-    if not chunks:
-        raise Exception("No chunks generated from file")
+    # Vectors of the previous version (and of an interrupted run of this one)
+    file_hashes = list(dict.fromkeys(h for h in [previous_file_hash, file_hash] if h))
+    columns_index = f'{index_name}-columns'
+    stored_rows = stored_columns = None
+    if KNOWLEDGE_INCREMENTAL:
+        stored_rows = load_stored_rows(index_name, file_hashes)
+        stored_columns = load_stored_rows(columns_index, file_hashes)
     
-    print("Chunks generated from file", len(chunks))
+    deleted_count = 0
+    if stored_rows is None or stored_columns is None:
+        # Full rebuild: delete existing vectors for this file (if updating)
+        for h in file_hashes:
+            deleted_count += delete_file_vectors(index_name, h)
+            deleted_count += delete_file_vectors(columns_index, h)
+        stored_rows, stored_columns = {}, {}
     
-    # texts = [chunk['text'] for chunk in chunks]
-    # embedding = generate_embeddings(texts)
-    # print("Embedding generated", len(embedding))
+    # Large files are streamed in blocks of rows
+    if should_stream(file_size) and file_extension in ['.xlsx', '.csv']:
+        if file_extension == '.csv':
+            table = stream_csv_file(source, file_name, file_hash, primary_column)
+        else:
+            table = stream_xlsx_file(source, file_name, file_hash, primary_column)
+        column_chunks = table.column_chunks()
+        chunks = table.row_chunks()
+        file_type = table.metadata["pc_file_type"]
+        total_chunks, total_rows = table.total_chunks, table.total_rows
+        print(f"Streaming {total_chunks} chunks from {total_rows} rows")
+    else:
+        if file_extension in ['.xlsx', '.xls']:
+            chunks, column_chunks = load_xlsx_file(source, file_name, file_hash, primary_column)
+        else:
+            chunks, column_chunks = load_csv_file(source, file_name, file_hash, primary_column)
+        file_type = chunks[0]["metadata"]["pc_file_type"] if chunks else "unknown"
+        total_chunks = len(chunks)
+        total_rows = chunks[0]["metadata"]["pc_total_rows"] if chunks else 0
+        print("Chunks generated from file", total_chunks)
     
-    # texts = [chunk['text'] for chunk in chunks]
-
-    # Split texts into batches under token limit
-    batches_chuncks, batches = split_texts_into_batches(chunks)
-    column_batches_chuncks, column_batches = split_texts_into_batches(column_chunks)
-    print("-------> Start Generating Embeddings and stor: ", len(column_batches))
-    for i, batch in enumerate(column_batches):
-        for start in range(0, len(batch), 2000):
-            end = start + 2000
-            batch_slice = batch[start:end]
-            print("-------> Generating Embeddings: ", i, start, end)
-            embeddings = generate_embeddings(batch_slice)  # your function calling OpenAI
-            store_vectors_in_chroma(f'{index_name}-columns', column_batches_chuncks[i][start:end], embeddings)    
+    if not total_chunks:
+        raise Exception("No chunks generated from file")
     
-    print("-------> Start Generating Embeddings and stor: ", len(batches))
-    all_embeddings = []
-    for i, batch in enumerate(batches):
-        print("-------> Generating Embeddings: ", i)
-        embeddings = generate_embeddings(batch)  # your function calling OpenAI
-        store_vectors_in_chroma(index_name, batches_chuncks[i], embeddings)
-        all_embeddings.extend(embeddings)
+    # Only inserted and changed rows reach the embedding pipeline
+    row_sync = IncrementalSync(index_name, stored_rows)
+    column_sync = IncrementalSync(columns_index, stored_columns)
     
+    # Embed rows and column values concurrently; finished batches are written to Chroma
+    # while the next embedding requests are still in flight
+    pipeline_stats = run_embedding_pipeline([
+        (columns_index, column_sync.filter(assign_row_keys(column_chunks))),
+        (index_name, row_sync.filter(assign_row_keys(chunks, primary_column.lower()))),
+    ])
+    print("-------> Embedding pipeline: ", pipeline_stats)
     
-    # Add company_id to metadata
-    # for chunk in chunks:
-    #     chunk["metadata"]["company_id"] = company_id
-    # print("-------> Start Generating Embeddings and stor: ", len(chunks))
-    # # Generate embeddings
-    # for i, chunk in enumerate(chunks):
-    #     print("-------> Generating Embeddings: ", i)
-    #     text = chunk['text']
-    #     print(type(text))
-        
-    #     print(type(embedding))
-    #     # Store vectors in Pinecone
-    #     
-    #     print("-------> Stored chunk: ", i)    
-    # print("-------> End Generating Embeddings and storing in Pinecone: ", len(chunks)) 
+    # Drop the vectors of changed and removed rows now that the new ones are stored
+    row_changes = row_sync.finish()
+    column_changes = column_sync.finish()
+    deleted_count += row_changes["deleted_vectors"] + column_changes["deleted_vectors"]
+    print("-------> Row changes: ", row_changes)
+    invalidate_column_filters(index_name, rebuild=True)
+    rebuild_product_table(index_name)
     print("Finished")  
     return {
         "status": "success",
         "file_name": file_name,
         "file_hash": file_hash,
-        "file_type": chunks[0]["metadata"]["pc_file_type"] if chunks else "unknown",
-        "total_chunks": len(chunks),
-        "total_rows": chunks[0]["metadata"]["pc_total_rows"] if chunks else 0,
+        "file_type": file_type,
+        "total_chunks": total_chunks,
+        "total_rows": total_rows,
         "deleted_previous_vectors": deleted_count,
-        "message": f"Successfully vectorized {len(chunks)} chunks from {chunks[0]['metadata']['pc_file_type']} file"
-    }
\ No newline at end of file
+        "rows_added": row_changes["added"],
+        "rows_changed": row_changes["changed"],
+        "rows_removed": row_changes["removed"],
+        "rows_unchanged": row_changes["unchanged"],
+        "column_changes": column_changes,
+        "embedding_stats": pipeline_stats,
+        "message": f"Successfully vectorized {total_chunks} chunks from {file_type} file"
+    }
@@ -6,7 +6,7 @@ from utils.whatsapp import send_message_whatsapp
 from utils.waca import send_text_message_by_waca, send_image_message_by_waca
 from utils.send_email_without_smtp import send_email_with_customize_content
 from langchain_core.runnables.history import RunnableWithMessageHistory
-import datetime, json, time, os
+import datetime, json, time, os, asyncio
 
 image_extensions = {'xbm', 'tif', 'jfif', 'pjp', 'apng', 'jpeg', 'heif', 'ico', 'tiff', 'webp', 'svgz', 'jpg', 'heic', 'gif', 'svg', 'png', 'bmp', 'pjpeg', 'avif'}
 
@@ -142,7 +142,7 @@ async def action_workflow_function(
 ):
     # Get integration details based on platform
     if platform == "WACA":
-        integration = get_integration_by_phone_number_id(instance_name)
+        integration = await asyncio.to_thread(get_integration_by_phone_number_id, instance_name)
         api_key = integration.get("instance_name", None)
         phone_number_id = instance_name
     else:
@@ -160,7 +160,7 @@ async def action_workflow_function(
         elif block["key"] == "send_message":
             content = block["settings"]["value_0"]
             extra_attachment = block["settings"].get("value_1", "")
-            extra_files = get_workflow_attachment(extra_attachment, company_id, workflow_id)
+            extra_files = await asyncio.to_thread(get_workflow_attachment, extra_attachment, company_id, workflow_id)
             final_response.append([content, extra_files])
         elif block["key"] == "book_meeting":
             content = f'Please book a meeting on this: {block["settings"]["value"]}'
@@ -169,7 +169,7 @@ async def action_workflow_function(
             receiver_email = block["settings"]["value_0"]
             content = block["settings"]["value_1"]
             extra_attachment = block["settings"].get("value_2", "")
-            extra_files = get_workflow_attachment(extra_attachment, company_id, workflow_id)
-            if not send_email_with_customize_content(receiver_email, content, extra_files):
+            extra_files = await asyncio.to_thread(get_workflow_attachment, extra_attachment, company_id, workflow_id)
+            if not await asyncio.to_thread(send_email_with_customize_content, receiver_email, content, extra_files):
                 return False
     return final_response
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""
+Per-conversation mailbox in front of the job queue.
+
+Customers often send several short messages in a row. Without a mailbox,
+every message starts its own agent run on the same conversation. The runs
+race on shared per-conversation state, and all but the last answer are
+usually wasted.
+
+The mailbox gives every conversation at most one AI turn in flight:
+
+- Messages that arrive within MAILBOX_DEBOUNCE_SECONDS of each other are
+  coalesced into one turn, with their texts joined by newlines. Waiting
+  never exceeds MAILBOX_MAX_WAIT_SECONDS after the first message.
+- Messages that arrive while a turn is running wait for it to finish and
+  are answered together in the next turn.
+- Items posted with coalesce=False (for example image replies) are still
+  serialized but always run as their own turn.
+
+Setting MAILBOX_DEBOUNCE_SECONDS=0 keeps the serialization but stops
+waiting for more messages.
+
+Pending messages live in process memory until their turn is submitted. Messages
+still in the debounce window, or waiting behind a running turn, are lost on
+restart, even when the job queue itself uses a durable store. A turn that cannot
+be submitted (queue full, store error, unknown job) is dropped and counted, and
+the conversation is released.
+"""
+import os
+import time
+import heapq
+import inspect
+import threading
+from dotenv import load_dotenv
+from utils.job_queue import job_queue
+
+load_dotenv()
+
+MAILBOX_DEBOUNCE_SECONDS = float(os.getenv("MAILBOX_DEBOUNCE_SECONDS", "2"))
+MAILBOX_MAX_WAIT_SECONDS = float(os.getenv("MAILBOX_MAX_WAIT_SECONDS", "6"))
+MAILBOX_MAX_PENDING = int(os.getenv("MAILBOX_MAX_PENDING", "50"))
+
+
+class ConversationMailbox:
+    """Serializes AI turns per conversation and coalesces rapid messages"""
+
+    def __init__(
+        self,
+        debounce: float = MAILBOX_DEBOUNCE_SECONDS,
+        max_wait: float = MAILBOX_MAX_WAIT_SECONDS,
+        max_pending: int = MAILBOX_MAX_PENDING,
+        queue=job_queue,
+    ):
+        self.debounce = max(0.0, debounce)
+        self.max_wait = max(self.debounce, max_wait)
+        self.max_pending = max_pending
+        self.queue = queue
+        self._boxes = {}  # conversation_id -> {"items", "busy", "first_at", "due"}
+        self._timers = []  # heap of (due, conversation_id)
+        self._cond = threading.Condition()
+        self._scheduler = None
+        self._counters = {"posted": 0, "turns": 0, "coalesced": 0, "rejected": 0, "dropped": 0}
+        queue.register("mailbox.turn", self._run_turn)
+
+    # ---------------------------
+    # Posting
+    # ---------------------------
+
+    def post(self, conversation_id: str, tenant: str, job_name: str, query: str, coalesce: bool = True, **payload):
+        """
+        Add a message to a conversation's mailbox.
+
+        Args:
+            conversation_id: Conversation the reply belongs to
+            tenant: Company id, used for fairness in the job queue
+            job_name: Registered job handler that produces the reply
+            query: Customer message text
+            coalesce: Whether the message may be merged with its neighbours
+            **payload: Remaining keyword arguments for the job handler
+
+        Returns:
+            True if accepted, False if the conversation already has too many pending messages.
+        """
+        conversation_id = str(conversation_id)
+        now = time.monotonic()
+        item = {"tenant": str(tenant), "job": job_name, "query": query, "coalesce": coalesce, "payload": payload}
+        with self._cond:
+            box = self._boxes.setdefault(conversation_id, {"items": [], "busy": False, "first_at": None, "due": None})
+            if len(box["items"]) >= self.max_pending:
+                self._counters["rejected"] += 1
+                return False
+            box["items"].append(item)
+            self._counters["posted"] += 1
+            if box["first_at"] is None:
+                box["first_at"] = now
+            if not box["busy"]:
+                # Debounce: push the flush back on every message, up to max_wait after the first one
+                self._schedule(conversation_id, box, min(now + self.debounce, box["first_at"] + self.max_wait))
+        return True
+
+    def has_room(self, conversation_id: str) -> bool:
+        """Whether post() would currently accept a message for the conversation"""
+        with self._cond:
+            box = self._boxes.get(str(conversation_id))
+            return box is None or len(box["items"]) < self.max_pending
+
+    def _schedule(self, conversation_id: str, box: dict, due: float):
+        # Caller holds self._cond
+        box["due"] = due
+        heapq.heappush(self._timers, (due, conversation_id))
+        if self._scheduler is None:
+            self._scheduler = threading.Thread(target=self._scheduler_loop, name="mailbox-scheduler", daemon=True)
+            self._scheduler.start()
+        self._cond.notify_all()
+
+    # ---------------------------
+    # Flushing
+    # ---------------------------
+
+    def _scheduler_loop(self):
+        while True:
+            with self._cond:
+                while not self._timers:
+                    self._cond.wait()
+                due, conversation_id = self._timers[0]
+                now = time.monotonic()
+                if due > now:
+                    self._cond.wait(timeout=due - now)
+                    continue
+                heapq.heappop(self._timers)
+                box = self._boxes.get(conversation_id)
+                # Skip timers that were superseded by a later debounce
+                if not box or box["busy"] or box["due"] != due or not box["items"]:
+                    continue
+                turn = self._take_turn(box)
+                box["busy"] = True
+                box["due"] = None
+            self._submit(conversation_id, turn)
+
+    def _take_turn(self, box: dict):
+        # Caller holds self._cond. Take the leading run of items that can share one turn.
+        items = box["items"]
+        first = items[0]
+        count = 1
+        if first["coalesce"]:
+            while (
+                count < len(items)
+                and items[count]["coalesce"]
+                and items[count]["job"] == first["job"]
+                and items[count]["payload"] == first["payload"]
+            ):
+                count += 1
+        taken, box["items"] = items[:count], items[count:]
+        box["first_at"] = time.monotonic() if box["items"] else None
+        self._counters["turns"] += 1
+        self._counters["coalesced"] += count - 1
+        return {
+            "tenant": first["tenant"],
+            "job": first["job"],
+            "query": "\n".join(item["query"] for item in taken if item["query"]),
+            "payload": first["payload"],
+        }
+
+    def _submit(self, conversation_id: str, turn: dict):
+        # Runs on the scheduler thread, which must survive any failure of a single turn
+        try:
+            job_id = self.queue.submit(
+                "mailbox.turn", turn["tenant"],
+                conversation_id=conversation_id, job=turn["job"], query=turn["query"], payload=turn["payload"]
+            )
+            if not job_id:
+                print(f"Job queue full, dropping AI turn for conversation {conversation_id}")
+        except Exception as e:
+            print(f"Failed to submit AI turn for conversation {conversation_id}: {str(e)}")
+            job_id = None
+        if not job_id:
+            with self._cond:
+                self._counters["dropped"] += 1
+            self._finish(conversation_id)
+
+    async def _run_turn(self, conversation_id: str, job: str, query: str, payload: dict):
+        """Job handler: run the wrapped reply job, then release the conversation"""
+        try:
+            result = self.queue.get_handler(job)(conversation_id=conversation_id, query=query, **payload)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        finally:
+            self._finish(conversation_id)
+
+    def _finish(self, conversation_id: str):
+        with self._cond:
+            box = self._boxes.get(conversation_id)
+            if box is None:
+                return
+            box["busy"] = False
+            if box["items"]:
+                # Messages that arrived during the turn are answered right away
+                self._schedule(conversation_id, box, time.monotonic())
+            else:
+                del self._boxes[conversation_id]
+
+    # ---------------------------
+    # Metrics
+    # ---------------------------
+
+    def stats(self):
+        with self._cond:
+            return {
+                "debounce_seconds": self.debounce,
+                "max_wait_seconds": self.max_wait,
+                "conversations": len(self._boxes),
+                "busy": sum(1 for box in self._boxes.values() if box["busy"]),
+                "pending": sum(len(box["items"]) for box in self._boxes.values()),
+                **self._counters,
+            }
+
+
+mailbox = ConversationMailbox()
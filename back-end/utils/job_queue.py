@@ -0,0 +1,345 @@
+"""
+Bounded background job queue for AI replies and webhook processing.
+
+Routes used to start one daemon thread (and one event loop) per incoming
+message. Jobs now go through a fixed pool of worker threads instead:
+
+- JOB_QUEUE_WORKERS threads each run one long-lived event loop, and each
+  loop runs up to JOB_QUEUE_CONCURRENCY jobs at once, so at most
+  WORKERS x CONCURRENCY jobs (and LLM calls) are in flight.
+- JOB_QUEUE_MAX_SIZE / JOB_QUEUE_MAX_PER_TENANT bound how much can wait;
+  submit() returns None when a job is rejected so the caller can push back.
+- Tenants are served round-robin, so one busy company cannot starve the rest.
+- JOB_QUEUE_BACKEND=sqlite keeps queued jobs in a local SQLite file
+  (JOB_QUEUE_SQLITE_PATH) so they are picked up again after a restart.
+
+Coroutine handlers are scheduled as tasks on their worker's loop, so one
+thread interleaves many replies while they wait on the LLM. They must not
+use the async database engine, which belongs to the server loop: database
+work goes through the sync helpers (db.company_table, db.public_table),
+ideally via asyncio.to_thread so it does not stall the other jobs on the
+loop. Sync handlers run on the loop's default thread pool.
+
+Handlers are registered by name and receive the JSON-serializable payload
+passed to submit() as keyword arguments.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import inspect
+import threading
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOB_QUEUE_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "4"))
+JOB_QUEUE_CONCURRENCY = int(os.getenv("JOB_QUEUE_CONCURRENCY", "8"))
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "1000"))
+JOB_QUEUE_MAX_PER_TENANT = int(os.getenv("JOB_QUEUE_MAX_PER_TENANT", "200"))
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory").lower()
+JOB_QUEUE_SQLITE_PATH = os.getenv("JOB_QUEUE_SQLITE_PATH", "./job_queue.db")
+JOB_QUEUE_DRAIN_TIMEOUT = float(os.getenv("JOB_QUEUE_DRAIN_TIMEOUT", "30"))
+JOB_QUEUE_MAX_ATTEMPTS = int(os.getenv("JOB_QUEUE_MAX_ATTEMPTS", "3"))
+
+
+# ==================== DURABLE STORE ====================
+
+class SQLiteJobStore:
+    """Keeps queued and running jobs in a local SQLite table until they finish"""
+
+    def __init__(self, path: str = JOB_QUEUE_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                tenant TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+
+    def add(self, job: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, name, tenant, payload, status, attempts, created_at) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job["id"], job["name"], job["tenant"], json.dumps(job["payload"]), job["attempts"], job["enqueued_at"]),
+            )
+
+    def mark_running(self, job_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1 WHERE id = ?", (job_id,))
+
+    def remove(self, job_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def load_pending(self):
+        """Return jobs left over from a previous run, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, name, tenant, payload, attempts, created_at FROM jobs ORDER BY created_at"
+            ).fetchall()
+        return [
+            {
+                "id": row[0],
+                "name": row[1],
+                "tenant": row[2],
+                "payload": json.loads(row[3]),
+                "attempts": row[4],
+                "enqueued_at": row[5],
+            }
+            for row in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ==================== QUEUE ====================
+
+class JobQueue:
+    """Fixed-size pool of event-loop workers with bounded, per-tenant round-robin queues"""
+
+    def __init__(
+        self,
+        workers: int = JOB_QUEUE_WORKERS,
+        concurrency: int = JOB_QUEUE_CONCURRENCY,
+        max_size: int = JOB_QUEUE_MAX_SIZE,
+        max_per_tenant: int = JOB_QUEUE_MAX_PER_TENANT,
+        store: SQLiteJobStore = None,
+    ):
+        self.workers = max(1, workers)
+        self.concurrency = max(1, concurrency)
+        self.max_size = max_size
+        self.max_per_tenant = max_per_tenant
+        self.store = store
+        self._handlers = {}
+        self._tenants = OrderedDict()  # tenant -> deque of jobs, in round-robin order
+        self._depth = 0
+        self._running = 0
+        self._threads = []
+        self._cond = threading.Condition()
+        self._accepting = False
+        self._stopping = False
+        self._counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "recovered": 0,
+            "wait_time_seconds": 0.0,
+            "run_time_seconds": 0.0,
+            "max_depth": 0,
+        }
+
+    def register(self, name: str, func):
+        """Register a sync or async handler under a job name"""
+        self._handlers[name] = func
+
+    def get_handler(self, name: str):
+        """Return the handler registered under a job name"""
+        if name not in self._handlers:
+            raise ValueError(f"No handler registered for job '{name}'")
+        return self._handlers[name]
+
+    # ---------------------------
+    # Lifecycle
+    # ---------------------------
+
+    def start(self):
+        """Start the worker threads and re-queue jobs left in the durable store"""
+        with self._cond:
+            if self._threads:
+                return
+            self._accepting = True
+            self._stopping = False
+
+        if self.store is not None:
+            for job in self.store.load_pending():
+                if job["attempts"] >= JOB_QUEUE_MAX_ATTEMPTS:
+                    print(f"Dropping job {job['id']} ({job['name']}) after {job['attempts']} attempts")
+                    self.store.remove(job["id"])
+                    continue
+                with self._cond:
+                    self._push(job)
+                    self._counters["recovered"] += 1
+            if self._counters["recovered"]:
+                print(f"Recovered {self._counters['recovered']} queued jobs")
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def shutdown(self, timeout: float = JOB_QUEUE_DRAIN_TIMEOUT):
+        """
+        Stop accepting jobs and wait up to `timeout` seconds for queued and
+        running jobs to finish. Jobs still queued after that stay in the
+        durable store (if any) and run on the next start.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._accepting = False
+            while (self._depth or self._running) and time.monotonic() < deadline:
+                self._cond.wait(timeout=max(0.0, deadline - time.monotonic()))
+            left = self._depth
+            self._stopping = True
+            self._cond.notify_all()
+
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        busy = [thread for thread in self._threads if thread.is_alive()]
+        self._threads = []
+
+        if left:
+            where = "kept in the durable store" if self.store is not None else "dropped"
+            print(f"Job queue stopped with {left} queued jobs ({where})")
+        # A job that outlived the deadline still needs the store to record its end
+        if self.store is not None and not busy:
+            self.store.close()
+
+    # ---------------------------
+    # Submitting
+    # ---------------------------
+
+    def submit(self, name: str, tenant: str, **payload):
+        """
+        Queue a job for `tenant`.
+
+        Returns:
+            The job id, or None if the queue (or the tenant's share of it) is
+            full or the queue is shutting down.
+        """
+        if name not in self._handlers:
+            raise ValueError(f"No handler registered for job '{name}'")
+        if not self._threads and not self._stopping:
+            self.start()
+
+        tenant = str(tenant)
+        job = {
+            "id": uuid.uuid4().hex,
+            "name": name,
+            "tenant": tenant,
+            "payload": payload,
+            "attempts": 0,
+            "enqueued_at": time.time(),
+        }
+        with self._cond:
+            pending = len(self._tenants.get(tenant, ()))
+            if not self._accepting or self._depth >= self.max_size or pending >= self.max_per_tenant:
+                self._counters["rejected"] += 1
+                return None
+            if self.store is not None:
+                self.store.add(job)
+            self._push(job)
+            self._counters["submitted"] += 1
+        return job["id"]
+
+    def _push(self, job: dict):
+        # Caller holds self._cond
+        self._tenants.setdefault(job["tenant"], deque()).append(job)
+        self._depth += 1
+        self._counters["max_depth"] = max(self._counters["max_depth"], self._depth)
+        self._cond.notify_all()
+
+    def _next_job(self):
+        with self._cond:
+            while not self._stopping and not self._tenants:
+                self._cond.wait()
+            if self._stopping:
+                return None
+            # Take one job from the tenant at the head, then move it to the back
+            tenant, jobs = self._tenants.popitem(last=False)
+            job = jobs.popleft()
+            if jobs:
+                self._tenants[tenant] = jobs
+            self._depth -= 1
+            self._running += 1
+            self._counters["wait_time_seconds"] += max(0.0, time.time() - job["enqueued_at"])
+            return job
+
+    # ---------------------------
+    # Workers
+    # ---------------------------
+
+    def _worker(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        # Take a job only when a slot is free, so queued jobs stay visible to idle workers
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        while True:
+            await slots.acquire()
+            job = await asyncio.to_thread(self._next_job)
+            if job is None:
+                break
+            task = asyncio.create_task(self._run(job, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, job: dict, slots: asyncio.Semaphore):
+        started = time.monotonic()
+        ok = False
+        try:
+            if self.store is not None:
+                self.store.mark_running(job["id"])
+            handler = self.get_handler(job["name"])
+            if inspect.iscoroutinefunction(handler):
+                result = handler(**job["payload"])
+            else:
+                result = await asyncio.to_thread(handler, **job["payload"])
+            if inspect.isawaitable(result):
+                await result
+            ok = True
+        except Exception as e:
+            print(f"Job {job['name']} failed for tenant {job['tenant']}: {e}")
+        finally:
+            slots.release()
+            if self.store is not None:
+                self.store.remove(job["id"])
+            with self._cond:
+                self._running -= 1
+                self._counters["completed" if ok else "failed"] += 1
+                self._counters["run_time_seconds"] += time.monotonic() - started
+                self._cond.notify_all()
+
+    # ---------------------------
+    # Metrics
+    # ---------------------------
+
+    def stats(self):
+        with self._cond:
+            counters = dict(self._counters)
+            counters["wait_time_seconds"] = round(counters["wait_time_seconds"], 3)
+            counters["run_time_seconds"] = round(counters["run_time_seconds"], 3)
+            return {
+                "backend": "sqlite" if self.store is not None else "memory",
+                "workers": self.workers,
+                "concurrency": self.concurrency,
+                "max_size": self.max_size,
+                "max_per_tenant": self.max_per_tenant,
+                "accepting": self._accepting,
+                "depth": self._depth,
+                "running": self._running,
+                "tenants": {tenant: len(jobs) for tenant, jobs in self._tenants.items()},
+                **counters,
+            }
+
+
+job_queue = JobQueue(store=SQLiteJobStore() if JOB_QUEUE_BACKEND == "sqlite" else None)
@@ -4,24 +4,43 @@ import os
 import warnings
 warnings.filterwarnings("ignore", module="codecarbon")
 os.makedirs("logs", exist_ok=True)
-tracker = OfflineEmissionsTracker(
-    project_name="chatservice-conversation",
-    country_iso_code="USA",
-    output_dir="logs",
-    tracking_mode="process",
-    gpu_ids=None,  # disables GPU lookup
-    log_level="error"  # hide warnings
-)
 
-# tracker.start()
+
+def start_tracker() -> OfflineEmissionsTracker:
+    """
+    Start an emissions tracker for one reply.
+
+    Replies run concurrently on the job queue, so each one gets its own
+    tracker; a shared one would be stopped by whichever reply finished first.
+    Tracking is per process, so the figures also include the other replies
+    running at the same time.
+    """
+    tracker = OfflineEmissionsTracker(
+        project_name="chatservice-conversation",
+        country_iso_code="USA",
+        output_dir="logs",
+        tracking_mode="process",
+        gpu_ids=None,  # disables GPU lookup
+        log_level="error",  # hide warnings
+        allow_multiple_runs=True,
+    )
+    tracker.start()
+    return tracker
+
+
+def stop_tracker(tracker: OfflineEmissionsTracker):
+    """Stop a tracker from start_tracker; returns (emissions_kg, energy_kwh)"""
+    emissions_kg = tracker.stop()
+    return emissions_kg, tracker.final_emissions_data.energy_consumed
+
+# tracker = start_tracker()
 
 # # Simulate a small workload
 # for _ in range(5_000_000):
 #     _ = 123 * 456
 # time.sleep(1)
 
-# emissions_kg = tracker.stop()
-# energy_kwh = tracker.final_emissions_data.energy_consumed
+# emissions_kg, energy_kwh = stop_tracker(tracker)
 
 # print(f"Energy consumed: {energy_kwh} kWh")
 # print(f"Carbon emissions: {emissions_kg:.9f} kg CO₂eq")
\ No newline at end of file